@@ -0,0 +1,113 @@
+"""
+Benchmark catalog persistence for search results.
+
+Inserts thousands of synthetic shopping results, first with one
+add/commit/refresh per product (the old search_google_shopping path), then
+with the batched persistence stage (multi-row INSERT ... RETURNING).
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_bulk_insert [--rows 5000] [--database-url URL]
+
+Defaults to a temporary SQLite file. Point --database-url at a scratch
+PostgreSQL database to measure real round trips; its tables are dropped.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+try:
+    from backend.database import Base
+    from backend.models import Product, User
+    from backend.search_products import CATALOG_FIELDS, persist_search_results
+except ImportError:
+    from database import Base
+    from models import Product, User
+    from search_products import CATALOG_FIELDS, persist_search_results
+
+
+def synthetic_products(count: int, prefix: str):
+    """Build parsed search results shaped like search_google_shopping output."""
+    return [
+        {
+            "product_id": f"{prefix}{i}",
+            "db_product_id": None,
+            "title": f"Synthetic product {i}",
+            "price": f"£{i % 200}.99",
+            "extracted_price": i % 200 + 0.99,
+            "old_price": None,
+            "product_link": f"https://example.com/products/{prefix}{i}",
+            "thumbnail": f"https://example.com/images/{prefix}{i}.jpg",
+            "local_image": None,
+            "source": "Example Store",
+            "source_icon": None,
+            "rating": 4.5,
+            "reviews": i,
+            "snippet": "Synthetic result",
+            "delivery": "Free delivery",
+            "tag": None,
+            "product_type": "tops",
+        }
+        for i in range(count)
+    ]
+
+
+def insert_per_row(db, products):
+    """The original path: add, commit and refresh for every product."""
+    for product in products:
+        db_product = Product(product_id=product["product_id"], **{f: product[f] for f in CATALOG_FIELDS})
+        db.add(db_product)
+        db.commit()
+        db.refresh(db_product)
+        product["db_product_id"] = db_product.id
+
+
+def insert_bulk(db, products, user_id):
+    persist_search_results(db, products, [p["product_id"] for p in products], "benchmark", user_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    database_url = args.database_url or f"sqlite:///{os.path.join(tmp_dir.name, 'bench.db')}"
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    db = Session()
+    user = User(user_folder="user_bench")
+    db.add(user)
+    db.commit()
+
+    print(f"{args.rows} rows on {engine.dialect.name}")
+    results = {}
+    for name, run in (
+        ("per-row commit", lambda products: insert_per_row(db, products)),
+        ("bulk insert", lambda products: insert_bulk(db, products, user.id)),
+        ("bulk upsert (existing)", lambda products: insert_bulk(db, products, user.id)),
+    ):
+        prefix = "row" if name == "per-row commit" else "bulk"
+        products = synthetic_products(args.rows, prefix)
+        start = time.perf_counter()
+        run(products)
+        elapsed = time.perf_counter() - start
+        assert all(p["db_product_id"] for p in products)
+        results[name] = elapsed
+        print(f"{name:<24} {elapsed:8.3f}s  {args.rows / elapsed:10.0f} rows/s")
+
+    print(f"speedup: {results['per-row commit'] / results['bulk insert']:.1f}x")
+    db.close()
+    Base.metadata.drop_all(engine)
+    tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark product image downloads against a local HTTP server stand-in.
+
+The server serves generated JPEG/PNG thumbnails after a configurable delay,
+and returns 404 for /missing/ paths so per-item failure reporting can be seen.
+Compares one-at-a-time download_image calls with the parallel downloader.
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_downloads [--images 10] [--delay 0.3] [--failures 1]
+"""
+
+import argparse
+import io
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from PIL import Image
+
+try:
+    from backend.image_downloader import download_images
+    from backend.search_products import download_image
+except ImportError:
+    from image_downloader import download_images
+    from search_products import download_image
+
+
+def _make_image(fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "PNG":
+        Image.new("RGBA", (1200, 1500), (30, 120, 200, 180)).save(buffer, "PNG")
+    else:
+        Image.new("RGB", (1200, 1500), (200, 120, 30)).save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+class ImageServer(ThreadingHTTPServer):
+    """Threaded HTTP server serving images with an artificial delay."""
+
+    daemon_threads = True
+
+    def __init__(self, delay: float):
+        super().__init__(("127.0.0.1", 0), ImageRequestHandler)
+        self.delay = delay
+        self.images = {"jpg": _make_image("JPEG"), "png": _make_image("PNG")}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Allow keep-alive
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        if self.path.startswith("/missing/"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        ext = "png" if self.path.endswith(".png") else "jpg"
+        body = self.server.images[ext]
+        self.send_response(200)
+        self.send_header("Content-Type", f"image/{'png' if ext == 'png' else 'jpeg'}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.3, help="Server delay per request (seconds)")
+    parser.add_argument("--failures", type=int, default=1, help="How many URLs should 404")
+    args = parser.parse_args()
+
+    server = ImageServer(args.delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    urls = [
+        f"{server.base_url}/{'missing' if i < args.failures else 'img'}/{i}.{'png' if i % 2 else 'jpg'}"
+        for i in range(args.images)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        print(f"{args.images} images, {args.delay}s server delay, {args.failures} failing")
+
+        start = time.perf_counter()
+        sequential_ok = sum(
+            download_image(url, tmp_path / f"seq_{i}.jpg") for i, url in enumerate(urls)
+        )
+        sequential = time.perf_counter() - start
+        print(f"sequential: {sequential:.2f}s  ok={sequential_ok}")
+
+        start = time.perf_counter()
+        results = download_images([(url, tmp_path / f"par_{i}.jpg") for i, url in enumerate(urls)])
+        parallel = time.perf_counter() - start
+        print(f"parallel:   {parallel:.2f}s  ok={sum(r['ok'] for r in results)}")
+        for result in results:
+            if not result["ok"]:
+                print(f"   failed: {result['url']} ({result['error']})")
+
+    print(f"speedup: {sequential / parallel:.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark try-on generation against a fake GenAI client with injected latency.
+
+Compares sequential generation (one call in flight) with the concurrent engine
+for 5 products x 3 angles. Sequential wall time is about sum(latencies); with
+enough in-flight slots it drops to about max(latencies).
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_generation [--latency 0.5] [--products 5]
+"""
+
+import argparse
+import io
+import random
+import tempfile
+import time
+from pathlib import Path
+from PIL import Image
+
+try:
+    from backend.generation_engine import GenerationEngine
+    from backend.generate_images import generate_combined_images_for_all_products
+except ImportError:
+    from generation_engine import GenerationEngine
+    from generate_images import generate_combined_images_for_all_products
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeModels:
+    """Stands in for client.models, sleeping to simulate model latency."""
+
+    def __init__(self, latency: float, jitter: float, failure_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        buffer = io.BytesIO()
+        Image.new("RGB", (896, 1600), (120, 80, 200)).save(buffer, "JPEG")
+        self.image_bytes = buffer.getvalue()
+
+    def generate_content(self, model, contents):
+        time.sleep(self.latency + random.random() * self.jitter)
+        if random.random() < self.failure_rate:
+            error = RuntimeError("503 UNAVAILABLE (injected)")
+            error.code = 503
+            raise error
+        part = _Obj(text=None, inline_data=_Obj(data=self.image_bytes))
+        return _Obj(candidates=[_Obj(content=_Obj(parts=[part]))])
+
+
+class FakeClient:
+    def __init__(self, latency: float, jitter: float, failure_rate: float = 0.0):
+        self.models = FakeModels(latency, jitter, failure_rate)
+
+
+def make_user_folder(root: Path, num_products: int) -> Path:
+    """Create a user folder with angle photos and product images."""
+    user_path = root / "user_bench"
+    images_dir = user_path / "products" / "product_images"
+    images_dir.mkdir(parents=True)
+    for angle in ["front", "side", "back"]:
+        Image.new("RGB", (768, 1024), (200, 180, 160)).save(user_path / f"{angle}.jpg", "JPEG")
+    for i in range(1, num_products + 1):
+        Image.new("RGB", (512, 512), (i * 40 % 255, 90, 60)).save(images_dir / f"product_{i}_item.jpg", "JPEG")
+    return user_path
+
+
+def run(max_in_flight: int, user_path: Path, latency: float, jitter: float, failure_rate: float) -> float:
+    engine = GenerationEngine(
+        FakeClient(latency, jitter, failure_rate),
+        api_key=f"bench-{max_in_flight}",
+        max_in_flight=max_in_flight,
+        requests_per_minute=0,
+        backoff_seconds=0.05
+    )
+    start = time.perf_counter()
+    results = generate_combined_images_for_all_products(str(user_path), generation_engine=engine)
+    elapsed = time.perf_counter() - start
+    generated = sum(1 for angles in results.values() for path in angles.values() if path)
+    print(f"max_in_flight={max_in_flight:<3} generated={generated:<3} wall={elapsed:.2f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="Base latency per model call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random extra latency per call (seconds)")
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of calls failing with a transient 503")
+    args = parser.parse_args()
+
+    calls = args.products * 3
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = make_user_folder(Path(tmp), args.products)
+        print(f"{calls} calls, latency {args.latency}s + up to {args.jitter}s jitter")
+        sequential = run(1, user_path, args.latency, args.jitter, args.failure_rate)
+        concurrent = run(calls, user_path, args.latency, args.jitter, args.failure_rate)
+    print(f"speedup: {sequential / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
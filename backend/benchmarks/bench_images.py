@@ -0,0 +1,304 @@
+"""
+Benchmark suite for the Pillow hot paths: upload compression (compress_image),
+product image compression (compress_image_bytes, the Pillow half of
+download_image) and try-on resizing (resize_to_9_16).
+
+Each case runs one function on one synthetic fixture (phone photos, PNGs
+with alpha, palette images, a huge panorama, model outputs) in its own
+subprocess, so peak RSS is measured per case. Cases run --rounds times (in
+fresh subprocesses) and the round with the median relative cost is reported:
+
+    throughput   calls/s and input megapixels/s of the fastest of repeated calls
+                 (the least noisy estimate on a shared machine)
+    peak RSS     high-water mark of the process during the first call, minus
+                 its RSS before the call (memory the function needed)
+    output       bytes written (for resize_to_9_16: the JPEG generate_images saves)
+
+Each call is paired with a fixed reference workload (a Pillow resize and
+JPEG encode), and time is compared with the baselines as a multiple of the
+reference ("relative cost"), which cancels out most CPU throttling and
+machine-to-machine differences.
+
+Results are compared with baselines.json (next to this file). Fixtures are
+deterministic, so output bytes should match exactly. RSS and relative cost
+still vary somewhat between machines, so regenerate the baselines on the
+machine you compare on (--update-baselines) before making a change, then
+rerun with --check.
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_images [--case compress_image] [--rounds 3] [--check] [--update-baselines]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from PIL import Image, ImageDraw
+
+BASELINES_PATH = Path(__file__).with_name("baselines.json")
+
+# Allowed regression before --check fails
+TIME_TOLERANCE = 0.30  # Fraction more relative cost
+RSS_TOLERANCE = 0.20  # Fraction more memory (and at least RSS_SLACK_MB)
+RSS_SLACK_MB = 4.0
+OUTPUT_TOLERANCE = 0.02  # Fraction more output bytes
+
+MIN_SECONDS = 1.0  # Keep calling until this much time has passed...
+MIN_CALLS = 3  # ...and at least this many calls were timed
+MAX_CALLS = 50
+
+# Fixture name -> (width, height, mode, format)
+FIXTURES = {
+    "phone_photo": (4032, 3024, "RGB", "JPEG"),
+    "product_thumbnail": (800, 800, "RGB", "JPEG"),
+    "alpha_png": (1200, 1600, "RGBA", "PNG"),
+    "palette_png": (1000, 1000, "P", "PNG"),
+    "panorama": (12000, 2000, "RGB", "JPEG"),
+    "model_output": (768, 1344, "RGB", "PNG"),
+    "square_output": (1024, 1024, "RGB", "PNG"),
+}
+
+# Case name -> (function, fixture)
+CASES = {
+    "compress_image[phone_photo]": ("compress_image", "phone_photo"),
+    "compress_image[alpha_png]": ("compress_image", "alpha_png"),
+    "compress_image[palette_png]": ("compress_image", "palette_png"),
+    "compress_image[panorama]": ("compress_image", "panorama"),
+    "compress_image_bytes[product_thumbnail]": ("compress_image_bytes", "product_thumbnail"),
+    "compress_image_bytes[alpha_png]": ("compress_image_bytes", "alpha_png"),
+    "compress_image_bytes[palette_png]": ("compress_image_bytes", "palette_png"),
+    "compress_image_bytes[panorama]": ("compress_image_bytes", "panorama"),
+    "resize_to_9_16[model_output]": ("resize_to_9_16", "model_output"),
+    "resize_to_9_16[square_output]": ("resize_to_9_16", "square_output"),
+    "resize_to_9_16[phone_photo]": ("resize_to_9_16", "phone_photo"),
+}
+
+
+def make_fixture(width: int, height: int, mode: str, image_format: str, seed: int = 0) -> bytes:
+    """A deterministic photo-like image: gradients, seeded noise, shapes and (for RGBA/P) transparency."""
+    rng = random.Random(seed)
+    noise = Image.frombytes("L", (width // 4, height // 4), rng.randbytes((width // 4) * (height // 4)))
+    noise = noise.resize((width, height), Image.Resampling.BILINEAR)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    img = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.ROTATE_180)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        size = rng.randrange(min(width, height) // 20, min(width, height) // 4)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x, y, x + size, y + size), fill=color, outline=(0, 0, 0), width=3)
+
+    if mode == "RGBA":
+        alpha = Image.radial_gradient("L").resize((width, height)).point(lambda value: 255 - value)
+        img.putalpha(alpha)
+    elif mode == "P":
+        img = img.quantize(64)
+        img.info["transparency"] = 0
+
+    buffer = io.BytesIO()
+    save_options = {"quality": 92} if image_format == "JPEG" else {}
+    img.save(buffer, image_format, **save_options)
+    return buffer.getvalue()
+
+
+def _rss_mb(field: str) -> float:
+    """VmRSS/VmHWM of this process from /proc in MB, or ru_maxrss where there is no /proc."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux, bytes on macOS (and survives exec, so it may include the parent's peak)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _reset_peak_rss():
+    """Reset VmHWM to the current RSS (Linux only; elsewhere the peak includes imports)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _load_function(name: str) -> Callable[[bytes, Path], None]:
+    """Import a benchmarked function, wrapped as fn(input bytes, output path)."""
+    # The backend modules create a database engine at import time
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    if name == "compress_image":
+        try:
+            from backend.upload_processing import compress_image
+        except ImportError:
+            from upload_processing import compress_image
+        return lambda data, output: compress_image(io.BytesIO(data), output)
+    if name == "compress_image_bytes":
+        try:
+            from backend.image_downloader import compress_image_bytes
+        except ImportError:
+            from image_downloader import compress_image_bytes
+        return lambda data, output: compress_image_bytes(data, output)
+    if name == "resize_to_9_16":
+        try:
+            from backend.generate_images import resize_to_9_16
+        except ImportError:
+            from generate_images import resize_to_9_16
+        # As generate_clothing_image_for_angle does it: decode, resize, save
+        return lambda data, output: resize_to_9_16(Image.open(io.BytesIO(data))).save(output, "JPEG", quality=95)
+    raise ValueError(f"Unknown function: {name}")
+
+
+def _reference_workload() -> Callable[[], None]:
+    """A fixed Pillow workload that calls are timed against."""
+    image = Image.linear_gradient("L").resize((1024, 1024)).convert("RGB")
+
+    def run():
+        image.resize((700, 700), Image.Resampling.LANCZOS).save(io.BytesIO(), "JPEG", quality=85)
+    return run
+
+
+def run_case(case: str, fixture_path: Path) -> Dict:
+    """Run one case in this process and return its measurements."""
+    function_name, fixture_name = CASES[case]
+    fn = _load_function(function_name)
+    data = fixture_path.read_bytes()
+    width, height = FIXTURES[fixture_name][:2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "output.jpg"
+        _reset_peak_rss()
+        rss_before = _rss_mb("VmRSS")
+        fn(data, output)  # Warm-up (and the call whose memory is measured)
+        rss_peak = _rss_mb("VmHWM")
+
+        reference = _reference_workload()
+        timings: List[float] = []
+        reference_timings: List[float] = []
+        started = time.perf_counter()
+        while len(timings) < MAX_CALLS and (len(timings) < MIN_CALLS or time.perf_counter() - started < MIN_SECONDS):
+            call_start = time.perf_counter()
+            reference()
+            reference_timings.append(time.perf_counter() - call_start)
+            call_start = time.perf_counter()
+            fn(data, output)
+            timings.append(time.perf_counter() - call_start)
+        output_bytes = output.stat().st_size
+
+    seconds = min(timings)
+    return {
+        "calls_per_sec": round(1 / seconds, 2),
+        "megapixels_per_sec": round(width * height / 1e6 / seconds, 2),
+        "seconds_per_call": round(seconds, 5),
+        "relative_cost": round(seconds / min(reference_timings), 3),
+        "peak_rss_mb": round(rss_peak - rss_before, 1),
+        "output_bytes": output_bytes,
+        "calls": len(timings),
+    }
+
+
+def _run_case_subprocess(case: str, fixture_path: Path) -> Dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "backend.benchmarks.bench_images", "--run-case", case, "--fixture", str(fixture_path)],
+        capture_output=True, text=True, cwd=Path(__file__).resolve().parents[2]
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{case} failed:\n{result.stderr}")
+    # Modules may print on import; the measurements are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _compare(result: Dict, baseline: Dict) -> Tuple[List[str], List[str]]:
+    """(column notes, regressions) for a result against its baseline."""
+    notes, regressions = [], []
+    time_change = result["relative_cost"] / baseline["relative_cost"] - 1
+    notes.append(f"{time_change:+.0%}")
+    if time_change > TIME_TOLERANCE:
+        regressions.append(f"{time_change:.0%} slower")
+    rss_limit = max(baseline["peak_rss_mb"] * (1 + RSS_TOLERANCE), baseline["peak_rss_mb"] + RSS_SLACK_MB)
+    notes.append(f"{result['peak_rss_mb'] - baseline['peak_rss_mb']:+.1f}MB")
+    if result["peak_rss_mb"] > rss_limit:
+        regressions.append(f"peak RSS {baseline['peak_rss_mb']}MB -> {result['peak_rss_mb']}MB")
+    output_change = result["output_bytes"] / baseline["output_bytes"] - 1
+    notes.append(f"{output_change:+.1%}")
+    if output_change > OUTPUT_TOLERANCE:
+        regressions.append(f"output {baseline['output_bytes']} -> {result['output_bytes']} bytes")
+    return notes, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--case", action="append", default=[], help="Run only cases containing this text (repeatable)")
+    parser.add_argument("--rounds", type=int, default=3, help="Subprocess runs per case")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on regressions against the baselines")
+    parser.add_argument("--update-baselines", action="store_true", help=f"Write results to {BASELINES_PATH.name}")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--fixture", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, Path(args.fixture))))
+        return
+
+    cases = [case for case in CASES if not args.case or any(text in case for text in args.case)]
+    baselines = json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {"cases": {}}
+    results, failures = {}, {}
+
+    print(f"{'case':<42} {'calls/s':>8} {'MP/s':>7} {'rel.cost':>8} {'peak RSS':>9} {'output':>9}"
+          f"   vs baseline (cost, RSS, bytes)")
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_paths = {}
+        for case in cases:
+            fixture_name = CASES[case][1]
+            if fixture_name not in fixture_paths:
+                fixture_paths[fixture_name] = Path(tmp) / fixture_name
+                fixture_paths[fixture_name].write_bytes(make_fixture(*FIXTURES[fixture_name]))
+
+            rounds = sorted(
+                (_run_case_subprocess(case, fixture_paths[fixture_name]) for _ in range(max(1, args.rounds))),
+                key=lambda result: result["relative_cost"]
+            )
+            result = results[case] = rounds[len(rounds) // 2]
+            line = (f"{case:<42} {result['calls_per_sec']:8.2f} {result['megapixels_per_sec']:7.1f} "
+                    f"{result['relative_cost']:8.2f} {result['peak_rss_mb']:7.1f}MB {result['output_bytes'] / 1024:7.0f}KB")
+            baseline = baselines["cases"].get(case)
+            if baseline:
+                notes, regressions = _compare(result, baseline)
+                line += "   " + ", ".join(notes)
+                if regressions:
+                    failures[case] = regressions
+                    line += "  ❌"
+            print(line)
+
+    if args.update_baselines:
+        baselines = {
+            "machine": {
+                "python": platform.python_version(),
+                "pillow": Image.__version__,
+                "cpus": os.cpu_count(),
+                "platform": platform.platform(),
+            },
+            "cases": {**baselines["cases"], **results},
+        }
+        BASELINES_PATH.write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"✓ Baselines written to {BASELINES_PATH}")
+
+    if failures:
+        for case, regressions in failures.items():
+            print(f"❌ {case}: {'; '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark /metrics collection as the database grows.
+
+Fills a scratch database with synthetic users, preferences, products, swipes,
+likes and clicks, then times a scrape two ways at each size:
+the full aggregate queries the old collect_metrics ran on every scrape
+(compute_metric_counters), and the current collect_metrics, which reads the
+metric_counters table.
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_metrics [--sizes 10000,100000,1000000] [--database-url URL]
+
+Sizes are swipe counts. Defaults to a temporary SQLite file. Point
+--database-url at a scratch PostgreSQL database to measure a real server;
+its tables are dropped.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+try:
+    from backend.database import Base
+    from backend.metric_counters import compute_metric_counters, rebuild_metric_counters
+    from backend.metrics import collect_metrics
+    from backend.models import User, Preference, Product, Swipe, LikedProduct, ProductClick
+except ImportError:
+    from database import Base
+    from metric_counters import compute_metric_counters, rebuild_metric_counters
+    from metrics import collect_metrics
+    from models import User, Preference, Product, Swipe, LikedProduct, ProductClick
+
+PRODUCTS = 2000
+CHUNK = 50000
+STYLES = ["casual", "formal", "street", "sporty", "vintage", "minimal"]
+TYPES = ["tops", "bottoms", "shoes", "dresses", None]
+
+
+def _insert_chunked(db, model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.execute(insert(model), rows[start:start + CHUNK])
+
+
+def grow_to(db, swipes: int, state: dict):
+    """Add users (each swiping on up to PRODUCTS products) until there are `swipes` swipes."""
+    rng = random.Random(len(state["user_ids"]))
+    if not state["product_ids"]:
+        _insert_chunked(db, Product, [
+            {"product_id": f"bench{i}", "title": f"Product {i}", "product_link": f"https://example.com/{i}",
+             "product_type": TYPES[i % len(TYPES)]}
+            for i in range(PRODUCTS)
+        ])
+        state["product_ids"] = [row.id for row in db.query(Product.id)]
+
+    while state["swipes"] < swipes:
+        user_number = len(state["user_ids"])
+        user_id = db.execute(insert(User).values(user_folder=f"user_bench_{user_number}")).inserted_primary_key[0]
+        state["user_ids"].append(user_id)
+        db.execute(insert(Preference).values(
+            user_id=user_id, gender=rng.choice(["male", "female", None]), size=rng.choice(["S", "M", "L"]),
+            styles=rng.sample(STYLES, 2), clothing_types=["tops"]
+        ))
+        count = min(PRODUCTS, swipes - state["swipes"])
+        swipe_rows = [
+            {"user_id": user_id, "product_id": product_id, "liked": rng.random() < 0.4}
+            for product_id in rng.sample(state["product_ids"], count)
+        ]
+        _insert_chunked(db, Swipe, swipe_rows)
+        liked = [row for row in swipe_rows if row["liked"]]
+        _insert_chunked(db, LikedProduct, [{"user_id": user_id, "product_id": row["product_id"]} for row in liked])
+        _insert_chunked(db, ProductClick, [
+            {"user_id": user_id, "product_id": row["product_id"], "referrer": "results_page"}
+            for row in liked[::10]
+        ])
+        state["swipes"] += count
+    db.commit()
+
+
+def time_call(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated swipe counts")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_engine(database_url)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+
+        print(f"{'swipes':>10} {'users':>7} {'aggregate scrape':>18} {'counter scrape':>16}")
+        state = {"product_ids": [], "user_ids": [], "swipes": 0}
+        for size in sizes:
+            grow_to(db, size, state)
+            rebuild_metric_counters(db)
+            aggregate = time_call(lambda: compute_metric_counters(db))
+            counters = time_call(lambda: collect_metrics(db))
+            print(f"{size:>10} {len(state['user_ids']):>7} {aggregate * 1000:>16.1f}ms {counters * 1000:>14.2f}ms")
+
+        db.close()
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
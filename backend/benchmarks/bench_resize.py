@@ -0,0 +1,112 @@
+"""
+Benchmark resize_to_9_16 against the previous crop-then-resize implementation.
+
+Runs both over representative generated-image sizes (model outputs near the
+target, square outputs, large upscaled outputs) and reports the median time
+per call. Also checks that the outputs look the same: PSNR of the luminance,
+after a slight blur that discounts invisible sub-pixel differences, must be
+at least --min-psnr dB. Exits non-zero if any size fails the check.
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_resize [--repeat 15] [--min-psnr 40]
+"""
+
+import argparse
+import math
+import statistics
+import sys
+import time
+from typing import Callable, List, Tuple
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+
+try:
+    from backend.generate_images import OUTPUT_HEIGHT, OUTPUT_WIDTH, resize_to_9_16
+except ImportError:
+    from generate_images import OUTPUT_HEIGHT, OUTPUT_WIDTH, resize_to_9_16
+
+# (width, height) of the inputs: exact target, common model outputs, large outputs
+SIZES = [
+    (1080, 1920),
+    (768, 1344),
+    (1024, 1024),
+    (1184, 1864),
+    (2048, 2048),
+    (2160, 3840),
+    (4000, 3000),
+]
+
+
+def previous_resize_to_9_16(image: Image.Image) -> Image.Image:
+    """The implementation before the fused crop/resize, for comparison."""
+    target_ratio = 9 / 16
+    current_ratio = image.width / image.height
+    if current_ratio > target_ratio:
+        new_width = int(image.height * target_ratio)
+        left = (image.width - new_width) // 2
+        image = image.crop((left, 0, left + new_width, image.height))
+    elif current_ratio < target_ratio:
+        new_height = int(image.width / target_ratio)
+        top = (image.height - new_height) // 2
+        image = image.crop((0, top, image.width, top + new_height))
+    return image.resize((OUTPUT_WIDTH, OUTPUT_HEIGHT), Image.Resampling.LANCZOS)
+
+
+def make_image(width: int, height: int) -> Image.Image:
+    """A photo-like test image: smooth gradients, fine noise and hard edges."""
+    noise = Image.effect_noise((width, height), 24)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    img = Image.merge("RGB", (gradient, noise, gradient.rotate(90, expand=False)))
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        x, y = width * i // 12, height * ((i * 7) % 12) // 12
+        draw.ellipse((x, y, x + width // 6, y + height // 8), outline=(255, 255, 255), width=3)
+        draw.line((0, y, width, height - y), fill=(0, 0, 0), width=2)
+    return img
+
+
+def psnr(a: Image.Image, b: Image.Image) -> float:
+    """PSNR in dB between the slightly blurred luminance of two images."""
+    blur = ImageFilter.GaussianBlur(1)
+    diff = ImageChops.difference(a.convert("L").filter(blur), b.convert("L").filter(blur))
+    mse = ImageStat.Stat(diff).rms[0] ** 2
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def time_calls(fns: List[Callable[[Image.Image], Image.Image]], image: Image.Image, repeat: int) -> List[float]:
+    """Median seconds per call of each function; calls are interleaved so machine noise hits all equally."""
+    timings = [[] for _ in fns]
+    for _ in range(repeat):
+        for fn, fn_timings in zip(fns, timings):
+            start = time.perf_counter()
+            fn(image)
+            fn_timings.append(time.perf_counter() - start)
+    return [statistics.median(fn_timings) for fn_timings in timings]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=15, help="Timed calls per size and implementation")
+    parser.add_argument("--min-psnr", type=float, default=40.0, help="Smallest acceptable PSNR (dB)")
+    args = parser.parse_args()
+
+    failures: List[Tuple[int, int]] = []
+    print(f"{'input':>11}  {'previous':>9}  {'current':>9}  {'speedup':>7}  {'PSNR':>7}")
+    for width, height in SIZES:
+        image = make_image(width, height)
+        image.load()
+        previous, current = time_calls([previous_resize_to_9_16, resize_to_9_16], image, args.repeat)
+        quality = psnr(previous_resize_to_9_16(image), resize_to_9_16(image))
+        if quality < args.min_psnr:
+            failures.append((width, height))
+        print(f"{width:>5}x{height:<5}  {previous * 1000:7.1f}ms  {current * 1000:7.1f}ms  "
+              f"{previous / max(current, 1e-9):6.1f}x  {quality:5.1f}dB")
+
+    if failures:
+        print(f"❌ Output differs visibly (PSNR < {args.min_psnr}dB) for: "
+              + ", ".join(f"{w}x{h}" for w, h in failures))
+        sys.exit(1)
+    print(f"✓ All outputs within {args.min_psnr}dB PSNR of the previous implementation")
+
+
+if __name__ == "__main__":
+    main()
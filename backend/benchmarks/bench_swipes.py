@@ -0,0 +1,175 @@
+"""
+Benchmark the swipe action path.
+
+Builds a synthetic user with products.json and combined images, then replays
+swipes the way /api/swipe/{user}/action does (a fresh SwipingSystem per
+request). The "before" run uses the original swipe implementation: three
+COUNT queries, an uncached get_products() per swipe and synchronous copies of
+each liked product's images. Reports swipes per second and SQL statements per
+swipe for both, plus the time to drain background liked-photo writes.
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_swipes [--products 200] [--swipes 500] [--database-url URL]
+
+Defaults to a temporary SQLite file. Point --database-url at a scratch
+PostgreSQL database to measure real round trips; its tables are dropped.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from sqlalchemy import and_, create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+try:
+    from backend import swiping_system
+    from backend.database import Base
+    from backend.models import LikedProduct, Product, Swipe, User
+except ImportError:
+    import swiping_system
+    from database import Base
+    from models import LikedProduct, Product, Swipe, User
+
+USER_FOLDER = "user_bench"
+IMAGE_BYTES = 300 * 1024  # Roughly a 1080x1920 JPEG
+
+
+class LegacySwipingSystem(swiping_system.SwipingSystem):
+    """The swipe path as it was before the counters rewrite."""
+
+    def get_products(self):
+        return self._build_product_index(self.user_path / "products" / "products.json")
+
+    def swipe(self, product_id: int, liked: bool):
+        product = self.db.query(Product).filter(Product.id == product_id).first()
+        if not product:
+            return {"error": "Product not found"}
+
+        existing_swipe = self.db.query(Swipe).filter(
+            and_(Swipe.user_id == self.user_id, Swipe.product_id == product_id)
+        ).first()
+        if existing_swipe:
+            existing_swipe.liked = liked
+        else:
+            self.db.add(Swipe(user_id=self.user_id, product_id=product_id, liked=liked))
+
+        if liked:
+            existing_liked = self.db.query(LikedProduct).filter(
+                and_(LikedProduct.user_id == self.user_id, LikedProduct.product_id == product_id)
+            ).first()
+            if not existing_liked:
+                self.db.add(LikedProduct(user_id=self.user_id, product_id=product_id))
+                self._save_liked_product(product)
+
+        self.db.commit()
+
+        total_swipes = self.db.query(Swipe).filter(Swipe.user_id == self.user_id).count()
+        total_liked = self.db.query(Swipe).filter(
+            and_(Swipe.user_id == self.user_id, Swipe.liked == True)
+        ).count()
+        total_disliked = self.db.query(Swipe).filter(
+            and_(Swipe.user_id == self.user_id, Swipe.liked == False)
+        ).count()
+        remaining = len(self.get_products()) - total_swipes
+        return {
+            "success": True,
+            "total_liked": total_liked,
+            "total_disliked": total_disliked,
+            "remaining": max(0, remaining),
+        }
+
+    def _save_liked_product(self, product):
+        product_dir = self.liked_photos_dir / f"product_{product.id}"
+        product_dir.mkdir(parents=True, exist_ok=True)
+        for p in self.get_products():
+            if p["db_product_id"] == product.id:
+                for angle, src_path in p["images"].items():
+                    if src_path:
+                        shutil.copy2(src_path, product_dir / f"{angle}.jpg")
+                break
+
+
+def make_user(db, images_dir: Path, product_count: int):
+    """Create products, products.json and combined images for one user."""
+    products = [
+        Product(product_id=f"bench{i}", title=f"Product {i}", product_link=f"https://example.com/{i}")
+        for i in range(product_count)
+    ]
+    db.add_all(products)
+    db.add(User(user_folder=USER_FOLDER))
+    db.commit()
+
+    user_path = images_dir / USER_FOLDER
+    (user_path / "products").mkdir(parents=True)
+    (user_path / "combined_images").mkdir()
+    with open(user_path / "products" / "products.json", "w") as f:
+        json.dump([{"db_product_id": p.id, "title": p.title} for p in products], f)
+    image_data = os.urandom(IMAGE_BYTES)
+    for index in range(1, product_count + 1):
+        for angle in ("front", "side", "back"):
+            (user_path / "combined_images" / f"product_{index}_{angle}.jpg").write_bytes(image_data)
+    return [p.id for p in products]
+
+
+def run(name, system_class, Session, product_ids, swipes, statements):
+    db = Session()
+    system_class(USER_FOLDER, db).reset_swipes()
+    db.close()
+    swiping_system.invalidate_product_index(USER_FOLDER)
+
+    statements[0] = 0
+    start = time.perf_counter()
+    for i in range(swipes):
+        db = Session()
+        system_class(USER_FOLDER, db).swipe(product_ids[i % len(product_ids)], liked=i % 3 == 0)
+        db.close()
+    elapsed = time.perf_counter() - start
+
+    drain_start = time.perf_counter()
+    swiping_system.shutdown_liked_photo_executor()
+    drain = time.perf_counter() - drain_start
+    print(f"{name:<8} {swipes / elapsed:8.0f} swipes/s  {statements[0] / swipes:5.1f} statements/swipe  "
+          f"background drain {drain:.2f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--swipes", type=int, default=500)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_engine(database_url)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+
+        statements = [0]
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_statement(*args):
+            statements[0] += 1
+
+        swiping_system.USER_IMAGES_DIR = Path(tmp) / "user_images"
+        db = Session()
+        product_ids = make_user(db, swiping_system.USER_IMAGES_DIR, args.products)
+        db.close()
+
+        print(f"{args.swipes} swipes over {args.products} products on {engine.dialect.name}")
+        before = run("before", LegacySwipingSystem, Session, product_ids, args.swipes, statements)
+        after = run("after", swiping_system.SwipingSystem, Session, product_ids, args.swipes, statements)
+        print(f"speedup: {before / after:.1f}x")
+
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
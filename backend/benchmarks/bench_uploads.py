@@ -0,0 +1,152 @@
+"""
+Benchmark /upload-images under concurrent uploads.
+
+Runs the API under uvicorn on a scratch SQLite database and data directory.
+A probe thread requests an unrelated cheap endpoint (GET /) at a steady rate
+while clients upload three phone-sized photos at a time. The probe's p50/p99
+latency is reported at idle, with compression on the event loop (the old
+upload path), and with the upload pool.
+
+Usage (from project root):
+    python -m backend.benchmarks.bench_uploads [--clients 4] [--uploads 12] [--width 4032 --height 3024]
+"""
+
+import argparse
+import io
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+import requests
+from PIL import Image
+
+
+def make_photo(width: int, height: int) -> bytes:
+    """A noisy, phone-sized JPEG (noise keeps decode/encode cost realistic)."""
+    noise = Image.effect_noise((width // 4, height // 4), 48).resize((width, height))
+    img = Image.merge("RGB", (noise, noise.rotate(180), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class InlineCompressor:
+    """The old upload path: compress each image on the event loop, no admission limit."""
+
+    def __init__(self, compress_image):
+        self.compress_image = compress_image
+
+    async def acquire_slot(self):
+        pass
+
+    def release_slot(self):
+        pass
+
+    async def compress_all(self, images: Dict[str, Tuple[bytes, Path]]) -> Dict[str, dict]:
+        return {image_type: self.compress_image(data, path) for image_type, (data, path) in images.items()}
+
+    def shutdown(self):
+        pass
+
+
+def probe(base_url: str, stop: threading.Event, interval: float) -> List[float]:
+    session = requests.Session()
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        session.get(f"{base_url}/", timeout=60)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return latencies
+
+
+def run_phase(base_url: str, photo: bytes, clients: int, uploads: int, interval: float, label: str, offset: int):
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as probe_pool:
+        probe_future = probe_pool.submit(probe, base_url, stop, interval)
+        upload_latencies, statuses = [], []
+
+        def upload(i: int):
+            files = {angle: (f"{angle}.jpg", photo, "image/jpeg") for angle in ("front", "side", "back")}
+            start = time.perf_counter()
+            response = requests.post(f"{base_url}/upload-images", files=files,
+                                     data={"user_id": f"bench_{offset + i}"}, timeout=300)
+            upload_latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+        if uploads:
+            with ThreadPoolExecutor(max_workers=clients) as upload_pool:
+                list(upload_pool.map(upload, range(uploads)))
+        else:
+            time.sleep(3)
+        stop.set()
+        latencies = probe_future.result()
+
+    line = (f"{label:<20} probe p50 {statistics.median(latencies) * 1000:7.1f}ms"
+            f"  p99 {percentile(latencies, 99) * 1000:7.1f}ms  max {max(latencies) * 1000:7.1f}ms")
+    if uploads:
+        rejected = sum(1 for status in statuses if status == 503)
+        line += f"  | upload p50 {statistics.median(upload_latencies):5.2f}s  503s {rejected}/{uploads}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent uploading clients")
+    parser.add_argument("--uploads", type=int, default=12, help="Uploads per phase")
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--probe-interval", type=float, default=0.02, help="Seconds between probe requests")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app reads its configuration at import time
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        os.environ.setdefault("JOB_RUNNER", "inline")
+        import uvicorn
+        try:
+            import backend.main as app_module
+            from backend.upload_processing import compress_image
+        except ImportError:
+            import main as app_module
+            from upload_processing import compress_image
+        app_module.BASE_DIR = Path(tmp)
+        app_module.IMAGES_DIR = Path(tmp) / "data" / "user_images"
+        app_module.IMAGES_DIR.mkdir(parents=True)
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+        base_url = f"http://127.0.0.1:{port}"
+
+        photo = make_photo(args.width, args.height)
+        print(f"{args.uploads} uploads x 3 photos of {args.width}x{args.height} ({len(photo) / 1024:.0f}KB), "
+              f"{args.clients} clients")
+
+        run_phase(base_url, photo, args.clients, 0, args.probe_interval, "idle", 0)
+        pool = app_module.upload_compressor
+        app_module.upload_compressor = InlineCompressor(compress_image)
+        run_phase(base_url, photo, args.clients, args.uploads, args.probe_interval, "event-loop compress", 0)
+        app_module.upload_compressor = pool
+        run_phase(base_url, photo, args.clients, args.uploads, args.probe_interval, "upload pool", args.uploads)
+
+        server.should_exit = True
+        time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ Database connection and session management for PostgreSQL.
 """
 
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from dotenv import load_dotenv
@@ -17,12 +17,19 @@ DATABASE_URL = os.getenv(
 )
 
 # Create engine
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # Verify connections before using
-    pool_size=10,
-    max_overflow=20
-)
+if DATABASE_URL.startswith("sqlite"):
+    # SQLite fallback (tests/benchmarks): share the connection across threads
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False}
+    )
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_pre_ping=True,  # Verify connections before using
+        pool_size=10,
+        max_overflow=20
+    )
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -51,11 +58,37 @@ def init_db():
     # Import models to register them with Base
     try:
         from backend.models import (
-            User, UserImage, Preference, Product, Swipe, LikedProduct, ProductClick
+            User, UserImage, Preference, Product, Swipe, LikedProduct, ProductClick, Job, SearchResult,
+            SearchQueryCache, SwipeBatch, MetricCounter
         )
     except ImportError:
         from models import (
-            User, UserImage, Preference, Product, Swipe, LikedProduct, ProductClick
+            User, UserImage, Preference, Product, Swipe, LikedProduct, ProductClick, Job, SearchResult,
+            SearchQueryCache, SwipeBatch, MetricCounter
         )
     Base.metadata.create_all(bind=engine)
 
+
+def get_insert(db: Session):
+    """
+    Get the dialect-specific insert() construct for the session's database,
+    which supports ON CONFLICT upserts (PostgreSQL and SQLite).
+    Returns None for other databases.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def lock_sqlite_for_write(db: Session):
+    """
+    On SQLite, take the database write lock now rather than at the first write,
+    so rows read before an upsert can't change before it runs. No-op elsewhere.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("UPDATE metric_counters SET value = value WHERE 0"))
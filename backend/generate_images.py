@@ -1,11 +1,23 @@
 import os
 import io
+import threading
 from google import genai
 from google.genai import types
 from PIL import Image
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Callable
+
+try:
+    from backend.generation_engine import GenerationEngine, create_generation_engine
+    from backend.image_cache import make_tryon_cache_key, tryon_cache
+    from backend.image_variants import generate_variants
+    from backend.tracing import span
+except ImportError:
+    from generation_engine import GenerationEngine, create_generation_engine
+    from image_cache import make_tryon_cache_key, tryon_cache
+    from image_variants import generate_variants
+    from tracing import span
 
 load_dotenv()
 
@@ -17,30 +29,47 @@ USER_IMAGES_DIR = BASE_DIR / "data" / "user_images"
 OUTPUT_WIDTH = 1080
 OUTPUT_HEIGHT = 1920  # 9:16 ratio
 
+# Model and prompt identity - part of the try-on cache key.
+# Bump PROMPT_VERSION whenever the prompt text or post-processing changes.
+GENERATION_MODEL = "gemini-2.5-flash-image"
+PROMPT_VERSION = "v2"  # v2: resize_to_9_16 uses reducing_gap and a fused crop
+
+# Downscales of 2 x this factor or more first reduce by an integer factor, then
+# LANCZOS (per Pillow's docs, 3.0 is indistinguishable from a full resample)
+RESIZE_REDUCING_GAP = 3.0
+
 
 def resize_to_9_16(image: Image.Image) -> Image.Image:
     """
     Resize and crop image to 9:16 aspect ratio (1080x1920).
     Centers the image and crops/pads as needed.
+
+    The crop is passed to resize() as its source box rather than done as a
+    separate copy, and large downscales first reduce by an integer factor
+    (reducing_gap). Images already at the target size are returned as is.
     """
+    if image.size == (OUTPUT_WIDTH, OUTPUT_HEIGHT):
+        return image
+    
     target_ratio = 9 / 16  # 0.5625
     current_ratio = image.width / image.height
+    box = (0, 0, image.width, image.height)
     
     if current_ratio > target_ratio:
         # Image is too wide - crop width
         new_width = int(image.height * target_ratio)
         left = (image.width - new_width) // 2
-        image = image.crop((left, 0, left + new_width, image.height))
+        box = (left, 0, left + new_width, image.height)
     elif current_ratio < target_ratio:
         # Image is too tall - crop height
         new_height = int(image.width / target_ratio)
         top = (image.height - new_height) // 2
-        image = image.crop((0, top, image.width, top + new_height))
-    
-    # Resize to target dimensions
-    image = image.resize((OUTPUT_WIDTH, OUTPUT_HEIGHT), Image.Resampling.LANCZOS)
+        box = (0, top, image.width, top + new_height)
     
-    return image
+    # Crop and resize to target dimensions in one pass
+    return image.resize(
+        (OUTPUT_WIDTH, OUTPUT_HEIGHT), Image.Resampling.LANCZOS, box=box, reducing_gap=RESIZE_REDUCING_GAP
+    )
 
 # Initialize Google GenAI client
 api_key = os.getenv("IMAGE_API_KEY")
@@ -51,12 +80,18 @@ else:
     client = genai.Client(api_key=api_key)
     print("✓ GenAI client initialized with IMAGE_API_KEY")
 
+# Shared engine: bounds in-flight calls and rate-limits per API key
+engine = create_generation_engine(client, api_key)
+
+ANGLES = ['front', 'side', 'back']
+
 
 def generate_clothing_image_for_angle(
     user_folder_path: Path,
     product_image_path: Path,
     angle: str,
-    product_index: int
+    product_index: int,
+    generation_engine: Optional[GenerationEngine] = None
 ) -> Optional[str]:
     """
     Generate an image of the user wearing the specified clothing item from a specific angle.
@@ -66,11 +101,13 @@ def generate_clothing_image_for_angle(
         product_image_path: Path to the product image
         angle: One of 'front', 'side', 'back'
         product_index: Index of the product (1-based)
+        generation_engine: Engine to call the model through (defaults to the shared engine)
         
     Returns:
         Path to the generated image file, or None if generation failed
     """
-    if not client:
+    generation_engine = generation_engine or engine
+    if not generation_engine:
         return None
     
     # Check if images exist - try both .jpg and .png extensions
@@ -89,9 +126,27 @@ def generate_clothing_image_for_angle(
         return None
         
     try:
+        user_image_bytes = user_angle_path.read_bytes()
+        product_image_bytes = product_image_path.read_bytes()
+        
+        # Create output directory
+        output_dir = user_folder_path / "combined_images"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Reuse a previous generation of the same inputs if we have one
+        cache_key = make_tryon_cache_key(
+            user_image_bytes, product_image_bytes, angle, PROMPT_VERSION, GENERATION_MODEL
+        )
+        cached_output_path = output_dir / f"product_{product_index}_{angle}.jpg"
+        if tryon_cache.materialize(cache_key, cached_output_path):
+            print(f"   ✓ Cache hit for {angle} view of product {product_index}")
+            with span("generate.variants", path=cached_output_path.name):
+                generate_variants(cached_output_path)
+            return str(cached_output_path)
+        
         # Load images using PIL (can be passed directly to Gemini)
-        user_image = Image.open(user_angle_path)
-        clothing_image = Image.open(product_image_path)
+        user_image = Image.open(io.BytesIO(user_image_bytes))
+        clothing_image = Image.open(io.BytesIO(product_image_bytes))
         
         # Create the prompt
         angle_desc = {
@@ -111,8 +166,8 @@ def generate_clothing_image_for_angle(
         # Generate the image using GenAI
         # Use gemini-2.5-flash-image for image generation/editing
         # Pass images directly (PIL Images are automatically converted by the SDK)
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image",
+        response = generation_engine.generate_content(
+            model=GENERATION_MODEL,
             contents=[
                 user_image,      # User from specific angle
                 clothing_image,  # Clothing item
@@ -120,10 +175,6 @@ def generate_clothing_image_for_angle(
             ]
         )
         
-        # Create output directory
-        output_dir = user_folder_path / "combined_images"
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
         # Clean product name for filename
         product_name = product_image_path.stem.replace(" ", "_")[:50]  # Limit length
         
@@ -152,11 +203,20 @@ def generate_clothing_image_for_angle(
                 generated_image = Image.open(io.BytesIO(image_data))
                 
                 # Resize to 9:16 aspect ratio
-                generated_image = resize_to_9_16(generated_image)
+                with span("generate.resize", width=generated_image.width, height=generated_image.height):
+                    generated_image = resize_to_9_16(generated_image)
                 
-                generated_image.save(str(output_path), 'JPEG', quality=95)
+                # Unlink first: the old file may be a hardlink into the cache
+                output_path.unlink(missing_ok=True)
+                with span("generate.save", path=output_path.name):
+                    generated_image.save(str(output_path), 'JPEG', quality=95)
                 print(f"   ✓ Generated image saved to: {output_path.name} ({OUTPUT_WIDTH}x{OUTPUT_HEIGHT})")
-                saved_path = str(output_path)
+                if count == 0:
+                    tryon_cache.put_file(cache_key, output_path)
+                    saved_path = str(output_path)
+                    # Smaller and WebP/AVIF copies for the swipe cards
+                    with span("generate.variants", path=output_path.name):
+                        generate_variants(output_path, generated_image)
                 count += 1
         
         if count == 0:
@@ -172,40 +232,54 @@ def generate_clothing_image_for_angle(
 def generate_all_angles_for_product(
     user_folder_path: Path,
     product_image_path: Path,
-    product_index: int
+    product_index: int,
+    generation_engine: Optional[GenerationEngine] = None
 ) -> Dict[str, Optional[str]]:
     """
     Generate combined images for all angles (front, side, back) for a single product.
+    The three angles are generated concurrently.
     
     Returns:
         Dictionary mapping angle to generated image path
     """
-    results = {}
+    generation_engine = generation_engine or engine
+    if not generation_engine:
+        return {angle: None for angle in ANGLES}
     
-    for angle in ['front', 'side', 'back']:
-        print(f"Generating {angle} view for product {product_index}...")
-        result = generate_clothing_image_for_angle(
+    print(f"Generating {', '.join(ANGLES)} views for product {product_index}...")
+    tasks = [
+        lambda angle=angle: generate_clothing_image_for_angle(
             user_folder_path,
             product_image_path,
             angle,
-            product_index
+            product_index,
+            generation_engine
         )
-        results[angle] = result
-    
-    return results
+        for angle in ANGLES
+    ]
+    return dict(zip(ANGLES, generation_engine.run_all(tasks)))
 
 
-def generate_combined_images_for_all_products(user_folder_path: str) -> Dict[str, Dict[str, Optional[str]]]:
+def generate_combined_images_for_all_products(
+    user_folder_path: str,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    generation_engine: Optional[GenerationEngine] = None
+) -> Dict[str, Dict[str, Optional[str]]]:
     """
     Generate combined images for all products in the user's folder.
+    Every (product, angle) pair is generated concurrently through the engine,
+    which bounds how many model calls are in flight at once.
     
     Args:
         user_folder_path: Path to user folder (e.g., "data/user_images/user_123")
+        progress_callback: Optional callback called as (completed, total) after each angle
+        generation_engine: Engine to call the model through (defaults to the shared engine)
         
     Returns:
         Dictionary mapping product index to angle results
     """
-    if not client:
+    generation_engine = generation_engine or engine
+    if not generation_engine:
         print("GenAI client not initialized - skipping image generation")
         return {}
     
@@ -228,12 +302,39 @@ def generate_combined_images_for_all_products(user_folder_path: str) -> Dict[str
     
     print(f"Found {len(product_images)} product images. Generating combined images...")
     
-    all_results = {}
+    total = len(product_images) * len(ANGLES)
+    completed = 0
+    progress_lock = threading.Lock()
     
-    for i, product_image_path in enumerate(product_images, 1):
-        print(f"\nProcessing product {i}: {product_image_path.name}")
-        results = generate_all_angles_for_product(user_path, product_image_path, i)
-        all_results[str(i)] = results
+    def generate(product_image_path: Path, angle: str, product_index: int) -> Optional[str]:
+        nonlocal completed
+        result = generate_clothing_image_for_angle(
+            user_path,
+            product_image_path,
+            angle,
+            product_index,
+            generation_engine
+        )
+        # Serialize progress updates - the callback may write to a DB session
+        with progress_lock:
+            completed += 1
+            if progress_callback:
+                progress_callback(completed, total)
+        return result
+    
+    jobs = [
+        (str(i), angle, product_image_path)
+        for i, product_image_path in enumerate(product_images, 1)
+        for angle in ANGLES
+    ]
+    results = generation_engine.run_all([
+        lambda image_path=image_path, angle=angle, index=int(index): generate(image_path, angle, index)
+        for index, angle, image_path in jobs
+    ])
+    
+    all_results = {}
+    for (index, angle, _), result in zip(jobs, results):
+        all_results.setdefault(index, {})[angle] = result
     
     return all_results
 
@@ -0,0 +1,180 @@
+"""
+Concurrent engine for Gemini try-on generation calls.
+
+Runs generation tasks on a thread pool with a bounded number of in-flight
+model calls, a per-API-key rate limit, and retries with exponential backoff
+for transient failures.
+
+The rate limiter is a per-process token bucket. Generation runs in the job
+pool's JOB_WORKERS processes, each with its own bucket, so every process gets
+GENERATION_REQUESTS_PER_MINUTE / GENERATION_PROCESSES and together they stay
+within the configured limit.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from backend.tracing import propagate, span
+except ImportError:
+    from tracing import propagate, span
+
+# Engine configuration
+GENERATION_MAX_IN_FLIGHT = int(os.getenv("GENERATION_MAX_IN_FLIGHT", "5"))
+GENERATION_REQUESTS_PER_MINUTE = float(os.getenv("GENERATION_REQUESTS_PER_MINUTE", "60"))  # Per API key, all processes; 0 disables
+# Processes generating at once, each with its own limiter: the job pool's workers
+# (see jobs.py), or 1 when jobs run inline in the API process
+GENERATION_PROCESSES = max(1, int(os.getenv(
+    "GENERATION_PROCESSES",
+    "1" if os.getenv("JOB_RUNNER", "process") == "inline" else os.getenv("JOB_WORKERS", "2")
+)))
+GENERATION_MAX_RETRIES = int(os.getenv("GENERATION_MAX_RETRIES", "3"))
+GENERATION_BACKOFF_SECONDS = float(os.getenv("GENERATION_BACKOFF_SECONDS", "2.0"))
+
+# HTTP status codes worth retrying (timeouts, rate limits, server errors)
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Return True if a failed model call is worth retrying."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int) and code in TRANSIENT_STATUS_CODES:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import httpx
+        if isinstance(error, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting calls per minute."""
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# One limiter per API key, shared by every engine using that key
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    api_key: str,
+    requests_per_minute: float,
+    burst: int,
+    processes: int = GENERATION_PROCESSES
+) -> RateLimiter:
+    """
+    Get (or create) this process's rate limiter for an API key.
+
+    Args:
+        api_key: API key the limit applies to
+        requests_per_minute: Limit across all generating processes
+        burst: Calls allowed back to back, across all generating processes
+        processes: Number of processes sharing the limit
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(api_key)
+        if limiter is None:
+            processes = max(1, processes)
+            limiter = RateLimiter(requests_per_minute / processes, max(1, burst // processes))
+            _rate_limiters[api_key] = limiter
+        return limiter
+
+
+class GenerationEngine:
+    """Runs generate_content calls concurrently with limits and retries."""
+
+    def __init__(
+        self,
+        client,
+        api_key: str = "",
+        max_in_flight: int = GENERATION_MAX_IN_FLIGHT,
+        requests_per_minute: float = GENERATION_REQUESTS_PER_MINUTE,
+        max_retries: int = GENERATION_MAX_RETRIES,
+        backoff_seconds: float = GENERATION_BACKOFF_SECONDS
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            client: GenAI client (anything with client.models.generate_content)
+            api_key: API key the client uses, for the shared rate limit
+            max_in_flight: Maximum concurrent model calls
+            requests_per_minute: Rate limit for this API key across all GENERATION_PROCESSES (0 disables)
+            max_retries: Retries per call for transient failures
+            backoff_seconds: Base delay for exponential backoff
+        """
+        self.client = client
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self.rate_limiter = get_rate_limiter(api_key, requests_per_minute, self.max_in_flight)
+
+    def generate_content(self, **kwargs) -> Any:
+        """
+        Call client.models.generate_content, retrying transient failures.
+        Blocks while the in-flight limit or rate limit is reached.
+        Waiting and each model call are timed as separate stages.
+        """
+        attempt = 0
+        while True:
+            with span("generate.rate_limit_wait"):
+                self.rate_limiter.acquire()
+            try:
+                with self.in_flight:
+                    with span("generate.generate_content", model=kwargs.get("model"), attempt=attempt):
+                        return self.client.models.generate_content(**kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random() * 0.25)
+                attempt += 1
+                print(f"   ⚠️ Transient generation error ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run_all(self, tasks: List[Callable[[], Any]]) -> List[Any]:
+        """
+        Run tasks concurrently and return their results in the same order.
+        """
+        if not tasks:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(tasks))) as executor:
+            futures = [executor.submit(propagate(task)) for task in tasks]
+            return [future.result() for future in futures]
+
+
+def create_generation_engine(client, api_key: Optional[str] = None, **kwargs) -> Optional[GenerationEngine]:
+    """Create an engine for a client, or None if there is no client."""
+    if client is None:
+        return None
+    return GenerationEngine(client, api_key=api_key or "", **kwargs)
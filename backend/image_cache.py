@@ -0,0 +1,174 @@
+"""
+Content-addressed on-disk cache for generated try-on images.
+
+Entries are keyed by a hash of everything that determines the model output
+(user angle photo, product photo, angle, prompt version, model name) and store
+the finished 1080x1920 JPEG. The store is shared by all users and bounded in
+size, evicting least recently used entries first.
+
+Entries are hardlinked into users' combined_images folders, so the JPEGs are
+never modified after they are written. Recency is tracked on a separate empty
+"<key>.used" marker next to each entry, whose mtime every process can update.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+# Cache location and size bound
+BASE_DIR = Path(__file__).parent.parent
+TRYON_CACHE_DIR = Path(os.getenv("TRYON_CACHE_DIR", str(BASE_DIR / "data" / "cache" / "tryon")))
+TRYON_CACHE_MAX_BYTES = int(os.getenv("TRYON_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# After eviction the cache is trimmed to this fraction of the bound
+EVICTION_TARGET_RATIO = 0.9
+
+
+def make_tryon_cache_key(
+    user_image_bytes: bytes,
+    product_image_bytes: bytes,
+    angle: str,
+    prompt_version: str,
+    model_name: str
+) -> str:
+    """Build the content hash for a try-on generation."""
+    digest = hashlib.sha256()
+    for part in (user_image_bytes, product_image_bytes, angle.encode(), prompt_version.encode(), model_name.encode()):
+        # Length-prefix each part so different splits can't collide
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class TryOnImageCache:
+    """Size-bounded LRU store of generated images, keyed by content hash."""
+
+    def __init__(self, cache_dir: Path = TRYON_CACHE_DIR, max_bytes: int = TRYON_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size_bytes = None  # Computed from disk on first write
+
+    def path_for(self, key: str) -> Path:
+        """Path of the cached image for a key (sharded by the first two hex chars)."""
+        return self.cache_dir / key[:2] / f"{key}.jpg"
+
+    @staticmethod
+    def _marker_for(path: Path) -> Path:
+        """Recency marker of a cache entry (its mtime is the last use)."""
+        return path.with_suffix(".used")
+
+    @staticmethod
+    def _touch(marker: Path):
+        try:
+            os.utime(marker)
+        except FileNotFoundError:
+            marker.touch()
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Look up a cached image.
+
+        Returns:
+            Path to the cached JPEG, or None on a miss
+        """
+        path = self.path_for(key)
+        if not path.exists():
+            with self.lock:
+                self.misses += 1
+            return None
+        # Touch the marker, not the (hardlinked, served) image, so eviction sees it as recently used
+        self._touch(self._marker_for(path))
+        with self.lock:
+            self.hits += 1
+        return path
+
+    def materialize(self, key: str, dest: Path) -> bool:
+        """
+        Place the cached image for a key at dest (hardlink, or copy across devices).
+
+        Returns:
+            True on a cache hit, False on a miss
+        """
+        path = self.get(key)
+        if path is None:
+            return False
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.unlink(missing_ok=True)
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copyfile(path, dest)
+        return True
+
+    def put_file(self, key: str, source: Path) -> Path:
+        """
+        Store a finished image file under a key.
+
+        Returns:
+            Path of the cache entry
+        """
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+        self._touch(self._marker_for(path))
+
+        with self.lock:
+            if self._size_bytes is None:
+                self._size_bytes = self._disk_usage()
+            else:
+                self._size_bytes += path.stat().st_size
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _disk_usage(self) -> int:
+        return sum(entry.stat().st_size for entry in self.cache_dir.glob("*/*.jpg"))
+
+    def _evict(self):
+        """Delete least recently used entries until under the target size. Caller holds the lock."""
+        entries = []
+        for entry in self.cache_dir.glob("*/*.jpg"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            try:
+                used_at = self._marker_for(entry).stat().st_mtime
+            except FileNotFoundError:
+                used_at = stat.st_mtime  # Entries written before markers existed
+            entries.append((used_at, stat.st_size, entry))
+        entries.sort()
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        for _, entry_size, entry in entries:
+            if size <= target:
+                break
+            entry.unlink(missing_ok=True)
+            self._marker_for(entry).unlink(missing_ok=True)
+            size -= entry_size
+            self.evictions += 1
+        self._size_bytes = size
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters for this process."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Shared cache instance
+tryon_cache = TryOnImageCache()
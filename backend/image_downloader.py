@@ -0,0 +1,155 @@
+"""
+Parallel product image downloader.
+
+Thumbnails are fetched concurrently over a shared keep-alive HTTP session
+with a per-host connection limit. As each download finishes, its Pillow
+decode/resize/encode runs on a separate worker pool, so slow hosts never hold
+up image processing. Each item reports success or failure on its own.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from backend.image_pipeline import ImageSettings, encode_image, prepare_image
+    from backend.tracing import propagate, span
+except ImportError:
+    from image_pipeline import ImageSettings, encode_image, prepare_image
+    from tracing import propagate, span
+
+# Downloader configuration
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))  # Concurrent fetches
+DOWNLOAD_CONNECTIONS_PER_HOST = int(os.getenv("DOWNLOAD_CONNECTIONS_PER_HOST", "4"))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "15"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))  # Pillow workers
+
+# Product thumbnails: max 512px, JPEG quality 85
+PRODUCT_IMAGE_SETTINGS = ImageSettings(max_size=512, quality=85)
+
+# Headers for downloading images
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Shared keep-alive session, limited to DOWNLOAD_CONNECTIONS_PER_HOST per host."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=DOWNLOAD_WORKERS,  # Number of hosts kept in the pool
+                pool_maxsize=DOWNLOAD_CONNECTIONS_PER_HOST,
+                pool_block=True  # Wait for a free connection instead of opening extras
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(HEADERS)
+            _session = session
+        return _session
+
+
+def fetch_image(image_url: str, timeout: float = DOWNLOAD_TIMEOUT) -> bytes:
+    """Download raw image bytes using the shared session."""
+    with span("download.fetch", url=image_url) as attributes:
+        response = get_http_session().get(image_url, timeout=timeout)
+        response.raise_for_status()
+        attributes["bytes"] = len(response.content)
+        return response.content
+
+
+def compress_image_bytes(image_data: bytes, save_path: Path, max_size: int = 512, quality: int = 85) -> Dict:
+    """
+    Decode downloaded image bytes, shrink to max_size and save as JPEG.
+
+    Returns:
+        Dict with original and compressed sizes in bytes
+    """
+    settings = PRODUCT_IMAGE_SETTINGS
+    if (max_size, quality) != (settings.max_size, settings.quality):
+        settings = settings.replace(max_size=max_size, quality=quality)
+
+    with span("download.decode", bytes=len(image_data)):
+        img = prepare_image(image_data, settings)
+
+    # Save as compressed JPEG
+    with span("download.encode", width=img.width, height=img.height):
+        data = encode_image(img, settings)
+        save_path.write_bytes(data)
+
+    return {
+        "original_size": len(image_data),
+        "compressed_size": len(data),
+    }
+
+
+def download_images(
+    items: List[Tuple[str, Path]],
+    max_size: int = 512,
+    quality: int = 85,
+    max_workers: int = DOWNLOAD_WORKERS,
+    image_workers: int = IMAGE_WORKERS
+) -> List[Dict]:
+    """
+    Download and compress many images concurrently.
+
+    Args:
+        items: List of (image_url, save_path) pairs
+        max_size: Maximum dimension (width or height) in pixels
+        quality: JPEG quality 1-100
+        max_workers: Concurrent downloads
+        image_workers: Concurrent Pillow decode/encode jobs
+
+    Returns:
+        One result dict per item, in input order, with keys:
+        url, path, ok, error, original_size, compressed_size
+    """
+    results = [
+        {"url": url, "path": Path(path), "ok": False, "error": None,
+         "original_size": None, "compressed_size": None}
+        for url, path in items
+    ]
+    if not items:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=max(1, image_workers)) as image_pool:
+        fetches = {
+            fetch_pool.submit(propagate(fetch_image), result["url"]): result
+            for result in results if result["url"]
+        }
+        compressions = {}
+        for future in as_completed(fetches):
+            result = fetches[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                result["error"] = f"download failed: {e}"
+                continue
+            compressions[image_pool.submit(
+                propagate(compress_image_bytes), data, result["path"], max_size, quality
+            )] = result
+
+        for future in as_completed(compressions):
+            result = compressions[future]
+            try:
+                result.update(future.result())
+                result["ok"] = True
+            except Exception as e:
+                result["error"] = f"compression failed: {e}"
+
+    for result in results:
+        if not result["url"]:
+            result["error"] = "missing image URL"
+    return results
+
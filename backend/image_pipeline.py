@@ -0,0 +1,171 @@
+"""
+Shared decode -> normalize -> encode pipeline for photos the app stores.
+
+Uploads (upload_processing.compress_image) and downloaded product images
+(image_downloader.compress_image_bytes) both go through it, each with its own
+ImageSettings:
+
+    decode     open the image; JPEGs are decoded at a reduced DCT scale
+               close to the target size (draft)
+    orient     optionally apply the EXIF orientation tag
+    flatten    composite transparent images onto a solid background
+    resample   shrink to fit max_size x max_size, keeping the aspect ratio
+    encode     to bytes in memory, without EXIF/ICC metadata, so the result
+               can be written to disk, cached or sent over HTTP without
+               encoding it again
+
+process_image also records a perceptual hash (dHash) of the final image, so
+re-encoded copies of the same photo can be recognised.
+"""
+
+import io
+from pathlib import Path
+from typing import BinaryIO, Tuple, Union
+from PIL import Image, ImageOps
+
+ImageSource = Union[bytes, BinaryIO, Image.Image]
+
+
+class ImageSettings:
+    """Reusable settings for one kind of stored image."""
+
+    def __init__(
+        self,
+        max_size: int,
+        quality: int = 85,
+        image_format: str = "JPEG",
+        draft: bool = True,
+        exif_transpose: bool = False,
+        background: Tuple[int, int, int] = (255, 255, 255),
+        resample: Image.Resampling = Image.Resampling.LANCZOS,
+        optimize: bool = True
+    ):
+        self.max_size = max_size
+        self.quality = quality
+        self.image_format = image_format
+        self.draft = draft
+        self.exif_transpose = exif_transpose
+        self.background = background
+        self.resample = resample
+        self.optimize = optimize
+
+    def replace(self, **changes) -> "ImageSettings":
+        """A copy of these settings with some values changed."""
+        return ImageSettings(**{**self.__dict__, **changes})
+
+    def save_options(self) -> dict:
+        # An empty exif also keeps Pillow from carrying over the source's metadata
+        return {"format": self.image_format, "quality": self.quality, "optimize": self.optimize, "exif": b""}
+
+
+def open_image(source: ImageSource) -> Image.Image:
+    """Open an image from bytes or a binary file (reads the header only); opened images pass through."""
+    if isinstance(source, Image.Image):
+        return source
+    return Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def decode_image(source: ImageSource, settings: ImageSettings) -> Image.Image:
+    """
+    Open an image and, for large JPEGs, set up a reduced-scale decode.
+
+    Args:
+        source: Encoded bytes, a binary file, or an image already opened with Image.open
+        settings: Pipeline settings (max_size and draft are used)
+    """
+    img = open_image(source)
+    # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, to the smallest size still
+    # at least as large as the target
+    if settings.draft and img.format == "JPEG" and max(img.size) > settings.max_size:
+        scale = settings.max_size / max(img.size)
+        img.draft("RGB", (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+    return img
+
+
+def flatten_alpha(img: Image.Image, background: Tuple[int, int, int]) -> Image.Image:
+    """Convert to RGB, compositing any transparency onto a solid background."""
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if img.mode in ("RGBA", "LA", "PA"):
+        img = Image.alpha_composite(Image.new("RGBA", img.size, background + (255,)), img.convert("RGBA"))
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def prepare_image(source: ImageSource, settings: ImageSettings) -> Image.Image:
+    """Decode, orient, flatten and resample an image; returns an RGB image at most max_size on each side."""
+    img = decode_image(source, settings)
+    if settings.exif_transpose:
+        img = ImageOps.exif_transpose(img)
+    img = flatten_alpha(img, settings.background)
+    if img.width > settings.max_size or img.height > settings.max_size:
+        img.thumbnail((settings.max_size, settings.max_size), settings.resample)
+    return img
+
+
+def encode_image(img: Image.Image, settings: ImageSettings) -> bytes:
+    """Encode an image in the configured format, without metadata."""
+    buffer = io.BytesIO()
+    img.save(buffer, **settings.save_options())
+    return buffer.getvalue()
+
+
+def perceptual_hash(img: Image.Image, hash_size: int = 8) -> str:
+    """
+    Difference hash of an image: one bit per horizontally adjacent pixel pair
+    of a (hash_size + 1) x hash_size grayscale thumbnail.
+
+    Survives re-encoding, resizing and small color changes, unlike a content hash.
+
+    Returns:
+        The hash as hash_size * hash_size / 4 hex characters (16 by default)
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hash_distance(first: str, second: str) -> int:
+    """Number of differing bits between two perceptual hashes."""
+    return bin(int(first, 16) ^ int(second, 16)).count("1")
+
+
+class ProcessedImage:
+    """An encoded image from process_image."""
+
+    def __init__(
+        self,
+        data: bytes,
+        size: Tuple[int, int],
+        original_size: Tuple[int, int],
+        perceptual_hash: str
+    ):
+        self.data = data
+        self.size = size
+        self.original_size = original_size
+        self.perceptual_hash = perceptual_hash
+
+    def save(self, path: Path) -> Path:
+        path.write_bytes(self.data)
+        return path
+
+
+def process_image(source: ImageSource, settings: ImageSettings) -> ProcessedImage:
+    """
+    Run the whole pipeline on one image.
+
+    Args:
+        source: Encoded bytes, a binary file, or an image already opened with Image.open
+        settings: Pipeline settings
+
+    Returns:
+        The encoded image with its final and original dimensions and perceptual hash
+    """
+    img = open_image(source)
+    original_size = img.size  # Before draft() changes it
+    img = prepare_image(img, settings)
+    return ProcessedImage(encode_image(img, settings), img.size, original_size, perceptual_hash(img))
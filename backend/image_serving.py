@@ -0,0 +1,268 @@
+"""
+Conditional, range-capable serving of user images for /api/image.
+
+Responses carry a strong ETag built from a hash of the file's content, plus
+Last-Modified, so repeat views are answered with 304 Not Modified. The
+version is never derived from timestamps: generated images are hardlinked
+from the try-on cache, so one inode is shared by many users' files. URLs with
+a ?v=<version> matching the current file version never change content and
+are sent with a long-lived immutable Cache-Control; other requests revalidate.
+Single byte ranges are served as 206 Partial Content. When a smaller or
+WebP/AVIF variant is sent in place of an image (see image_variants.py), the
+response varies by Accept and ?v= refers to the original's version.
+
+File stats are kept in a small LRU with a short TTL, so a 304 for a recently
+seen file needs no filesystem calls. A file is only re-hashed when its
+inode, mtime, ctime or size changes.
+"""
+
+import hashlib
+import mimetypes
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+
+# Stat cache configuration
+IMAGE_STAT_CACHE_TTL = float(os.getenv("IMAGE_STAT_CACHE_TTL", "5"))  # Seconds
+IMAGE_STAT_CACHE_SIZE = int(os.getenv("IMAGE_STAT_CACHE_SIZE", "4096"))
+
+# Cache-Control for versioned (?v=) and unversioned URLs
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+def content_version(path: Path) -> str:
+    """Version token for a file's content: the first 16 hex chars of its sha256."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(RANGE_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _stat_key(stat_result: os.stat_result) -> tuple:
+    # ctime too: writes can restore mtime (utime, copy2) but always bump ctime
+    return (
+        stat_result.st_dev, stat_result.st_ino, stat_result.st_mtime_ns,
+        stat_result.st_ctime_ns, stat_result.st_size
+    )
+
+
+class ImageFileInfo:
+    """Stat- and content-derived headers for one image file."""
+
+    def __init__(self, path: Path, stat_result: os.stat_result, version: str):
+        self.path = path
+        self.stat_result = stat_result
+        self.stat_key = _stat_key(stat_result)
+        self.size = stat_result.st_size
+        self.mtime = stat_result.st_mtime
+        self.version = version
+        self.etag = f'"{self.version}"'
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+
+class ImageStatCache:
+    """LRU of path -> ImageFileInfo (or None for a missing file), with entries expiring after a TTL."""
+
+    def __init__(self, ttl: float = IMAGE_STAT_CACHE_TTL, max_size: int = IMAGE_STAT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: "OrderedDict[Path, Tuple[float, Optional[ImageFileInfo]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: Path) -> Optional[ImageFileInfo]:
+        """Cached info for a file, stat-ing it if the entry is missing or expired."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] >= now:
+                self.entries.move_to_end(path)
+                return entry[1]
+        return self.refresh(path)
+
+    def refresh(self, path: Path) -> Optional[ImageFileInfo]:
+        """Stat a file now and cache the result, hashing it only if the stat changed."""
+        with self.lock:
+            entry = self.entries.get(path)
+        previous = entry[1] if entry else None
+        try:
+            stat_result = os.stat(path)
+            if not stat.S_ISREG(stat_result.st_mode):
+                info = None
+            elif previous is not None and previous.stat_key == _stat_key(stat_result):
+                info = ImageFileInfo(path, stat_result, previous.version)
+            else:
+                info = ImageFileInfo(path, stat_result, content_version(path))
+        except OSError:
+            info = None
+        with self.lock:
+            self.entries[path] = (time.monotonic() + self.ttl, info)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return info
+
+    def invalidate(self, path: Path):
+        with self.lock:
+            self.entries.pop(path, None)
+
+
+# Shared stat cache instance
+image_stat_cache = ImageStatCache()
+
+
+def resolve_image_path(images_dir: Path, full_path: str) -> Optional[Path]:
+    """
+    Map an /api/image path to a file under images_dir.
+
+    Accepts paths with or without the "data/user_images/" prefix. Purely
+    lexical (no filesystem calls); the images directory holds no symlinks.
+
+    Returns:
+        The file path, or None if the path would escape images_dir
+    """
+    if full_path.startswith("data/user_images/"):
+        full_path = full_path.replace("data/user_images/", "", 1)
+    root = os.path.abspath(images_dir)
+    path = os.path.normpath(os.path.join(root, full_path))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return Path(path)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    # If-None-Match uses weak comparison
+    return any((candidate[2:] if candidate.startswith("W/") else candidate) == etag for candidate in candidates)
+
+
+def _not_modified(request: Request, info: ImageFileInfo) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, info.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(info.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" Range header.
+
+    Returns:
+        Inclusive (start, end), or None if the header should be ignored (serve the whole file)
+
+    Raises:
+        ValueError: If the range can't be satisfied (respond 416)
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None  # Other units and multipart ranges: send the whole file
+    start_text, dash, end_text = (part.strip() for part in ranges.partition("-"))
+    if not dash or not (start_text or end_text) or not (start_text + end_text).isdigit():
+        return None  # Malformed: ignore the header
+    if start_text:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+        if end_text and end < start:
+            return None
+    else:
+        suffix = int(end_text)  # Last N bytes
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        start, end = max(0, size - suffix), size - 1
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _read_range(path: Path, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _headers(info: ImageFileInfo, version: Optional[str], current_version: str, vary_accept: bool) -> dict:
+    headers = {
+        "ETag": info.etag,
+        "Last-Modified": info.last_modified,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if version == current_version else REVALIDATE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if vary_accept:
+        headers["Vary"] = "Accept"
+    return headers
+
+
+def image_response(
+    request: Request,
+    info: ImageFileInfo,
+    version: Optional[str] = None,
+    source: Optional[ImageFileInfo] = None,
+    vary_accept: bool = False
+) -> Response:
+    """
+    Build the response for an image request: 304, 206, 416 or the full file.
+
+    Args:
+        request: Incoming request (conditional and Range headers are read from it)
+        info: Cached file info of the file to send
+        version: The URL's ?v= value; if it matches the image, the response is cacheable forever
+        source: The requested image, when info is a variant of it (?v= is checked against it)
+        vary_accept: Whether the file was chosen by the Accept header
+    """
+    current_version = (source or info).version
+    if _not_modified(request, info):
+        return Response(status_code=304, headers=_headers(info, version, current_version, vary_accept))
+
+    # Re-stat before sending a body: the cached entry may predate a rewrite
+    info = image_stat_cache.refresh(info.path)
+    if info is None:
+        return JSONResponse(status_code=404, content={"error": "Image not found"})
+    if source is None:
+        current_version = info.version
+    headers = _headers(info, version, current_version, vary_accept)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() in (info.etag, info.last_modified)):
+        try:
+            byte_range = parse_range(range_header, info.size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{info.size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _read_range(info.path, start, end), status_code=206, headers=headers, media_type=info.media_type
+            )
+
+    return FileResponse(info.path, headers=headers, media_type=info.media_type, stat_result=info.stat_result)
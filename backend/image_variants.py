@@ -0,0 +1,205 @@
+"""
+Responsive derivatives of generated try-on images.
+
+Each combined image (a 1080x1920 JPEG) gets smaller copies at
+IMAGE_VARIANT_WIDTHS in JPEG and WebP, plus AVIF when the installed Pillow can
+write it (Pillow 11.3+, or with the pillow-avif-plugin package). The
+full-width WebP/AVIF copies are made too; the full-width JPEG is the original.
+
+Variants live in a "variants" folder next to the image and are named after
+the original's version, a hash of its content (see image_serving.ImageFileInfo).
+A regenerated image never picks up its predecessor's variants, and a try-on
+cache hit that materializes the same image again reuses them without decoding
+or encoding anything:
+
+    combined_images/product_1_front.jpg
+    combined_images/variants/product_1_front.<version>.w540.webp
+    combined_images/variants/product_1_front.<version>.full.webp
+
+Usage (backfill a folder of existing images):
+    python -m backend.image_variants data/user_images/user_123/combined_images
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional, Sequence
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401 - registers the AVIF plugin on older Pillow
+except ImportError:
+    pass
+
+try:
+    from backend.image_serving import ImageFileInfo, image_stat_cache
+except ImportError:
+    from image_serving import ImageFileInfo, image_stat_cache
+
+# Variant configuration
+IMAGE_VARIANT_WIDTHS = sorted(
+    int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "360,540,720").split(",") if width.strip()
+)
+VARIANTS_DIR_NAME = "variants"
+
+Image.init()
+AVIF_SUPPORTED = "AVIF" in Image.SAVE
+
+# Format -> (file suffix, Pillow save options); most preferred first
+VARIANT_FORMATS = {
+    **({"avif": ("avif", {"format": "AVIF", "quality": 55})} if AVIF_SUPPORTED else {}),
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True}),
+}
+
+# Accept media type for each variant format
+FORMAT_MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def variant_path(image_path: Path, version: str, width: Optional[int], image_format: str) -> Path:
+    """Where the variant of an image at a given width (None for full width) and format is stored."""
+    suffix = VARIANT_FORMATS[image_format][0]
+    size = f"w{width}" if width else "full"
+    return image_path.parent / VARIANTS_DIR_NAME / f"{image_path.stem}.{version}.{size}.{suffix}"
+
+
+def _variant_specs(image_width: int):
+    """(width, format) pairs to generate: the smaller widths, and full width (None) in the non-JPEG formats."""
+    for width in IMAGE_VARIANT_WIDTHS:
+        if width < image_width:
+            for image_format in VARIANT_FORMATS:
+                yield width, image_format
+    for image_format in VARIANT_FORMATS:
+        if image_format != "jpeg":
+            yield None, image_format
+
+
+def _remove_stale_variants(image_path: Path, version: str):
+    """Delete variants left over from previous versions of an image."""
+    variants_dir = image_path.parent / VARIANTS_DIR_NAME
+    for path in variants_dir.glob(f"{image_path.stem}.*"):
+        if not path.name.startswith(f"{image_path.stem}.{version}."):
+            path.unlink(missing_ok=True)
+            image_stat_cache.invalidate(path)
+
+
+def _missing_variants(image_path: Path, version: str, image_width: int) -> List[tuple]:
+    """(width, format, path) of the variants of an image version that don't exist yet."""
+    specs = (
+        (width, image_format, variant_path(image_path, version, width, image_format))
+        for width, image_format in _variant_specs(image_width)
+    )
+    return [spec for spec in specs if not spec[2].exists()]
+
+
+def generate_variants(image_path: Path, image: Optional[Image.Image] = None) -> List[Path]:
+    """
+    Write the responsive variants of an image, skipping ones that already exist.
+
+    Args:
+        image_path: The original image (e.g. combined_images/product_1_front.jpg)
+        image: The image already decoded, if the caller has it (saves a decode)
+
+    Returns:
+        Paths of the variants written
+    """
+    info = image_stat_cache.refresh(image_path)
+    if info is None:
+        return []
+    variants_dir = image_path.parent / VARIANTS_DIR_NAME
+    variants_dir.mkdir(exist_ok=True)
+    _remove_stale_variants(image_path, info.version)
+
+    if image is None:
+        with Image.open(image_path) as source:
+            # Only decode if something is missing (the header gives the width)
+            missing = _missing_variants(image_path, info.version, source.width)
+            if not missing:
+                return []
+            image = source.convert("RGB")
+    else:
+        missing = _missing_variants(image_path, info.version, image.width)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+    written = []
+    resized = {}
+    for width, image_format, path in missing:
+        if width not in resized:
+            height = round(image.height * width / image.width) if width else image.height
+            resized[width] = image.resize((width, height), Image.Resampling.LANCZOS) if width else image
+        # Write under a temporary name so a concurrent request never serves a partial file
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            resized[width].save(tmp_path, **VARIANT_FORMATS[image_format][1])
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The original is still served; a missing variant only costs bytes
+            print(f"   ⚠️ Could not write variant {path.name}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            continue
+        image_stat_cache.invalidate(path)
+        written.append(path)
+    return written
+
+
+def accepted_formats(accept: Optional[str]) -> List[str]:
+    """Variant formats a client's Accept header allows, most preferred first (JPEG is always allowed)."""
+    accepted = set()
+    for item in (accept or "").split(","):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+        try:
+            if float(quality) > 0:
+                accepted.add(media_type.lower())
+        except ValueError:
+            continue
+    return [
+        image_format for image_format, media_type in FORMAT_MEDIA_TYPES.items()
+        if image_format in VARIANT_FORMATS and (media_type in accepted or image_format == "jpeg")
+    ]
+
+
+def has_variants(info: ImageFileInfo) -> bool:
+    """Whether variants exist for the current version of an image (its full-width WebP is always made)."""
+    return image_stat_cache.get(variant_path(info.path, info.version, None, "webp")) is not None
+
+
+def select_variant(
+    info: ImageFileInfo,
+    width: Optional[int],
+    formats: Sequence[str]
+) -> Optional[ImageFileInfo]:
+    """
+    Pick the variant to send for an image.
+
+    Args:
+        info: The original image
+        width: Width the client will display the image at (None for full width)
+        formats: Acceptable formats, most preferred first (see accepted_formats)
+
+    Returns:
+        The smallest existing variant at least `width` wide in the most preferred
+        format, or None to send the original
+    """
+    if info.path.parent.name == VARIANTS_DIR_NAME:
+        return None
+    # Widths that are large enough, smallest first, then full width
+    widths = [candidate for candidate in IMAGE_VARIANT_WIDTHS if width and candidate >= width] + [None]
+    for image_format in formats:
+        for candidate in widths:
+            if candidate is None and image_format == "jpeg":
+                return None  # Full-width JPEG is the original
+            variant = image_stat_cache.get(variant_path(info.path, info.version, candidate, image_format))
+            if variant is not None:
+                return variant
+    return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python image_variants.py <combined_images folder>")
+        sys.exit(1)
+    for image_path in sorted(Path(sys.argv[1]).glob("*.jpg")):
+        written = generate_variants(image_path)
+        print(f"✓ {image_path.name}: {len(written)} variants")
@@ -0,0 +1,409 @@
+"""
+Background job pipeline for product search and try-on generation.
+
+`/save-preferences` stores a Job row and hands its id to a runner; the worker
+runs the search and generation stages and records per-stage progress on the
+row, so any API process can report job status. Jobs whose submission fails, or
+whose worker dies, are marked failed so status polls always terminate.
+"""
+
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Dict, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+try:
+    from backend.database import SessionLocal, engine
+    from backend.models import Job
+    from backend.tracing import drain_buffered, record_observations, span, start_buffering
+except ImportError:
+    from database import SessionLocal, engine
+    from models import Job
+    from tracing import drain_buffered, record_observations, span, start_buffering
+
+# Job types
+JOB_TYPE_SEARCH_AND_GENERATE = "search_and_generate"
+
+# Job / stage statuses
+STATUS_QUEUED = "queued"
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+# Stages run by a search_and_generate job, in order
+SEARCH_AND_GENERATE_STAGES = ["search", "generate"]
+
+# Runner configuration
+JOB_RUNNER = os.getenv("JOB_RUNNER", "process")  # 'process' or 'inline'
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# On startup, queued/running jobs whose owning process on this host is gone are marked
+# failed. Jobs from other hosts can't be checked, so they are failed once older than this
+# many seconds; keep it above the longest job run.
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", str(6 * 60 * 60)))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def job_owner() -> str:
+    """Owner tag ("host:pid") recorded on jobs submitted by this process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_is_gone(owner: Optional[str]) -> bool:
+    """True if owner names a process on this host that is no longer running (or is us, restarted)."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if owner == job_owner():
+        # Same host and pid as a previous run (e.g. pid 1 in a restarted container); we haven't
+        # submitted anything yet
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def create_search_and_generate_job(
+    db: Session,
+    user_id: int,
+    user_folder_path: str,
+    query: str,
+    preferences_data: Dict
+) -> Job:
+    """
+    Create a queued search + generate job for a user.
+
+    Args:
+        db: Database session
+        user_id: ID of the user the job belongs to
+        user_folder_path: Absolute path to the user's image folder
+        query: Search query built from the preferences
+        preferences_data: Preferences dict passed through to the search
+
+    Returns:
+        The committed Job row
+    """
+    job = Job(
+        user_id=user_id,
+        job_type=JOB_TYPE_SEARCH_AND_GENERATE,
+        status=STATUS_QUEUED,
+        owner=job_owner(),
+        stages={
+            stage: {"status": STATUS_PENDING, "completed": 0, "total": 0}
+            for stage in SEARCH_AND_GENERATE_STAGES
+        },
+        payload={
+            "user_folder_path": user_folder_path,
+            "query": query,
+            "preferences_data": preferences_data,
+        },
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def submit_job(db: Session, job: Job) -> None:
+    """Hand a committed job to the runner, marking it failed if the runner rejects it."""
+    try:
+        get_job_runner().submit(job.id)
+    except Exception as e:
+        print(f"   ⚠️ Could not submit job {job.id}: {e}")
+        JobProgress(db, job).fail(f"Could not start job: {e}")
+
+
+def fail_job(job_id: int, error: str) -> None:
+    """Mark a job failed from outside its worker (in a new session), unless it already finished."""
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job and job.status in (STATUS_QUEUED, STATUS_RUNNING):
+            JobProgress(db, job).fail(error)
+    finally:
+        db.close()
+
+
+def fail_stale_jobs(older_than: float = JOB_STALE_AFTER) -> int:
+    """
+    Mark queued/running jobs that will never finish as failed: those owned by a
+    process on this host that has exited, and any created more than older_than
+    seconds ago. Run on startup; live processes sharing the database keep their jobs.
+
+    Returns:
+        Number of jobs marked failed
+    """
+    cutoff = _now() - timedelta(seconds=older_than)
+    db = SessionLocal()
+    try:
+        expired = Job.created_at <= cutoff
+        candidates = db.query(Job, expired).filter(
+            Job.status.in_([STATUS_QUEUED, STATUS_RUNNING]),
+            or_(expired, Job.owner.startswith(f"{socket.gethostname()}:"))
+        ).all()
+        stale_jobs = [job for job, is_expired in candidates if is_expired or _owner_is_gone(job.owner)]
+        for job in stale_jobs:
+            JobProgress(db, job).fail("Job was interrupted by a server restart")
+        return len(stale_jobs)
+    finally:
+        db.close()
+
+
+def serialize_job(job: Job) -> Dict:
+    """Convert a Job row into the JSON shape returned by the API."""
+    stages = job.stages or {}
+    return {
+        "job_id": job.id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "stages": [
+            {"name": name, **stages[name]}
+            for name in SEARCH_AND_GENERATE_STAGES
+            if name in stages
+        ],
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def get_user_jobs(db: Session, user_id: int, limit: int = 10) -> List[Job]:
+    """Get the most recent jobs for a user, newest first."""
+    return (
+        db.query(Job)
+        .filter(Job.user_id == user_id)
+        .order_by(Job.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+class JobProgress:
+    """Writes job and stage progress back to the jobs table."""
+
+    def __init__(self, db: Session, job: Job):
+        self.db = db
+        self.job = job
+
+    def update_stage(self, stage: str, status: Optional[str] = None, completed: Optional[int] = None, total: Optional[int] = None):
+        """Update one stage's status/progress and commit."""
+        stages = dict(self.job.stages or {})
+        stage_data = dict(stages.get(stage, {"status": STATUS_PENDING, "completed": 0, "total": 0}))
+        if status is not None:
+            stage_data["status"] = status
+        if completed is not None:
+            stage_data["completed"] = completed
+        if total is not None:
+            stage_data["total"] = total
+        stages[stage] = stage_data
+        # Reassign so SQLAlchemy picks up the JSON change
+        self.job.stages = stages
+        self.db.commit()
+
+    def start(self):
+        self.job.status = STATUS_RUNNING
+        self.job.started_at = _now()
+        self.db.commit()
+
+    def complete(self, result: Dict):
+        self.job.status = STATUS_COMPLETED
+        self.job.result = result
+        self.job.finished_at = _now()
+        self.db.commit()
+
+    def fail(self, error: str):
+        self.db.rollback()
+        stages = dict(self.job.stages or {})
+        for stage, stage_data in stages.items():
+            if stage_data.get("status") == STATUS_RUNNING:
+                stages[stage] = {**stage_data, "status": STATUS_FAILED}
+        self.job.stages = stages
+        self.job.status = STATUS_FAILED
+        self.job.error = error
+        self.job.finished_at = _now()
+        self.db.commit()
+
+
+def run_search_and_generate_job(job_id: int) -> List:
+    """
+    Worker entry point: run a job under a "job" span.
+
+    Returns:
+        Stage timings buffered by a worker process, for the parent to record
+    """
+    with span("job", job_id=job_id):
+        _run_search_and_generate_job(job_id)
+    return drain_buffered()
+
+
+def _run_search_and_generate_job(job_id: int) -> None:
+    """
+    Run the search and generation stages for a job.
+    Opens its own database session so it can run in a separate process.
+    """
+    try:
+        from backend.search_products import scrape_house_of_fraser
+        from backend.generate_images import generate_combined_images_for_all_products
+        from backend.image_cache import tryon_cache
+        from backend.swiping_system import invalidate_product_index
+    except ImportError:
+        from search_products import scrape_house_of_fraser
+        from generate_images import generate_combined_images_for_all_products
+        from image_cache import tryon_cache
+        from swiping_system import invalidate_product_index
+
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if not job:
+            print(f"   ⚠️ Job {job_id} not found")
+            return
+
+        progress = JobProgress(db, job)
+        payload = job.payload or {}
+        user_folder_path = payload.get("user_folder_path")
+        query = payload.get("query")
+        preferences_data = payload.get("preferences_data") or {}
+
+        try:
+            progress.start()
+
+            # Stage 1: search for products (also downloads thumbnails and saves to DB)
+            progress.update_stage("search", status=STATUS_RUNNING, total=1)
+            search_results = []
+            if query:
+                search_results = scrape_house_of_fraser(
+                    query,
+                    user_folder_path,
+                    db=db,
+                    preferences_data=preferences_data,
+                    user_id=job.user_id
+                )
+            progress.update_stage("search", status=STATUS_COMPLETED, completed=1)
+
+            # Stage 2: generate combined try-on images
+            generated_count = 0
+            cache_before = tryon_cache.stats()
+            if search_results:
+                progress.update_stage("generate", status=STATUS_RUNNING, total=len(search_results) * 3)
+
+                def on_progress(completed: int, total: int):
+                    progress.update_stage("generate", completed=completed, total=total)
+
+                print(f"Generating combined images for {len(search_results)} products...")
+                generated_images = generate_combined_images_for_all_products(
+                    user_folder_path,
+                    progress_callback=on_progress
+                )
+                generated_count = sum(
+                    1 for angles in generated_images.values() for path in angles.values() if path
+                )
+                print(f"Generated {generated_count} combined images")
+                progress.update_stage("generate", status=STATUS_COMPLETED)
+            else:
+                progress.update_stage("generate", status=STATUS_SKIPPED)
+
+            # Other processes notice the new files via products.json/combined_images mtimes
+            if user_folder_path:
+                invalidate_product_index(os.path.basename(os.path.normpath(user_folder_path)))
+
+            cache_after = tryon_cache.stats()
+            progress.complete({
+                "products_count": len(search_results),
+                "generated_images": generated_count,
+                "cache_hits": cache_after["hits"] - cache_before["hits"],
+                "cache_misses": cache_after["misses"] - cache_before["misses"],
+            })
+        except Exception as e:
+            print(f"   ⚠️ Job {job_id} failed: {e}")
+            progress.fail(str(e))
+    finally:
+        db.close()
+
+
+def _init_worker_process():
+    """Drop pooled connections inherited from the parent process, and buffer stage timings for it."""
+    engine.dispose(close=False)
+    start_buffering()
+
+
+class InProcessJobRunner:
+    """Runs jobs synchronously in the calling process (for tests and local debugging)."""
+
+    def submit(self, job_id: int):
+        run_search_and_generate_job(job_id)
+
+    def shutdown(self):
+        pass
+
+
+class ProcessPoolJobRunner:
+    """Runs jobs on a local process pool."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker_process
+        )
+
+    def submit(self, job_id: int):
+        future = self.executor.submit(run_search_and_generate_job, job_id)
+        future.add_done_callback(partial(self._on_job_done, job_id))
+
+    @staticmethod
+    def _on_job_done(job_id: int, future):
+        if future.cancelled():
+            fail_job(job_id, "Job was cancelled")
+            return
+        error = future.exception()
+        if error:
+            print(f"   ⚠️ Job worker crashed: {error}")
+            fail_job(job_id, f"Job worker crashed: {error}")
+            return
+        # The worker's registry is never scraped; record its stage timings here
+        record_observations(future.result() or [])
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_job_runner = None
+
+
+def get_job_runner():
+    """Get the configured job runner (created on first use)."""
+    global _job_runner
+    if _job_runner is None:
+        if JOB_RUNNER == "inline":
+            _job_runner = InProcessJobRunner()
+        else:
+            _job_runner = ProcessPoolJobRunner()
+    return _job_runner
+
+
+def set_job_runner(runner) -> None:
+    """Replace the job runner (e.g. with an InProcessJobRunner in tests)."""
+    global _job_runner
+    _job_runner = runner
+
+
+def shutdown_job_runner() -> None:
+    """Shut down the active job runner, if any."""
+    global _job_runner
+    if _job_runner is not None:
+        _job_runner.shutdown()
+        _job_runner = None
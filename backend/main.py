@@ -1,35 +1,68 @@
-from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Response
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
 from sqlalchemy.orm import Session
 import os
-import io
 from pathlib import Path
 import json
+import math
 import uvicorn
 import time
-from PIL import Image
 
 # Handle imports whether running from backend/ or project root
 try:
-    from search_products import scrape_house_of_fraser
-    from generate_images import generate_combined_images_for_all_products
-    from swiping_system import SwipingSystem
-    from database import get_db, init_db
-    from models import User, UserImage, Preference, Product, ProductClick
-    from metrics import get_metrics
+    from swiping_system import SwipingSystem, shutdown_liked_photo_executor
+    from database import engine, get_db, init_db
+    from models import UserImage, Preference, Product, ProductClick, Job
+    from metrics import get_metrics, metrics_collector
+    from migrations import run_startup_migrations
+    from request_metrics import RequestMetricsMiddleware, instrument_engine
+    from jobs import (
+        create_search_and_generate_job, fail_stale_jobs, get_user_jobs,
+        serialize_job, shutdown_job_runner, submit_job
+    )
+    from user_resolver import folder_name, resolve_user_id, user_resolver
+    from image_serving import image_response, image_stat_cache, resolve_image_path
+    from image_variants import accepted_formats, has_variants, select_variant
+    from upload_processing import (
+        UploadBusyError, UploadRejectedError, UploadSizeLimitMiddleware, upload_compressor, validate_upload
+    )
+    from metric_counters import (
+        CLICKS, CLICKS_BY_TYPE, ensure_metric_counters, increment_counters, label_for, preference_deltas
+    )
 except ModuleNotFoundError:
-    from backend.search_products import scrape_house_of_fraser
-    from backend.generate_images import generate_combined_images_for_all_products
-    from backend.swiping_system import SwipingSystem
-    from backend.database import get_db, init_db
-    from backend.models import User, UserImage, Preference, Product, ProductClick
-    from backend.metrics import get_metrics
+    from backend.swiping_system import SwipingSystem, shutdown_liked_photo_executor
+    from backend.database import engine, get_db, init_db
+    from backend.models import UserImage, Preference, Product, ProductClick, Job
+    from backend.metrics import get_metrics, metrics_collector
+    from backend.migrations import run_startup_migrations
+    from backend.request_metrics import RequestMetricsMiddleware, instrument_engine
+    from backend.jobs import (
+        create_search_and_generate_job, fail_stale_jobs, get_user_jobs,
+        serialize_job, shutdown_job_runner, submit_job
+    )
+    from backend.user_resolver import folder_name, resolve_user_id, user_resolver
+    from backend.image_serving import image_response, image_stat_cache, resolve_image_path
+    from backend.image_variants import accepted_formats, has_variants, select_variant
+    from backend.upload_processing import (
+        UploadBusyError, UploadRejectedError, UploadSizeLimitMiddleware, upload_compressor, validate_upload
+    )
+    from backend.metric_counters import (
+        CLICKS, CLICKS_BY_TYPE, ensure_metric_counters, increment_counters, label_for, preference_deltas
+    )
 
 app = FastAPI(title="StyleSwipe API", version="2.0.0")
 
+# Reject oversized uploads from Content-Length before the multipart body is parsed.
+# Added before CORS (the last-added middleware is outermost), so its 413 carries
+# CORS headers and the browser lets the frontend read it.
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # Enable CORS to allow frontend to communicate with backend
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +72,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request count/latency/in-flight and per-request DB time (see request_metrics.py)
+app.add_middleware(RequestMetricsMiddleware)
+instrument_engine(engine)
+
 # Define the base directory for storing images
 BASE_DIR = Path(__file__).parent.parent
 IMAGES_DIR = BASE_DIR / "data" / "user_images"
@@ -46,68 +83,38 @@ IMAGES_DIR = BASE_DIR / "data" / "user_images"
 # Create the directory if it doesn't exist
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
-# Image compression settings
-MAX_IMAGE_SIZE = 1024  # Max dimension in pixels for user images
-IMAGE_QUALITY = 90  # JPEG quality (higher for user images since they're important)
-
-
-def compress_image(image_data: bytes, save_path: Path, max_size: int = MAX_IMAGE_SIZE, quality: int = IMAGE_QUALITY) -> dict:
-    """
-    Compress an uploaded image using Pillow.
-    
-    Args:
-        image_data: Raw image bytes
-        save_path: Path where to save the compressed image
-        max_size: Maximum dimension (width or height) in pixels
-        quality: JPEG quality 1-100
-    
-    Returns:
-        Dict with compression stats
-    """
-    original_size = len(image_data)
-    
-    # Open image with Pillow
-    img = Image.open(io.BytesIO(image_data))
-    original_dimensions = img.size
-    
-    # Convert to RGB if necessary (handles RGBA, P mode, etc.)
-    if img.mode in ('RGBA', 'P', 'LA'):
-        # Create white background for transparent images
-        background = Image.new('RGB', img.size, (255, 255, 255))
-        if img.mode == 'P':
-            img = img.convert('RGBA')
-        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-        img = background
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # Resize if larger than max_size (maintain aspect ratio)
-    if img.width > max_size or img.height > max_size:
-        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-    
-    # Save as compressed JPEG
-    # Always save as .jpg for consistency
-    save_path = save_path.with_suffix('.jpg')
-    img.save(save_path, 'JPEG', quality=quality, optimize=True)
-    
-    compressed_size = save_path.stat().st_size
-    reduction = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
-    
-    return {
-        "path": save_path,
-        "original_size": original_size,
-        "compressed_size": compressed_size,
-        "reduction_percent": reduction,
-        "original_dimensions": original_dimensions,
-        "new_dimensions": img.size
-    }
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    """422 like FastAPI's default, echoing non-finite numbers (which JSON can't carry) as strings."""
+    errors = [
+        {**error, "input": str(error["input"])}
+        if isinstance(error.get("input"), float) and not math.isfinite(error["input"]) else error
+        for error in exc.errors()
+    ]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
     init_db()
+    # Unique indexes and columns older databases lack (see migrations.py)
+    run_startup_migrations()
+    ensure_metric_counters()
     print("Database initialized")
+    stale_jobs = fail_stale_jobs()
+    if stale_jobs:
+        print(f"Marked {stale_jobs} interrupted jobs as failed")
+    metrics_collector.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background job workers."""
+    await metrics_collector.stop()
+    shutdown_job_runner()
+    shutdown_liked_photo_executor()
+    upload_compressor.shutdown()
 
 
 def build_search_query(preferences_data: Dict) -> str:
@@ -149,6 +156,7 @@ async def metrics():
     """
     Prometheus metrics endpoint.
     Exposes application metrics for Grafana/Alloy scraping.
+    Gauges are refreshed by the background collector, not per scrape.
     """
     metrics_output, content_type = get_metrics()
     return Response(content=metrics_output, media_type=content_type)
@@ -165,8 +173,26 @@ async def upload_images(
     """
     Upload three images (front, side, back) for a user.
     Creates user in database and saves image paths.
+    Returns 413/415 for oversized or non-image files, and 503 when every upload
+    slot stays busy for UPLOAD_QUEUE_TIMEOUT seconds.
     """
     try:
+        await upload_compressor.acquire_slot()
+    except UploadBusyError as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
+    
+    try:
+        # Define image types and their corresponding files
+        image_types = {
+            "front": front,
+            "side": side,
+            "back": back
+        }
+        
+        # Check size and format of all three before creating anything
+        for image_type, file in image_types.items():
+            validate_upload(file.file, image_type)
+        
         # Generate user folder name
         if user_id:
             user_folder_name = user_id
@@ -179,33 +205,27 @@ async def upload_images(
         user_folder.mkdir(parents=True, exist_ok=True)
         
         # Get or create user in database
-        user = db.query(User).filter(User.user_folder == user_folder_name).first()
-        if not user:
-            user = User(user_folder=user_folder_name)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        
-        # Define image types and their corresponding files
-        image_types = {
-            "front": front,
-            "side": side,
-            "back": back
-        }
+        user_id = user_resolver.resolve(db, user_folder_name, create=True)
         
         saved_files = {}
         compression_stats = {}
+        unchanged = []
+        similar = []
         
-        # Save and compress each image
-        for image_type, file in image_types.items():
-            # Create file path (will be saved as .jpg after compression)
-            file_path = user_folder / f"{image_type}.jpg"
-            
-            # Read the file
-            contents = await file.read()
-            
-            # Compress and save the image
-            stats = compress_image(contents, file_path)
+        # Perceptual hash of the latest stored photo per angle, to spot re-uploads
+        previous_hashes = {}
+        for image in db.query(UserImage).filter(UserImage.user_id == user_id).order_by(UserImage.id):
+            if image.perceptual_hash:
+                previous_hashes[image.angle] = image.perceptual_hash
+        
+        # Compress and save all three in parallel, off the event loop, decoding
+        # straight from the spooled uploads (saved as .jpg after compression)
+        all_stats = await upload_compressor.compress_all({
+            image_type: (file.file, user_folder / f"{image_type}.jpg")
+            for image_type, file in image_types.items()
+        }, previous_hashes)
+        
+        for image_type, stats in all_stats.items():
             file_path = stats["path"]  # Get the actual saved path (.jpg)
             
             saved_files[image_type] = str(file_path.relative_to(BASE_DIR))
@@ -216,13 +236,24 @@ async def upload_images(
                 "dimensions": f"{stats['new_dimensions'][0]}x{stats['new_dimensions'][1]}"
             }
             
+            if stats["duplicate"]:
+                # Byte-identical to the stored photo: the file and its row are kept,
+                # so try-on images for it come from the cache
+                unchanged.append(image_type)
+                print(f"   ♻️ {image_type}: same photo as the stored one, kept")
+                continue
+            if stats["similar"]:
+                # Looks alike but isn't identical: stored as a new photo, only reported
+                similar.append(image_type)
+            
             print(f"   📦 {image_type}: {stats['original_size']/1024:.1f}KB → {stats['compressed_size']/1024:.1f}KB ({stats['reduction_percent']:.0f}% reduction)")
             
             # Save to database
             user_image = UserImage(
-                user_id=user.id,
+                user_id=user_id,
                 angle=image_type,
-                image_path=str(file_path.relative_to(BASE_DIR))
+                image_path=str(file_path.relative_to(BASE_DIR)),
+                perceptual_hash=stats["perceptual_hash"]
             )
             db.add(user_image)
         
@@ -233,17 +264,24 @@ async def upload_images(
             content={
                 "message": "Images uploaded and compressed successfully",
                 "user_folder": str(user_folder.relative_to(BASE_DIR)),
-                "user_id": user.id,
+                "user_id": user_id,
                 "saved_files": saved_files,
-                "compression": compression_stats
+                "compression": compression_stats,
+                "unchanged": unchanged,
+                "similar": similar
             }
         )
     
+    except UploadRejectedError as e:
+        db.rollback()
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": f"Failed to upload images: {str(e)}"}
         )
+    finally:
+        upload_compressor.release_slot()
 
 
 # Pydantic model for preferences
@@ -264,22 +302,24 @@ async def save_preferences(
     db: Session = Depends(get_db)
 ):
     """
-    Save user clothing preferences to database.
+    Save user clothing preferences to database and queue a background job
+    that searches for products and generates try-on images.
     """
     try:
         # Get user from database
-        user_folder_name = preferences.user_folder.split("/")[-1]
-        user = db.query(User).filter(User.user_folder == user_folder_name).first()
+        user_id = user_resolver.resolve(db, folder_name(preferences.user_folder))
         
-        if not user:
+        if user_id is None:
             return JSONResponse(
                 status_code=404,
                 content={"error": "User not found. Please upload images first."}
             )
         
         # Get or create preferences
-        pref = db.query(Preference).filter(Preference.user_id == user.id).first()
+        pref = db.query(Preference).filter(Preference.user_id == user_id).first()
+        old_preferences = None
         if pref:
+            old_preferences = {"gender": pref.gender, "size": pref.size, "styles": pref.styles}
             # Update existing
             pref.gender = preferences.gender
             pref.size = preferences.size
@@ -291,7 +331,7 @@ async def save_preferences(
         else:
             # Create new
             pref = Preference(
-                user_id=user.id,
+                user_id=user_id,
                 gender=preferences.gender,
                 size=preferences.size,
                 styles=preferences.styles,
@@ -302,6 +342,9 @@ async def save_preferences(
             )
             db.add(pref)
         
+        increment_counters(db, preference_deltas(old_preferences, {
+            "gender": preferences.gender, "size": preferences.size, "styles": preferences.styles
+        }))
         db.commit()
         db.refresh(pref)
         
@@ -316,34 +359,19 @@ async def save_preferences(
             "notes": preferences.notes
         }
         
-        # Search for products and save to database
+        # Queue product search + try-on generation as a background job
         user_folder_path = BASE_DIR / preferences.user_folder
-        search_results = []
-        
-        try:
-            query = build_search_query(preferences_data)
-            if query:
-                # This will save products to database via search_products.py
-                search_results = scrape_house_of_fraser(
-                    query, 
-                    str(user_folder_path), 
-                    db=db,
-                    preferences_data=preferences_data
-                )
-            
-            # Generate combined images
-            if search_results:
-                try:
-                    print(f"Generating combined images for {len(search_results)} products...")
-                    generated_images = generate_combined_images_for_all_products(str(user_folder_path))
-                    print(f"Generated {sum(len(v) for v in generated_images.values())} combined images")
-                except Exception as gen_error:
-                    print(f"Image generation error (non-fatal): {gen_error}")
-        except Exception as search_error:
-            print(f"Search error (non-fatal): {search_error}")
+        job = create_search_and_generate_job(
+            db,
+            user_id,
+            str(user_folder_path),
+            build_search_query(preferences_data),
+            preferences_data
+        )
+        submit_job(db, job)
         
         return JSONResponse(
-            status_code=200,
+            status_code=202,
             content={
                 "message": "Preferences saved successfully",
                 "preferences": {
@@ -355,8 +383,8 @@ async def save_preferences(
                     "colors": pref.colors,
                     "notes": pref.notes
                 },
-                "recommended_products": search_results,
-                "products_count": len(search_results)
+                "job_id": job.id,
+                "job_status_url": f"/api/jobs/{job.id}"
             }
         )
     
@@ -367,6 +395,54 @@ async def save_preferences(
         )
 
 
+# ==================== JOB STATUS ENDPOINTS ====================
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: int, db: Session = Depends(get_db)):
+    """Get the status and per-stage progress of a background job."""
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if not job:
+            return JSONResponse(
+                status_code=404,
+                content={"error": "Job not found"}
+            )
+        return JSONResponse(
+            status_code=200,
+            content=serialize_job(job)
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+
+@app.get("/api/jobs/user/{user_folder:path}")
+async def get_user_job_list(user_folder: str, db: Session = Depends(get_db)):
+    """Get recent background jobs for a user, newest first."""
+    try:
+        user_id = user_resolver.resolve(db, folder_name(user_folder))
+        if user_id is None:
+            return JSONResponse(
+                status_code=404,
+                content={"error": "User not found"}
+            )
+        jobs = [serialize_job(job) for job in get_user_jobs(db, user_id)]
+        return JSONResponse(
+            status_code=200,
+            content={
+                "jobs": jobs,
+                "total": len(jobs)
+            }
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+
 # ==================== SWIPING SYSTEM ENDPOINTS ====================
 
 class SwipeRequest(BaseModel):
@@ -374,13 +450,36 @@ class SwipeRequest(BaseModel):
     liked: bool
 
 
+# Latest client_timestamp a datetime can hold (9999-12-31T23:59:59Z); milliseconds are far above it
+MAX_CLIENT_TIMESTAMP = 253402300799
+
+
+class SwipeBatchItem(BaseModel):
+    product_id: int
+    liked: bool
+    # Seconds since epoch, when the user swiped; out-of-range or non-finite values get a 422
+    client_timestamp: Optional[float] = Field(None, ge=0, le=MAX_CLIENT_TIMESTAMP, allow_inf_nan=False)
+
+
+class SwipeBatchRequest(BaseModel):
+    batch_id: str  # Idempotency key; retries must reuse it
+    swipes: List[SwipeBatchItem]
+
+
+MAX_SWIPE_BATCH_SIZE = 500
+
+
 @app.get("/api/swipe/{user_folder:path}/products")
-async def get_swipe_products(user_folder: str, db: Session = Depends(get_db)):
+async def get_swipe_products(
+    user_folder: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(resolve_user_id)
+):
     """Get all products available for swiping."""
     try:
-        user_folder_name = user_folder.split("/")[-1]
-        swiper = SwipingSystem(user_folder_name, db)
-        products = swiper.get_products()
+        swiper = SwipingSystem(folder_name(user_folder), db, user_id=user_id)
+        # Presenting products stats and may hash image files; keep that off the event loop
+        products = await run_in_threadpool(swiper.get_products)
         return JSONResponse(
             status_code=200,
             content={
@@ -396,12 +495,15 @@ async def get_swipe_products(user_folder: str, db: Session = Depends(get_db)):
 
 
 @app.get("/api/swipe/{user_folder:path}/next")
-async def get_next_product(user_folder: str, db: Session = Depends(get_db)):
+async def get_next_product(
+    user_folder: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(resolve_user_id)
+):
     """Get the next product to swipe on."""
     try:
-        user_folder_name = user_folder.split("/")[-1]
-        swiper = SwipingSystem(user_folder_name, db)
-        product = swiper.get_next_product()
+        swiper = SwipingSystem(folder_name(user_folder), db, user_id=user_id)
+        product = await run_in_threadpool(swiper.get_next_product)
         status = swiper.get_swipe_status()
         
         return JSONResponse(
@@ -422,13 +524,44 @@ async def get_next_product(user_folder: str, db: Session = Depends(get_db)):
 async def swipe_action(
     user_folder: str,
     swipe: SwipeRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user_id: int = Depends(resolve_user_id)
 ):
     """Record a swipe action (like/dislike)."""
     try:
-        user_folder_name = user_folder.split("/")[-1]
-        swiper = SwipingSystem(user_folder_name, db)
-        result = swiper.swipe(swipe.product_id, swipe.liked)
+        swiper = SwipingSystem(folder_name(user_folder), db, user_id=user_id)
+        result = await run_in_threadpool(swiper.swipe, swipe.product_id, swipe.liked)
+        return JSONResponse(
+            status_code=200,
+            content=result
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+
+@app.post("/api/swipe/{user_folder:path}/batch")
+async def swipe_batch(
+    user_folder: str,
+    batch: SwipeBatchRequest,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(resolve_user_id)
+):
+    """Record an ordered batch of swipes in one transaction (idempotent per batch_id)."""
+    try:
+        if len(batch.swipes) > MAX_SWIPE_BATCH_SIZE:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Batch too large (max {MAX_SWIPE_BATCH_SIZE} swipes)"}
+            )
+        swiper = SwipingSystem(folder_name(user_folder), db, user_id=user_id)
+        swipes = [
+            {"product_id": item.product_id, "liked": item.liked, "client_timestamp": item.client_timestamp}
+            for item in batch.swipes
+        ]
+        result = await run_in_threadpool(swiper.swipe_batch, batch.batch_id, swipes)
         return JSONResponse(
             status_code=200,
             content=result
@@ -441,11 +574,14 @@ async def swipe_action(
 
 
 @app.get("/api/swipe/{user_folder:path}/status")
-async def get_swipe_status(user_folder: str, db: Session = Depends(get_db)):
+async def get_swipe_status(
+    user_folder: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(resolve_user_id)
+):
     """Get current swiping status."""
     try:
-        user_folder_name = user_folder.split("/")[-1]
-        swiper = SwipingSystem(user_folder_name, db)
+        swiper = SwipingSystem(folder_name(user_folder), db, user_id=user_id)
         status = swiper.get_swipe_status()
         return JSONResponse(
             status_code=200,
@@ -459,12 +595,15 @@ async def get_swipe_status(user_folder: str, db: Session = Depends(get_db)):
 
 
 @app.get("/api/swipe/{user_folder:path}/liked")
-async def get_liked_products(user_folder: str, db: Session = Depends(get_db)):
+async def get_liked_products(
+    user_folder: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(resolve_user_id)
+):
     """Get all liked products."""
     try:
-        user_folder_name = user_folder.split("/")[-1]
-        swiper = SwipingSystem(user_folder_name, db)
-        liked = swiper.get_liked_products()
+        swiper = SwipingSystem(folder_name(user_folder), db, user_id=user_id)
+        liked = await run_in_threadpool(swiper.get_liked_products)
         return JSONResponse(
             status_code=200,
             content={
@@ -480,11 +619,14 @@ async def get_liked_products(user_folder: str, db: Session = Depends(get_db)):
 
 
 @app.post("/api/swipe/{user_folder:path}/reset")
-async def reset_swipes(user_folder: str, db: Session = Depends(get_db)):
+async def reset_swipes(
+    user_folder: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(resolve_user_id)
+):
     """Reset all swipe data."""
     try:
-        user_folder_name = user_folder.split("/")[-1]
-        swiper = SwipingSystem(user_folder_name, db)
+        swiper = SwipingSystem(folder_name(user_folder), db, user_id=user_id)
         result = swiper.reset_swipes()
         return JSONResponse(
             status_code=200,
@@ -517,13 +659,10 @@ async def track_product_click(
     try:
         user_id = None
         if user_folder:
-            user_folder_name = user_folder.split("/")[-1]
-            user = db.query(User).filter(User.user_folder == user_folder_name).first()
-            if user:
-                user_id = user.id
+            user_id = user_resolver.resolve(db, folder_name(user_folder))
         
         # Verify product exists
-        product = db.query(Product).filter(Product.id == click.product_id).first()
+        product = db.get(Product, click.product_id)
         if not product:
             return JSONResponse(
                 status_code=404,
@@ -537,6 +676,7 @@ async def track_product_click(
             referrer=click.referrer or "unknown"
         )
         db.add(product_click)
+        increment_counters(db, {(CLICKS, ""): 1, (CLICKS_BY_TYPE, label_for(product.product_type)): 1})
         db.commit()
         
         return JSONResponse(
@@ -555,25 +695,17 @@ async def track_product_click(
 
 
 @app.get("/api/image/{full_path:path}")
-async def serve_image(full_path: str):
-    """Serve an image file from data directory."""
+async def serve_image(full_path: str, request: Request, v: Optional[str] = None, w: Optional[int] = None):
+    """
+    Serve an image file from data directory.
+    Supports If-None-Match/If-Modified-Since (304) and single byte ranges (206);
+    ?v=<version> URLs are cached as immutable (see image_serving.py).
+    ?w=<pixels> and the Accept header select a smaller or WebP/AVIF variant
+    when one exists (see image_variants.py).
+    """
     try:
-        # Handle both cases - with or without "data/user_images/" prefix
-        if full_path.startswith("data/user_images/"):
-            relative_path = full_path.replace("data/user_images/", "", 1)
-            image_path = IMAGES_DIR / relative_path
-        elif full_path.startswith("user_"):
-            image_path = IMAGES_DIR / full_path
-        else:
-            image_path = BASE_DIR / "data" / "user_images" / full_path
-        
-        if not image_path.exists():
-            return JSONResponse(
-                status_code=404,
-                content={"error": f"Image not found: {image_path}"}
-            )
-        
-        return FileResponse(str(image_path))
+        # Stat calls and content hashing (for ETags) run off the event loop
+        return await run_in_threadpool(_image_file_response, full_path, request, v, w)
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -581,5 +713,21 @@ async def serve_image(full_path: str):
         )
 
 
+def _image_file_response(full_path: str, request: Request, v: Optional[str], w: Optional[int]) -> Response:
+    # Handles paths with or without the "data/user_images/" prefix
+    image_path = resolve_image_path(IMAGES_DIR, full_path)
+    info = image_stat_cache.get(image_path) if image_path else None
+    
+    if info is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Image not found: {full_path}"}
+        )
+    
+    variant = select_variant(info, w, accepted_formats(request.headers.get("accept")))
+    if variant is not None:
+        return image_response(request, variant, version=v, source=info, vary_accept=True)
+    return image_response(request, info, version=v, vary_accept=has_variants(info))
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
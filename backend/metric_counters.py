@@ -0,0 +1,170 @@
+"""
+Incrementally maintained aggregate counters for /metrics.
+
+Writes that change a metric (user creation, preference saves, catalog
+upserts, swipes, likes and clicks) add their deltas to the metric_counters
+table in the same transaction, so a scrape reads one small table instead of
+aggregating every swipe. rebuild_metric_counters() recomputes everything
+from the source tables (run by the migrations and on first startup).
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+try:
+    from backend.database import SessionLocal, get_insert
+    from backend.models import MetricCounter, User, Preference, Product, Swipe, LikedProduct, ProductClick
+except ImportError:
+    from database import SessionLocal, get_insert
+    from models import MetricCounter, User, Preference, Product, Swipe, LikedProduct, ProductClick
+
+# Metric names stored in metric_counters.metric
+USERS = "users"
+USERS_BY_GENDER = "users_by_gender"
+USERS_BY_SIZE = "users_by_size"
+STYLE_POPULARITY = "style_popularity"
+PRODUCTS = "products"
+PRODUCTS_BY_TYPE = "products_by_type"
+SWIPES = "swipes"  # Labels: 'liked', 'disliked'
+LIKED_PRODUCTS_BY_TYPE = "liked_products_by_type"
+CLICKS = "clicks"
+CLICKS_BY_TYPE = "clicks_by_type"
+
+# (metric, label) -> value or delta
+Counters = Dict[Tuple[str, str], int]
+
+
+def label_for(value: Optional[str]) -> str:
+    """Label used for a nullable column value (matches the Prometheus labels)."""
+    return value if value else "unknown"
+
+
+def swipe_label(liked: bool) -> str:
+    return "liked" if liked else "disliked"
+
+
+def add_delta(deltas: Counters, metric: str, label: str = "", amount: int = 1):
+    key = (metric, label)
+    deltas[key] = deltas.get(key, 0) + amount
+
+
+def preference_deltas(old: Optional[Dict], new: Dict) -> Counters:
+    """
+    Counter changes for creating (old is None) or updating a user's preferences.
+
+    Args:
+        old: Previous gender/size/styles, or None for a new preference row
+        new: New gender/size/styles
+    """
+    deltas: Counters = {}
+    for prefs, sign in ((old, -1), (new, 1)):
+        if prefs is None:
+            continue
+        add_delta(deltas, USERS_BY_GENDER, label_for(prefs.get("gender")), sign)
+        add_delta(deltas, USERS_BY_SIZE, label_for(prefs.get("size")), sign)
+        for style in prefs.get("styles") or []:
+            add_delta(deltas, STYLE_POPULARITY, style, sign)
+    return deltas
+
+
+def increment_counters(db: Session, deltas: Counters):
+    """
+    Add deltas to the counters in the caller's transaction (does not commit).
+    Keys are written in sorted order so concurrent writers lock rows consistently.
+    """
+    rows = [
+        {"metric": metric, "label": label, "value": amount}
+        for (metric, label), amount in sorted(deltas.items())
+        if amount
+    ]
+    if not rows:
+        return
+
+    dialect_insert = get_insert(db)
+    if dialect_insert is None:
+        for row in rows:
+            counter = db.query(MetricCounter).filter(
+                MetricCounter.metric == row["metric"], MetricCounter.label == row["label"]
+            ).with_for_update().first()
+            if counter:
+                counter.value += row["value"]
+            else:
+                db.add(MetricCounter(**row))
+        return
+
+    table = MetricCounter.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["metric", "label"],
+        set_={"value": table.c.value + stmt.excluded.value}
+    )
+    db.execute(stmt, rows)
+
+
+def read_counters(db: Session) -> Dict[str, Dict[str, int]]:
+    """Read every counter with one query, as {metric: {label: value}}."""
+    counters: Dict[str, Dict[str, int]] = {}
+    for metric, label, value in db.query(MetricCounter.metric, MetricCounter.label, MetricCounter.value):
+        counters.setdefault(metric, {})[label] = value
+    return counters
+
+
+def compute_metric_counters(db: Session) -> Counters:
+    """Compute every counter from the source tables (full aggregate queries)."""
+    counters: Counters = {}
+
+    def add_grouped(metric: str, rows: Iterable):
+        for label, count in rows:
+            add_delta(counters, metric, label_for(label), count)
+
+    counters[(USERS, "")] = db.query(func.count(User.id)).scalar()
+    add_grouped(USERS_BY_GENDER, db.query(Preference.gender, func.count(Preference.id)).group_by(Preference.gender))
+    add_grouped(USERS_BY_SIZE, db.query(Preference.size, func.count(Preference.id)).group_by(Preference.size))
+    for (styles,) in db.query(Preference.styles):
+        for style in styles or []:
+            add_delta(counters, STYLE_POPULARITY, style)
+
+    counters[(PRODUCTS, "")] = db.query(func.count(Product.id)).scalar()
+    add_grouped(PRODUCTS_BY_TYPE, db.query(Product.product_type, func.count(Product.id)).group_by(Product.product_type))
+
+    for liked, count in db.query(Swipe.liked, func.count(Swipe.id)).group_by(Swipe.liked):
+        add_delta(counters, SWIPES, swipe_label(liked), count)
+    add_grouped(LIKED_PRODUCTS_BY_TYPE, db.query(
+        Product.product_type, func.count(LikedProduct.id)
+    ).join(LikedProduct, Product.id == LikedProduct.product_id).group_by(Product.product_type))
+
+    counters[(CLICKS, "")] = db.query(func.count(ProductClick.id)).scalar()
+    add_grouped(CLICKS_BY_TYPE, db.query(
+        Product.product_type, func.count(ProductClick.id)
+    ).join(ProductClick, Product.id == ProductClick.product_id).group_by(Product.product_type))
+
+    return counters
+
+
+def rebuild_metric_counters(db: Session) -> Dict[str, int]:
+    """
+    Replace the counters with freshly computed values.
+
+    Returns:
+        Number of counter rows written
+    """
+    counters = compute_metric_counters(db)
+    db.query(MetricCounter).delete()
+    if counters:
+        db.bulk_insert_mappings(MetricCounter, [
+            {"metric": metric, "label": label, "value": value}
+            for (metric, label), value in sorted(counters.items())
+        ])
+    db.commit()
+    return {"metric_counters": len(counters)}
+
+
+def ensure_metric_counters():
+    """Build the counters on first startup (e.g. for a database created before they existed)."""
+    db = SessionLocal()
+    try:
+        if db.query(MetricCounter.id).first() is None:
+            rebuild_metric_counters(db)
+    finally:
+        db.close()
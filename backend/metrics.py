@@ -1,22 +1,37 @@
 """
 Prometheus metrics for StyleSwipe application.
 Exposes custom application metrics for Grafana dashboards.
+
+Database-backed gauges are refreshed by a background collector on its own
+interval, so a scrape only serializes the registry.
 """
 
+import asyncio
+import os
+import threading
+import time
 from prometheus_client import (
     Counter, Gauge, Histogram, 
     generate_latest, CONTENT_TYPE_LATEST,
     CollectorRegistry, REGISTRY
 )
+from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func as sql_func
 
 try:
-    from backend.models import User, Preference, Product, Swipe, LikedProduct, ProductClick
     from backend.database import SessionLocal
+    from backend.metric_counters import (
+        CLICKS, CLICKS_BY_TYPE, LIKED_PRODUCTS_BY_TYPE, PRODUCTS, PRODUCTS_BY_TYPE,
+        STYLE_POPULARITY, SWIPES, USERS, USERS_BY_GENDER, USERS_BY_SIZE,
+        label_for, read_counters
+    )
 except ImportError:
-    from models import User, Preference, Product, Swipe, LikedProduct, ProductClick
     from database import SessionLocal
+    from metric_counters import (
+        CLICKS, CLICKS_BY_TYPE, LIKED_PRODUCTS_BY_TYPE, PRODUCTS, PRODUCTS_BY_TYPE,
+        STYLE_POPULARITY, SWIPES, USERS, USERS_BY_GENDER, USERS_BY_SIZE,
+        label_for, read_counters
+    )
 
 
 # ==================== GAUGES (current state) ====================
@@ -94,126 +109,211 @@ styleswipe_style_popularity = Gauge(
     ['style']
 )
 
+# Collector health
+styleswipe_metrics_collection_duration_seconds = Gauge(
+    'styleswipe_metrics_collection_duration_seconds',
+    'Time taken by the last metrics collection'
+)
+
+styleswipe_metrics_staleness_seconds = Gauge(
+    'styleswipe_metrics_staleness_seconds',
+    'Seconds since the database-backed metrics were last collected (+Inf before the first collection)'
+)
+
 # ==================== COUNTERS (cumulative) ====================
 
+styleswipe_metrics_collection_errors = Counter(
+    'styleswipe_metrics_collection_errors_total',
+    'Failed background metrics collections'
+)
+
 styleswipe_api_requests = Counter(
     'styleswipe_api_requests_total',
     'Total API requests',
     ['endpoint', 'method', 'status']
 )
 
+styleswipe_upload_rejections = Counter(
+    'styleswipe_upload_rejections_total',
+    'Uploads rejected with 503 because every upload slot was busy'
+)
+
+# ==================== REQUEST INSTRUMENTATION ====================
+# Recorded by request_metrics.RequestMetricsMiddleware; endpoint is the route template
+
+styleswipe_api_requests_in_flight = Gauge(
+    'styleswipe_api_requests_in_flight',
+    'API requests currently being handled',
+    ['endpoint', 'method']
+)
+
+styleswipe_api_request_duration_seconds = Histogram(
+    'styleswipe_api_request_duration_seconds',
+    'API request latency',
+    ['endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+styleswipe_api_db_duration_seconds = Histogram(
+    'styleswipe_api_db_duration_seconds',
+    'Database time spent per API request',
+    ['endpoint', 'method'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+styleswipe_api_db_statements = Histogram(
+    'styleswipe_api_db_statements',
+    'SQL statements executed per API request',
+    ['endpoint', 'method'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+
+# ==================== PIPELINE STAGES ====================
+# Recorded by tracing.span around search, download and generation steps
 
-def collect_metrics():
+styleswipe_stage_duration_seconds = Histogram(
+    'styleswipe_stage_duration_seconds',
+    'Duration of search/download/generation pipeline stages',
+    ['stage', 'status'],  # status: 'ok' or 'error'
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+
+
+# Background collector configuration
+METRICS_REFRESH_INTERVAL = float(os.getenv("METRICS_REFRESH_INTERVAL", "15"))  # Seconds
+
+
+def collect_metrics(db: Optional[Session] = None):
     """
-    Collect all metrics from database and update Prometheus gauges.
-    Called on each /metrics request for fresh data.
+    Read the precomputed metric counters and update Prometheus gauges.
+    Run by the background collector; a single query on a small table.
     """
-    db = SessionLocal()
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
     try:
-        # === User metrics ===
-        total_users = db.query(User).count()
-        styleswipe_users_total.set(total_users)
-        
-        # Users by gender
-        gender_counts = db.query(
-            Preference.gender,
-            sql_func.count(Preference.id)
-        ).group_by(Preference.gender).all()
-        
-        # Reset all gender labels first
-        for gender in ['male', 'female', 'non-binary', 'other', None]:
-            label = gender if gender else 'unknown'
-            styleswipe_users_by_gender.labels(gender=label).set(0)
-        
-        for gender, count in gender_counts:
-            label = gender if gender else 'unknown'
-            styleswipe_users_by_gender.labels(gender=label).set(count)
-        
-        # Users by size
-        size_counts = db.query(
-            Preference.size,
-            sql_func.count(Preference.id)
-        ).group_by(Preference.size).all()
-        
-        for size, count in size_counts:
-            label = size if size else 'unknown'
-            styleswipe_users_by_size.labels(size=label).set(count)
-        
-        # === Product metrics ===
-        total_products = db.query(Product).count()
-        styleswipe_products_total.set(total_products)
-        
-        # Products by type
-        type_counts = db.query(
-            Product.product_type,
-            sql_func.count(Product.id)
-        ).group_by(Product.product_type).all()
-        
-        for product_type, count in type_counts:
-            label = product_type if product_type else 'unknown'
-            styleswipe_products_by_type.labels(clothing_type=label).set(count)
-        
-        # === Swipe metrics ===
-        likes_count = db.query(Swipe).filter(Swipe.liked == True).count()
-        dislikes_count = db.query(Swipe).filter(Swipe.liked == False).count()
-        
-        styleswipe_swipes_total.labels(action='liked').set(likes_count)
-        styleswipe_swipes_total.labels(action='disliked').set(dislikes_count)
-        styleswipe_likes_total.set(likes_count)
-        styleswipe_dislikes_total.set(dislikes_count)
-        
-        # === Click metrics ===
-        total_clicks = db.query(ProductClick).count()
-        styleswipe_clicks_total.set(total_clicks)
-        
-        # Clicks by product type
-        click_by_type = db.query(
-            Product.product_type,
-            sql_func.count(ProductClick.id)
-        ).join(ProductClick, Product.id == ProductClick.product_id
-        ).group_by(Product.product_type).all()
-        
-        for product_type, count in click_by_type:
-            label = product_type if product_type else 'unknown'
-            styleswipe_clicks_by_product_type.labels(clothing_type=label).set(count)
-        
-        # === Click-through rate by product type ===
-        # CTR = clicks / likes for each product type
-        likes_by_type = db.query(
-            Product.product_type,
-            sql_func.count(LikedProduct.id)
-        ).join(LikedProduct, Product.id == LikedProduct.product_id
-        ).group_by(Product.product_type).all()
-        
-        likes_dict = {ptype: count for ptype, count in likes_by_type}
-        clicks_dict = {ptype: count for ptype, count in click_by_type}
-        
-        all_types = set(likes_dict.keys()) | set(clicks_dict.keys())
-        for product_type in all_types:
-            likes = likes_dict.get(product_type, 0)
-            clicks = clicks_dict.get(product_type, 0)
-            ctr = (clicks / likes * 100) if likes > 0 else 0
-            label = product_type if product_type else 'unknown'
-            styleswipe_ctr_by_product_type.labels(clothing_type=label).set(ctr)
-        
-        # === Style popularity ===
-        # Count how many users selected each style
-        all_prefs = db.query(Preference.styles).all()
-        style_counts = {}
-        for (styles,) in all_prefs:
-            if styles:
-                for style in styles:
-                    style_counts[style] = style_counts.get(style, 0) + 1
-        
-        for style, count in style_counts.items():
-            styleswipe_style_popularity.labels(style=style).set(count)
-        
+        counters = read_counters(db)
     finally:
-        db.close()
+        if own_session:
+            db.close()
+    
+    def grouped(metric):
+        return counters.get(metric, {}).items()
+    
+    # === User metrics ===
+    styleswipe_users_total.set(counters.get(USERS, {}).get("", 0))
+    
+    # Reset all gender labels first
+    for gender in ['male', 'female', 'non-binary', 'other', None]:
+        styleswipe_users_by_gender.labels(gender=label_for(gender)).set(0)
+    
+    for label, count in grouped(USERS_BY_GENDER):
+        styleswipe_users_by_gender.labels(gender=label).set(count)
+    
+    for label, count in grouped(USERS_BY_SIZE):
+        styleswipe_users_by_size.labels(size=label).set(count)
+    
+    # === Product metrics ===
+    styleswipe_products_total.set(counters.get(PRODUCTS, {}).get("", 0))
+    
+    for label, count in grouped(PRODUCTS_BY_TYPE):
+        styleswipe_products_by_type.labels(clothing_type=label).set(count)
+    
+    # === Swipe metrics ===
+    likes_count = counters.get(SWIPES, {}).get("liked", 0)
+    dislikes_count = counters.get(SWIPES, {}).get("disliked", 0)
+    
+    styleswipe_swipes_total.labels(action='liked').set(likes_count)
+    styleswipe_swipes_total.labels(action='disliked').set(dislikes_count)
+    styleswipe_likes_total.set(likes_count)
+    styleswipe_dislikes_total.set(dislikes_count)
+    
+    # === Click metrics ===
+    styleswipe_clicks_total.set(counters.get(CLICKS, {}).get("", 0))
+    
+    for label, count in grouped(CLICKS_BY_TYPE):
+        styleswipe_clicks_by_product_type.labels(clothing_type=label).set(count)
+    
+    # === Click-through rate by product type ===
+    # CTR = clicks / likes for each product type
+    likes_dict = counters.get(LIKED_PRODUCTS_BY_TYPE, {})
+    clicks_dict = counters.get(CLICKS_BY_TYPE, {})
+    
+    for label in set(likes_dict) | set(clicks_dict):
+        likes = likes_dict.get(label, 0)
+        clicks = clicks_dict.get(label, 0)
+        ctr = (clicks / likes * 100) if likes > 0 else 0
+        styleswipe_ctr_by_product_type.labels(clothing_type=label).set(ctr)
+    
+    # === Style popularity ===
+    for style, count in grouped(STYLE_POPULARITY):
+        styleswipe_style_popularity.labels(style=style).set(count)
+
+
+class MetricsCollector:
+    """Refreshes the database-backed gauges in the background, one collection at a time."""
+    
+    def __init__(self, interval: float = METRICS_REFRESH_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last_success: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        styleswipe_metrics_staleness_seconds.set_function(self.staleness)
+    
+    def staleness(self) -> float:
+        if self.last_success is None:
+            return float("inf")
+        return time.time() - self.last_success
+    
+    def refresh(self) -> bool:
+        """
+        Collect metrics now, unless a collection is already running (single-flight).
+        
+        Returns:
+            True if this call ran a successful collection
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            start = time.perf_counter()
+            collect_metrics()
+            styleswipe_metrics_collection_duration_seconds.set(time.perf_counter() - start)
+            self.last_success = time.time()
+            return True
+        except Exception as e:
+            styleswipe_metrics_collection_errors.inc()
+            print(f"   ⚠️ Metrics collection failed: {e}")
+            return False
+        finally:
+            self.lock.release()
+    
+    async def run(self):
+        """Collect on the interval, off the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.refresh)
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        """Start the background task (call from the app's startup event)."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+# Shared collector instance
+metrics_collector = MetricsCollector()
 
 
 def get_metrics():
-    """Generate Prometheus metrics output."""
-    collect_metrics()
+    """Generate Prometheus metrics output from the already-collected registry."""
     return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
 
@@ -0,0 +1,299 @@
+"""
+Data migrations for existing StyleSwipe databases.
+
+New tables are created by init_db(); these functions move existing rows into
+the new layout. Each migration is idempotent, so the whole list can be re-run.
+The schema changes the code can't run without (STARTUP_MIGRATIONS) also run
+on every API startup, and are cheap once applied.
+
+Usage (from project root):
+    python -m backend.migrations
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Optional
+from sqlalchemy import func, inspect, text
+from sqlalchemy.orm import Session
+from PIL import Image
+
+try:
+    from backend.database import SessionLocal, init_db
+    from backend.image_pipeline import perceptual_hash
+    from backend.metric_counters import rebuild_metric_counters
+    from backend.models import Job, User, UserImage, Product, SearchResult, Swipe, LikedProduct, ProductClick
+    from backend.search_products import catalog_product_id
+except ImportError:
+    from database import SessionLocal, init_db
+    from image_pipeline import perceptual_hash
+    from metric_counters import rebuild_metric_counters
+    from models import Job, User, UserImage, Product, SearchResult, Swipe, LikedProduct, ProductClick
+    from search_products import catalog_product_id
+
+BASE_DIR = Path(__file__).parent.parent
+USER_IMAGES_DIR = BASE_DIR / "data" / "user_images"
+
+
+def _split_session_product_id(product_id: str, user_folders: Dict[str, int]) -> Optional[tuple]:
+    """
+    Split a legacy per-user product_id ("{upstream_id}_{user_folder}") into
+    (upstream_id, user_folder). Returns None if it has no user folder suffix.
+    """
+    for index, char in enumerate(product_id):
+        if char == "_" and product_id[index + 1:] in user_folders:
+            return product_id[:index], product_id[index + 1:]
+    return None
+
+
+def migrate_shared_catalog(db: Session) -> Dict[str, int]:
+    """
+    Collapse legacy per-user Product rows into the shared catalog.
+
+    Rows whose product_id carries a user folder suffix are merged into one
+    row per upstream product_id. Legacy rows stored without a SerpApi id
+    ("_{user_folder}") are grouped by the catalog's product link hash instead,
+    and left unmerged if they have no link either. Swipes, likes and clicks are repointed to the
+    surviving row, each user's products.json is rewritten with the new ids,
+    and search_results rows are created from it.
+
+    Returns:
+        Counts of merged products and created search results
+    """
+    user_folders = {user.user_folder: user.id for user in db.query(User).all()}
+
+    # Group product rows by upstream id; the lowest id survives
+    groups: Dict[str, list] = {}
+    for product in db.query(Product).order_by(Product.id).all():
+        split = _split_session_product_id(product.product_id, user_folders)
+        upstream_id = split[0] if split else product.product_id
+        if not upstream_id:
+            # No SerpApi id: key by link like new searches do, never by ""
+            upstream_id = (
+                catalog_product_id({"product_link": product.product_link})
+                if product.product_link else product.product_id
+            )
+        groups.setdefault(upstream_id, []).append(product)
+
+    id_map: Dict[int, int] = {}  # old products.id -> surviving products.id
+    merged = 0
+    for upstream_id, products in groups.items():
+        canonical = products[0]
+        for duplicate in products[1:]:
+            id_map[duplicate.id] = canonical.id
+            for model in (Swipe, LikedProduct, ProductClick, SearchResult):
+                db.query(model).filter(model.product_id == duplicate.id).update(
+                    {model.product_id: canonical.id}, synchronize_session=False
+                )
+            if canonical.product_type is None and duplicate.product_type:
+                canonical.product_type = duplicate.product_type
+            db.delete(duplicate)
+            merged += 1
+        # Free up the upstream id before renaming the survivor
+        db.flush()
+        if canonical.product_id != upstream_id:
+            canonical.product_id = upstream_id
+    db.flush()
+
+    # Rebuild per-user search results from products.json
+    created = 0
+    for user_folder, user_id in user_folders.items():
+        products_json_path = USER_IMAGES_DIR / user_folder / "products" / "products.json"
+        if not products_json_path.exists():
+            continue
+        try:
+            with open(products_json_path) as f:
+                saved_products = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"   ⚠️ Skipping {products_json_path}: {e}")
+            continue
+
+        changed = False
+        for saved_product in saved_products:
+            old_id = saved_product.get("db_product_id")
+            if old_id in id_map:
+                saved_product["db_product_id"] = id_map[old_id]
+                changed = True
+        if changed:
+            with open(products_json_path, "w") as f:
+                json.dump(saved_products, f, indent=2)
+
+        if db.query(SearchResult).filter(SearchResult.user_id == user_id).first():
+            continue
+        for position, saved_product in enumerate(saved_products, 1):
+            product_id = saved_product.get("db_product_id")
+            if product_id and db.get(Product, product_id):
+                db.add(SearchResult(user_id=user_id, product_id=product_id, position=position))
+                created += 1
+
+    db.commit()
+    return {"merged_products": merged, "search_results_created": created}
+
+
+def _has_unique_index(db: Session, model, name: str, columns: list) -> bool:
+    inspector = inspect(db.connection())
+    table = model.__tablename__
+    existing = inspector.get_unique_constraints(table) + [
+        index for index in inspector.get_indexes(table) if index.get("unique")
+    ]
+    return any(item["name"] == name or item["column_names"] == columns for item in existing)
+
+
+def _ensure_unique_index(db: Session, model, name: str, columns: list):
+    """Create a unique index on existing tables that predate the model's UniqueConstraint."""
+    if _has_unique_index(db, model, name, columns):
+        return False
+    table = model.__tablename__
+    db.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({', '.join(columns)})"))
+    return True
+
+
+UNIQUE_SWIPE_INDEXES = [
+    (Swipe, "uq_swipes_user_product", ["user_id", "product_id"]),
+    (LikedProduct, "uq_liked_products_user_product", ["user_id", "product_id"]),
+]
+
+
+def migrate_unique_swipes(db: Session) -> Dict[str, int]:
+    """
+    Deduplicate swipes and likes, then enforce one row per (user_id, product_id).
+
+    The most recent swipe wins (it holds the user's latest decision); the
+    earliest like is kept so liked_at stays accurate.
+
+    Returns:
+        Counts of deleted duplicates and created indexes
+    """
+    if all(_has_unique_index(db, *index) for index in UNIQUE_SWIPE_INDEXES):
+        # Already enforced: there can't be duplicates
+        return {"duplicate_swipes_removed": 0, "duplicate_likes_removed": 0, "unique_indexes_created": 0}
+
+    latest_swipes = db.query(func.max(Swipe.id)).group_by(Swipe.user_id, Swipe.product_id)
+    swipes_removed = db.query(Swipe).filter(Swipe.id.not_in(latest_swipes)).delete(synchronize_session=False)
+
+    first_likes = db.query(func.min(LikedProduct.id)).group_by(LikedProduct.user_id, LikedProduct.product_id)
+    likes_removed = db.query(LikedProduct).filter(
+        LikedProduct.id.not_in(first_likes)
+    ).delete(synchronize_session=False)
+
+    indexes_created = sum(_ensure_unique_index(db, *index) for index in UNIQUE_SWIPE_INDEXES)
+
+    db.commit()
+    return {
+        "duplicate_swipes_removed": swipes_removed,
+        "duplicate_likes_removed": likes_removed,
+        "unique_indexes_created": indexes_created,
+    }
+
+
+def _ensure_column(db: Session, model, name: str, column_type: str) -> bool:
+    """Add a nullable column to existing tables that predate it in the model."""
+    table = model.__tablename__
+    if any(column["name"] == name for column in inspect(db.connection()).get_columns(table)):
+        return False
+    db.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+    return True
+
+
+def migrate_user_image_hashes(db: Session) -> Dict[str, int]:
+    """
+    Add user_images.perceptual_hash and fill it in from the stored photos.
+
+    Rows whose file is missing or unreadable are left without a hash; the next
+    upload for that angle is then stored as a new photo.
+
+    Returns:
+        Counts of created columns and hashed/skipped rows
+    """
+    columns_created = _ensure_column(db, UserImage, "perceptual_hash", "VARCHAR(16)")
+    db.commit()
+
+    hashed = skipped = 0
+    for image in db.query(UserImage).filter(UserImage.perceptual_hash.is_(None)):
+        try:
+            with Image.open(BASE_DIR / image.image_path) as img:
+                image.perceptual_hash = perceptual_hash(img)
+            hashed += 1
+        except OSError as e:
+            print(f"   ⚠️ Skipping {image.image_path}: {e}")
+            skipped += 1
+
+    db.commit()
+    return {"columns_created": int(columns_created), "images_hashed": hashed, "images_skipped": skipped}
+
+
+def migrate_job_owners(db: Session) -> Dict[str, int]:
+    """
+    Add jobs.owner. Existing jobs are left without an owner, so only the
+    JOB_STALE_AFTER age limit applies to them.
+
+    Returns:
+        Count of created columns
+    """
+    columns_created = _ensure_column(db, Job, "owner", "VARCHAR")
+    db.commit()
+    return {"columns_created": int(columns_created)}
+
+
+# Migrations in the order they must run
+MIGRATIONS = [
+    migrate_shared_catalog,
+    migrate_unique_swipes,
+    migrate_user_image_hashes,
+    migrate_job_owners,
+    rebuild_metric_counters,  # Last: earlier migrations merge and delete rows
+]
+
+
+# Schema changes the API depends on (ON CONFLICT targets, new columns); run on startup
+STARTUP_MIGRATIONS = [
+    migrate_unique_swipes,
+    migrate_user_image_hashes,
+    migrate_job_owners,
+]
+
+# pg_advisory_lock key serializing startup migrations across API processes
+STARTUP_MIGRATION_LOCK_KEY = 0x5757_0001
+
+
+def run_startup_migrations():
+    """
+    Run STARTUP_MIGRATIONS (call after init_db). On PostgreSQL an advisory lock
+    makes concurrently starting workers run them one at a time. If a migration
+    deleted duplicate rows, the metric counters are rebuilt.
+    """
+    db = SessionLocal()
+    postgres = db.get_bind().dialect.name == "postgresql"
+    try:
+        if postgres:
+            db.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_MIGRATION_LOCK_KEY})
+        rows_removed = 0
+        for migration in STARTUP_MIGRATIONS:
+            result = migration(db)
+            if any(result.values()):
+                print(f"   ✓ {migration.__name__}: {result}")
+            rows_removed += result.get("duplicate_swipes_removed", 0) + result.get("duplicate_likes_removed", 0)
+        if rows_removed:
+            rebuild_metric_counters(db)
+    finally:
+        if postgres:
+            db.rollback()
+            db.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_MIGRATION_LOCK_KEY})
+            db.commit()
+        db.close()
+
+
+def run_migrations():
+    """Create missing tables, then run every migration in order."""
+    init_db()
+    db = SessionLocal()
+    try:
+        for migration in MIGRATIONS:
+            print(f"Running {migration.__name__}...")
+            result = migration(db)
+            print(f"   ✓ {result}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migrations()
@@ -2,7 +2,7 @@
 SQLAlchemy ORM models for StyleSwipe database.
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Float, DateTime, ForeignKey, Text, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -27,6 +27,9 @@ class User(Base):
     swipes = relationship("Swipe", back_populates="user", cascade="all, delete-orphan")
     liked_products = relationship("LikedProduct", back_populates="user", cascade="all, delete-orphan")
     product_clicks = relationship("ProductClick", back_populates="user", cascade="all, delete-orphan")
+    jobs = relationship("Job", back_populates="user", cascade="all, delete-orphan")
+    search_results = relationship("SearchResult", back_populates="user", cascade="all, delete-orphan")
+    swipe_batches = relationship("SwipeBatch", back_populates="user", cascade="all, delete-orphan")
 
 
 class UserImage(Base):
@@ -37,6 +40,7 @@ class UserImage(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     angle = Column(String, nullable=False)  # 'front', 'side', 'back'
     image_path = Column(String, nullable=False)
+    perceptual_hash = Column(String(16))  # dHash of the stored photo, to spot re-uploads
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
@@ -64,11 +68,11 @@ class Preference(Base):
 
 
 class Product(Base):
-    """Searched/saved products from API."""
+    """Global product catalog, deduplicated by the upstream SerpApi product_id."""
     __tablename__ = "products"
     
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(String, unique=True, index=True, nullable=False)  # From API
+    product_id = Column(String, unique=True, index=True, nullable=False)  # From API (shared by all users)
     title = Column(String, nullable=False)
     price = Column(String)
     extracted_price = Column(Float)
@@ -89,11 +93,34 @@ class Product(Base):
     swipes = relationship("Swipe", back_populates="product")
     liked_products = relationship("LikedProduct", back_populates="product")
     product_clicks = relationship("ProductClick", back_populates="product")
+    search_results = relationship("SearchResult", back_populates="product")
+
+
+class SearchResult(Base):
+    """Products returned by a user's latest search, in display order."""
+    __tablename__ = "search_results"
+    __table_args__ = (
+        UniqueConstraint("user_id", "position", name="uq_search_results_user_position"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)  # 1-based, matches product_{n} image numbering
+    query = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    user = relationship("User", back_populates="search_results")
+    product = relationship("Product", back_populates="search_results")
 
 
 class Swipe(Base):
     """Swipe history (liked/disliked)."""
     __tablename__ = "swipes"
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_swipes_user_product"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
@@ -109,6 +136,9 @@ class Swipe(Base):
 class LikedProduct(Base):
     """Saved liked items with metadata."""
     __tablename__ = "liked_products"
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_liked_products_user_product"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
@@ -134,3 +164,67 @@ class ProductClick(Base):
     user = relationship("User", back_populates="product_clicks")
     product = relationship("Product", back_populates="product_clicks")
 
+
+
+class Job(Base):
+    """Background search + try-on generation jobs and their per-stage progress."""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    job_type = Column(String, nullable=False)  # e.g. 'search_and_generate'
+    status = Column(String, nullable=False, default="queued", index=True)  # 'queued', 'running', 'completed', 'failed'
+    stages = Column(JSON)  # {stage: {"status": ..., "completed": n, "total": n}}
+    payload = Column(JSON)  # Inputs needed by the worker
+    result = Column(JSON)  # Summary written when the job completes
+    error = Column(Text)
+    owner = Column(String)  # "host:pid" of the API process whose runner holds the job
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    user = relationship("User", back_populates="jobs")
+
+
+class SearchQueryCache(Base):
+    """Cached SerpApi shopping responses, keyed by normalized query + locale params."""
+    __tablename__ = "search_query_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True, nullable=False)  # sha256 of normalized query + params
+    query = Column(String, nullable=False)  # Normalized query
+    params = Column(JSON)  # gl/hl/num etc. used for the request
+    response = Column(JSON, nullable=False)  # Raw SerpApi JSON
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class SwipeBatch(Base):
+    """Swipe batches already applied, keyed by the client's idempotency key."""
+    __tablename__ = "swipe_batches"
+    __table_args__ = (
+        UniqueConstraint("user_id", "batch_id", name="uq_swipe_batches_user_batch"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    batch_id = Column(String, nullable=False)  # Client-generated idempotency key
+    swipe_count = Column(Integer, nullable=False)
+    result = Column(JSON)  # Response returned for the batch, replayed on retries
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    user = relationship("User", back_populates="swipe_batches")
+
+
+class MetricCounter(Base):
+    """Aggregate counters for /metrics, updated in the same transaction as the writes they count."""
+    __tablename__ = "metric_counters"
+    __table_args__ = (
+        UniqueConstraint("metric", "label", name="uq_metric_counters_metric_label"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    metric = Column(String, nullable=False)  # e.g. 'swipes', 'clicks_by_type'
+    label = Column(String, nullable=False, default="")  # e.g. 'liked', 'tops' ('' for unlabeled)
+    value = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,110 @@
+"""
+HTTP request instrumentation.
+
+An ASGI middleware records, per route template (e.g.
+/api/swipe/{user_folder}/action rather than the raw path), the request
+count by status, requests in flight, and latency. SQLAlchemy cursor events
+add up the database time and statement count of each request.
+"""
+
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+try:
+    from backend.metrics import (
+        styleswipe_api_requests, styleswipe_api_requests_in_flight, styleswipe_api_request_duration_seconds,
+        styleswipe_api_db_duration_seconds, styleswipe_api_db_statements
+    )
+except ImportError:
+    from metrics import (
+        styleswipe_api_requests, styleswipe_api_requests_in_flight, styleswipe_api_request_duration_seconds,
+        styleswipe_api_db_duration_seconds, styleswipe_api_db_statements
+    )
+
+# Label for requests that match no route (keeps label cardinality bounded)
+UNMATCHED_ENDPOINT = "unmatched"
+
+# DB time/statements of the current request; None outside a request
+_request_db_stats: ContextVar[Optional[Dict]] = ContextVar("request_db_stats", default=None)
+
+_CONVERTER_PATTERN = re.compile(r"{(\w+):\w+}")
+
+
+def route_template(scope) -> str:
+    """Templated path of the route that will handle this request, e.g. /api/jobs/{job_id}."""
+    app = scope.get("app")
+    partial = None
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return _CONVERTER_PATTERN.sub(r"{\1}", route.path)
+        if match == Match.PARTIAL and partial is None:
+            partial = route  # Path matched but not the method
+    if partial is not None:
+        return _CONVERTER_PATTERN.sub(r"{\1}", partial.path)
+    return UNMATCHED_ENDPOINT
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware recording per-route Prometheus metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = route_template(scope)
+        method = scope["method"]
+        status = 500  # If the app fails before starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = styleswipe_api_requests_in_flight.labels(endpoint=endpoint, method=method)
+        in_flight.inc()
+        db_stats = {"seconds": 0.0, "statements": 0}
+        token = _request_db_stats.set(db_stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            _request_db_stats.reset(token)
+            in_flight.dec()
+            styleswipe_api_requests.labels(endpoint=endpoint, method=method, status=str(status)).inc()
+            styleswipe_api_request_duration_seconds.labels(endpoint=endpoint, method=method).observe(duration)
+            styleswipe_api_db_duration_seconds.labels(endpoint=endpoint, method=method).observe(db_stats["seconds"])
+            styleswipe_api_db_statements.labels(endpoint=endpoint, method=method).observe(db_stats["statements"])
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_times")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    db_stats = _request_db_stats.get()
+    if db_stats is not None:
+        db_stats["seconds"] += elapsed
+        db_stats["statements"] += 1
+
+
+def instrument_engine(engine: Engine):
+    """Attach the DB timing hooks to an engine (safe to call more than once)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,197 @@
+"""
+Two-tier cache for SerpApi shopping queries.
+
+An in-memory LRU sits in front of the search_query_cache table. Entries are
+keyed by the normalized query plus the locale/size params (gl, hl, num...),
+are fresh for SEARCH_CACHE_TTL seconds, and are then served stale for up to
+SEARCH_CACHE_STALE_SECONDS more while a background thread refreshes them.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    from backend.database import SessionLocal, get_insert
+    from backend.models import SearchQueryCache
+except ImportError:
+    from database import SessionLocal, get_insert
+    from models import SearchQueryCache
+
+# Cache configuration
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(6 * 60 * 60)))  # Fresh for 6 hours
+SEARCH_CACHE_STALE_SECONDS = int(os.getenv("SEARCH_CACHE_STALE_SECONDS", str(24 * 60 * 60)))  # Then stale-while-revalidate
+SEARCH_CACHE_MEMORY_SIZE = int(os.getenv("SEARCH_CACHE_MEMORY_SIZE", "256"))
+
+# Request params that change the results (api_key deliberately excluded)
+CACHE_KEY_PARAMS = ["engine", "google_domain", "gl", "hl", "num"]
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so equivalent queries share an entry."""
+    return " ".join(query.lower().split())
+
+
+def make_search_cache_key(query: str, params: Dict) -> str:
+    """Hash of the normalized query and the result-affecting params."""
+    key_data = {"q": normalize_query(query)}
+    key_data.update({name: params.get(name) for name in CACHE_KEY_PARAMS})
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+
+class SearchQueryCacheStore:
+    """In-memory LRU over the persistent search_query_cache table."""
+
+    def __init__(
+        self,
+        ttl: int = SEARCH_CACHE_TTL,
+        stale_seconds: int = SEARCH_CACHE_STALE_SECONDS,
+        memory_size: int = SEARCH_CACHE_MEMORY_SIZE
+    ):
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.memory_size = memory_size
+        self.memory: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.refreshing = set()  # Keys with a background refresh in flight
+
+    # ---------- memory tier ----------
+
+    def _memory_get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key: str, fetched_at: float, data: Dict):
+        with self.lock:
+            self.memory[key] = (fetched_at, data)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    # ---------- persistent tier ----------
+
+    def _db_get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        db = SessionLocal()
+        try:
+            row = db.query(SearchQueryCache).filter(SearchQueryCache.cache_key == key).first()
+            if not row:
+                return None
+            fetched_at = row.fetched_at
+            if fetched_at.tzinfo is None:
+                fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+            return fetched_at.timestamp(), row.response
+        finally:
+            db.close()
+
+    def _db_put(self, key: str, query: str, params: Dict, fetched_at: float, data: Dict):
+        db = SessionLocal()
+        try:
+            values = {
+                "cache_key": key,
+                "query": normalize_query(query),
+                "params": {name: params.get(name) for name in CACHE_KEY_PARAMS},
+                "response": data,
+                "fetched_at": datetime.fromtimestamp(fetched_at, timezone.utc),
+            }
+            dialect_insert = get_insert(db)
+            if dialect_insert is not None:
+                stmt = dialect_insert(SearchQueryCache).values(**values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[SearchQueryCache.cache_key],
+                    set_={name: stmt.excluded[name] for name in ("response", "fetched_at")}
+                )
+                db.execute(stmt)
+            else:
+                row = db.query(SearchQueryCache).filter(SearchQueryCache.cache_key == key).first()
+                if row:
+                    row.response = data
+                    row.fetched_at = values["fetched_at"]
+                else:
+                    db.add(SearchQueryCache(**values))
+            db.commit()
+        finally:
+            db.close()
+
+    # ---------- lookups ----------
+
+    def _store(self, key: str, query: str, params: Dict, data: Dict):
+        fetched_at = time.time()
+        self._memory_put(key, fetched_at, data)
+        try:
+            self._db_put(key, query, params, fetched_at, data)
+        except Exception as e:
+            print(f"   ⚠️ Failed to persist search cache entry: {e}")
+
+    def _refresh_in_background(self, key: str, query: str, params: Dict, fetch: Callable[[], Dict]):
+        """Revalidate a stale entry once, without blocking the caller."""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def refresh():
+            try:
+                data = fetch()
+                if "error" not in data:
+                    self._store(key, query, params, data)
+            except Exception as e:
+                print(f"   ⚠️ Background search refresh failed: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_or_fetch(self, query: str, params: Dict, fetch: Callable[[], Dict]) -> Dict:
+        """
+        Return the SerpApi response for a query, using the cache when possible.
+
+        Args:
+            query: Search query string
+            params: SerpApi request params
+            fetch: Performs the real SerpApi request and returns its JSON
+
+        Returns:
+            SerpApi response JSON
+        """
+        key = make_search_cache_key(query, params)
+        now = time.time()
+
+        entry = self._memory_get(key)
+        if entry is None:
+            try:
+                entry = self._db_get(key)
+            except Exception as e:
+                print(f"   ⚠️ Search cache lookup failed: {e}")
+                entry = None
+            if entry is not None:
+                self._memory_put(key, *entry)
+
+        if entry is not None:
+            fetched_at, data = entry
+            age = now - fetched_at
+            if age < self.ttl:
+                print(f"   ⚡ Search cache hit ({age:.0f}s old)")
+                return data
+            if age < self.ttl + self.stale_seconds:
+                print(f"   ⚡ Serving stale search results ({age:.0f}s old), refreshing in background")
+                self._refresh_in_background(key, query, params, fetch)
+                return data
+
+        data = fetch()
+        # Don't cache API errors
+        if "error" not in data:
+            self._store(key, query, params, data)
+        return data
+
+
+# Shared cache instance
+search_cache = SearchQueryCacheStore()
@@ -2,17 +2,33 @@ import requests
 import json
 import urllib.parse
 import os
-import io
+import hashlib
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Dict, List
+from sqlalchemy import func, insert, literal_column, null, text
 from sqlalchemy.orm import Session
-from PIL import Image
 
 try:
-    from backend.models import Product
+    from backend.models import Product, SearchResult, User, LikedProduct, ProductClick
+    from backend.database import get_insert, lock_sqlite_for_write
+    from backend.image_downloader import compress_image_bytes, download_images, fetch_image
+    from backend.search_cache import search_cache
+    from backend.tracing import span
+    from backend.metric_counters import (
+        CLICKS_BY_TYPE, LIKED_PRODUCTS_BY_TYPE, PRODUCTS, PRODUCTS_BY_TYPE,
+        add_delta, increment_counters, label_for
+    )
 except ImportError:
-    from models import Product
+    from models import Product, SearchResult, User, LikedProduct, ProductClick
+    from database import get_insert, lock_sqlite_for_write
+    from image_downloader import compress_image_bytes, download_images, fetch_image
+    from search_cache import search_cache
+    from tracing import span
+    from metric_counters import (
+        CLICKS_BY_TYPE, LIKED_PRODUCTS_BY_TYPE, PRODUCTS, PRODUCTS_BY_TYPE,
+        add_delta, increment_counters, label_for
+    )
 
 # Load environment variables
 load_dotenv()
@@ -23,11 +39,14 @@ load_dotenv()
 SERPAPI_KEY = os.getenv("SERPI_API")
 SERPAPI_ENDPOINT = "https://serpapi.com/search"
 
-# Headers for downloading images
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-}
+# Product catalog columns written from search results
+CATALOG_FIELDS = [
+    "title", "price", "extracted_price", "old_price", "product_link", "thumbnail",
+    "source", "source_icon", "rating", "reviews", "snippet", "delivery", "tag", "product_type",
+]
+
+# Rows per multi-row INSERT (keeps bound parameters well under driver limits)
+BULK_INSERT_CHUNK_SIZE = 500
 
 
 def download_image(image_url: str, save_path: Path, max_size: int = 512, quality: int = 85) -> bool:
@@ -46,43 +65,22 @@ def download_image(image_url: str, save_path: Path, max_size: int = 512, quality
         return False
     
     try:
-        # Download the image
-        response = requests.get(image_url, headers=HEADERS, timeout=15)
-        response.raise_for_status()
-        
-        # Open image with Pillow
-        img = Image.open(io.BytesIO(response.content))
-        
-        # Convert to RGB if necessary (handles RGBA, P mode, etc.)
-        if img.mode in ('RGBA', 'P', 'LA'):
-            # Create white background for transparent images
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Resize if larger than max_size (maintain aspect ratio)
-        if img.width > max_size or img.height > max_size:
-            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-        
-        # Save as compressed JPEG
-        img.save(save_path, 'JPEG', quality=quality, optimize=True)
-        
-        # Log compression stats
-        original_size = len(response.content)
-        compressed_size = save_path.stat().st_size
-        reduction = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
-        print(f"   📦 Compressed: {original_size/1024:.1f}KB → {compressed_size/1024:.1f}KB ({reduction:.0f}% reduction)")
-        
+        stats = compress_image_bytes(fetch_image(image_url), save_path, max_size, quality)
+        _log_compression(stats)
         return True
     except Exception as e:
         print(f"   ⚠️  Failed to download/compress image: {e}")
         return False
 
 
+def _log_compression(stats: Dict):
+    """Log compression stats for a downloaded image."""
+    original_size = stats["original_size"]
+    compressed_size = stats["compressed_size"]
+    reduction = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
+    print(f"   📦 Compressed: {original_size/1024:.1f}KB → {compressed_size/1024:.1f}KB ({reduction:.0f}% reduction)")
+
+
 def save_product_link(link: str, product_index: int, links_dir: Path) -> Path:
     """
     Save product link to a text file.
@@ -94,12 +92,203 @@ def save_product_link(link: str, product_index: int, links_dir: Path) -> Path:
     return link_file
 
 
+def catalog_product_id(item: Dict) -> str:
+    """
+    Key for the shared product catalog: the upstream SerpApi product_id,
+    or a hash of the product link when SerpApi doesn't return one.
+    """
+    product_id = item.get("product_id")
+    if product_id:
+        return str(product_id)
+    link_hash = hashlib.sha1(item.get("product_link", "").encode()).hexdigest()[:16]
+    return f"link_{link_hash}"
+
+
+def upsert_catalog_product(db: Session, catalog_id: str, fields: Dict) -> Product:
+    """
+    Get or create the shared catalog row for a product and refresh its details.
+    Flushes so the returned product has an id.
+    """
+    product = db.query(Product).filter(Product.product_id == catalog_id).first()
+    existing = {catalog_id: product.product_type} if product else {}
+    deltas = catalog_counter_deltas(db, existing, [{"product_id": catalog_id, **fields}])
+    if product:
+        for key, value in fields.items():
+            # Keep the first known product_type if this search didn't have one
+            if key == "product_type" and value is None:
+                continue
+            setattr(product, key, value)
+    else:
+        product = Product(product_id=catalog_id, **fields)
+        db.add(product)
+    increment_counters(db, deltas)
+    db.flush()
+    return product
+
+
+def catalog_counter_deltas(db: Session, existing: Dict[str, Optional[str]], rows: List[Dict]) -> Dict:
+    """
+    Metric counter changes for upserting rows into the catalog.
+    
+    A product whose product_type changes also moves its likes and clicks to
+    the new type, so the per-type counters match a fresh aggregate.
+    
+    Args:
+        db: Database session
+        existing: product_type of rows already in the catalog, by catalog id
+        rows: Rows being written (with "product_id" and "product_type")
+    """
+    deltas = {}
+    retyped = {}  # catalog id -> (old type, new type)
+    for row in rows:
+        catalog_id = row["product_id"]
+        new_type = row.get("product_type")
+        if catalog_id not in existing:
+            add_delta(deltas, PRODUCTS)
+            add_delta(deltas, PRODUCTS_BY_TYPE, label_for(new_type))
+            existing[catalog_id] = new_type
+        elif new_type and new_type != existing[catalog_id]:
+            # A known product_type is only replaced by another known one
+            old_type = retyped.get(catalog_id, (existing[catalog_id], None))[0]
+            retyped[catalog_id] = (old_type, new_type)
+            existing[catalog_id] = new_type
+    
+    if not retyped:
+        return deltas
+    
+    for old_type, new_type in retyped.values():
+        add_delta(deltas, PRODUCTS_BY_TYPE, label_for(old_type), -1)
+        add_delta(deltas, PRODUCTS_BY_TYPE, label_for(new_type))
+    for model, metric in ((LikedProduct, LIKED_PRODUCTS_BY_TYPE), (ProductClick, CLICKS_BY_TYPE)):
+        counts = db.query(Product.product_id, func.count(model.id)).join(
+            model, Product.id == model.product_id
+        ).filter(Product.product_id.in_(list(retyped))).group_by(Product.product_id).all()
+        for catalog_id, count in counts:
+            old_type, new_type = retyped[catalog_id]
+            add_delta(deltas, metric, label_for(old_type), -count)
+            add_delta(deltas, metric, label_for(new_type), count)
+    return deltas
+
+
+# Transaction-scoped advisory locks on catalog ids (by hash), taken in a fixed order
+CATALOG_LOCK_SQL = text(
+    "SELECT pg_advisory_xact_lock(lock_key) FROM ("
+    "SELECT DISTINCT hashtext(catalog_id) AS lock_key FROM unnest(CAST(:ids AS text[])) AS catalog_id "
+    "ORDER BY lock_key) AS lock_keys"
+)
+
+
+def bulk_upsert_catalog_products(db: Session, rows: List[Dict]) -> Dict[str, int]:
+    """
+    Write catalog products with multi-row INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+    Falls back to one upsert per row on databases without that support.
+    
+    Args:
+        db: Database session
+        rows: Dicts with a unique "product_id" (catalog id) plus CATALOG_FIELDS
+    
+    Returns:
+        Dict mapping catalog product_id to products.id
+    """
+    if not rows:
+        return {}
+    
+    dialect_insert = get_insert(db)
+    if dialect_insert is None or not db.get_bind().dialect.insert_returning:
+        return {
+            row["product_id"]: upsert_catalog_product(
+                db, row["product_id"], {field: row.get(field) for field in CATALOG_FIELDS}
+            ).id
+            for row in rows
+        }
+    
+    # One cached statement executed with a parameter list: SQLAlchemy's
+    # "insertmanyvalues" batches it into multi-row INSERTs with RETURNING
+    table = Product.__table__
+    stmt = dialect_insert(table)
+    update_fields = {field: stmt.excluded[field] for field in CATALOG_FIELDS}
+    # Keep the first known product_type if this search didn't have one
+    update_fields["product_type"] = func.coalesce(stmt.excluded.product_type, table.c.product_type)
+    postgres = db.get_bind().dialect.name == "postgresql"
+    # Whether each row was inserted comes from the upsert itself on PostgreSQL
+    # (xmax is 0 only on a freshly inserted row version). SQLite has no xmax, but
+    # holding its single write lock from before the reads makes them exact
+    inserted_flag = literal_column("xmax = 0") if postgres else null()
+    if postgres:
+        # Until commit, no other search can insert or retype these products, so
+        # the types read before each chunk's upsert are the ones it replaces.
+        # Taken for all rows at once, in one order, so concurrent searches can't deadlock.
+        db.execute(CATALOG_LOCK_SQL, {"ids": sorted({row["product_id"] for row in rows})})
+    else:
+        lock_sqlite_for_write(db)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_=update_fields
+    ).returning(table.c.id, table.c.product_id, table.c.product_type, inserted_flag.label("inserted"))
+    
+    ids = {}
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        chunk = [
+            {"product_id": row["product_id"], **{field: row.get(field) for field in CATALOG_FIELDS}}
+            for row in rows[start:start + BULK_INSERT_CHUNK_SIZE]
+        ]
+        # Types of the rows that already exist, for retyped products
+        existing = dict(
+            db.query(Product.product_id, Product.product_type)
+            .filter(Product.product_id.in_([row["product_id"] for row in chunk]))
+            .all()
+        )
+        
+        written = db.execute(stmt, chunk).all()
+        for row in written:
+            ids[row.product_id] = row.id
+        if postgres:
+            existing = {row.product_id: existing.get(row.product_id) for row in written if not row.inserted}
+            chunk = [{"product_id": row.product_id, "product_type": row.product_type} for row in written]
+        increment_counters(db, catalog_counter_deltas(db, existing, chunk))
+    return ids
+
+
+def save_search_results(db: Session, user_id: int, product_ids: List[int], search_query: str):
+    """Replace a user's search results with product_ids, in display order."""
+    db.query(SearchResult).filter(SearchResult.user_id == user_id).delete()
+    if product_ids:
+        db.execute(insert(SearchResult), [
+            {"user_id": user_id, "product_id": product_id, "position": position, "query": search_query}
+            for position, product_id in enumerate(product_ids, 1)
+        ])
+
+
+def persist_search_results(
+    db: Session,
+    products: List[Dict],
+    catalog_ids: List[str],
+    search_query: str,
+    user_id: Optional[int] = None
+):
+    """
+    Persistence stage: write parsed products to the catalog in bulk, record the
+    user's search results, commit once, and fill in each product's db_product_id.
+    """
+    ids = bulk_upsert_catalog_products(db, [
+        {**product, "product_id": catalog_id}
+        for catalog_id, product in zip(catalog_ids, products)
+    ])
+    for catalog_id, product in zip(catalog_ids, products):
+        product["db_product_id"] = ids.get(catalog_id)
+    
+    if user_id is not None:
+        save_search_results(db, user_id, [product["db_product_id"] for product in products], search_query)
+    db.commit()
+
+
 def search_google_shopping(
     search_query: str, 
     user_folder_path: str = None, 
     num_results: int = 5,
     db: Optional[Session] = None,
-    product_type: Optional[str] = None
+    product_type: Optional[str] = None,
+    user_id: Optional[int] = None
 ):
     """
     Search Google Shopping via SerpApi for products and optionally save images and links.
@@ -108,6 +297,9 @@ def search_google_shopping(
         search_query: Search query string
         user_folder_path: Optional path to user folder where products should be saved
         num_results: Number of results to return (default: 5)
+        db: Optional database session - products are saved to the shared catalog
+        product_type: Clothing type to record on the products
+        user_id: User to record search results for (looked up from user_folder_path if omitted)
     
     Returns:
         List of product dictionaries with keys: brand, title, price, link, image, local_image
@@ -130,10 +322,15 @@ def search_google_shopping(
         # "tbs": "mr:1,merchagg:m113940428",  # Optional: Filter to House of Fraser only
     }
 
+    def fetch_from_serpapi():
+        with span("search.serpapi", query=search_query):
+            response = requests.get(SERPAPI_ENDPOINT, params=params, timeout=30)
+            response.raise_for_status()
+            return response.json()
+    
     try:
-        response = requests.get(SERPAPI_ENDPOINT, params=params, timeout=30)
-        response.raise_for_status()
-        data = response.json()
+        # Identical queries are served from the search cache after the first call
+        data = search_cache.get_or_fetch(search_query, params, fetch_from_serpapi)
     except requests.exceptions.RequestException as e:
         print(f"❌ Error fetching from SerpApi: {e}")
         return []
@@ -165,6 +362,10 @@ def search_google_shopping(
     shopping_results = data.get("shopping_results", [])
     print(f"   Found {len(shopping_results)} products from Google Shopping")
     
+    seen_catalog_ids = set()
+    catalog_ids = []  # Catalog key for each entry in products
+    image_downloads = []  # (product index, image URL, save path)
+    
     for index, item in enumerate(shopping_results):
         if len(products) >= num_results:
             break
@@ -195,70 +396,35 @@ def search_google_shopping(
             if not title or not product_link:
                 continue
             
-            # Download and save image if user_folder_path is provided
-            local_image_path = None
+            # Skip repeats of a product already in this result set
+            catalog_id = catalog_product_id(item)
+            if catalog_id in seen_catalog_ids:
+                continue
+            seen_catalog_ids.add(catalog_id)
+            
+            # Queue the image download if user_folder_path is provided
             if images_dir and image_url:
                 # Clean filename (remove invalid characters)
                 safe_name = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_'))[:50]
                 image_filename = f"product_{len(products) + 1}_{safe_name}.jpg".replace(' ', '_')
-                image_path = images_dir / image_filename
-                
-                if download_image(image_url, image_path):
-                    local_image_path = str(image_path)
-                    print(f"   💾 Saved image: {image_filename}")
+                image_downloads.append((len(products), image_url, images_dir / image_filename))
             
             # Save product link if user_folder_path is provided
             if links_dir:
                 link_file = save_product_link(product_link, len(products), links_dir)
                 print(f"   💾 Saved link: {link_file.name}")
             
-            # Save to database if db session provided
-            # Create unique product_id per user session to ensure proper image mapping
-            db_product_id = None
-            if db:
-                # Extract user folder for unique product ID
-                user_folder_name = ""
-                if user_folder_path:
-                    user_folder_name = Path(user_folder_path).name
-                
-                # Generate session-unique product_id: original_id + user_folder
-                session_product_id = f"{product_id}_{user_folder_name}" if user_folder_name else product_id
-                
-                # Always create new product for this user's search session
-                # This ensures db_product_id matches the image numbering (product_1, product_2, etc.)
-                db_product = Product(
-                    product_id=session_product_id,  # Unique per user session
-                    title=title,
-                    price=price,
-                    extracted_price=item.get("extracted_price"),
-                    old_price=item.get("old_price"),
-                    product_link=product_link,
-                    thumbnail=image_url,
-                    source=source,
-                    source_icon=item.get("source_icon"),
-                    rating=item.get("rating"),
-                    reviews=item.get("reviews"),
-                    snippet=item.get("snippet"),
-                    delivery=item.get("delivery"),
-                    tag=item.get("tag"),
-                    product_type=product_type  # Set from preferences
-                )
-                db.add(db_product)
-                db.commit()
-                db.refresh(db_product)
-                db_product_id = db_product.id
-            
             # Add to results list
             products.append({
                 "product_id": product_id,  # API product_id
-                "db_product_id": db_product_id,  # Database ID
+                "db_product_id": None,  # Database ID, filled in by the persistence stage
                 "title": title,
                 "price": price,
                 "extracted_price": item.get("extracted_price"),
                 "old_price": item.get("old_price"),
                 "product_link": product_link,
                 "thumbnail": image_url,
-                "local_image": local_image_path,
+                "local_image": None,  # Filled in once the download finishes
                 "source": source,
                 "source_icon": item.get("source_icon"),
                 "rating": item.get("rating"),
@@ -269,6 +435,8 @@ def search_google_shopping(
                 "product_type": product_type,
             })
             
+            catalog_ids.append(catalog_id)
+            
             print(f"   ✓ [{len(products)}] {title[:50]}... - {price}")
             
         except Exception as e:
@@ -277,6 +445,26 @@ def search_google_shopping(
     
     print(f"   📦 Retrieved {len(products)} products")
     
+    # Download all thumbnails at once; failures only affect their own product
+    if image_downloads:
+        with span("search.download_images", images=len(image_downloads)):
+            results = download_images([(url, path) for _, url, path in image_downloads])
+        for (product_index, _, _), result in zip(image_downloads, results):
+            if result["ok"]:
+                products[product_index]["local_image"] = str(result["path"])
+                _log_compression(result)
+                print(f"   💾 Saved image: {result['path'].name}")
+            else:
+                print(f"   ⚠️  Failed to download/compress image for product {product_index + 1}: {result['error']}")
+    
+    # Save to the shared catalog and record this user's search results
+    if db:
+        if user_id is None and user_folder_path:
+            user = db.query(User).filter(User.user_folder == Path(user_folder_path).name).first()
+            user_id = user.id if user else None
+        with span("search.persist", products=len(products)):
+            persist_search_results(db, products, catalog_ids, search_query, user_id)
+    
     # Save products.json to user folder for the swiping system
     if user_folder_path and products:
         products_json_path = Path(user_folder_path) / "products" / "products.json"
@@ -293,7 +481,8 @@ def scrape_house_of_fraser(
     search_query: str, 
     user_folder_path: str = None,
     db: Optional[Session] = None,
-    preferences_data: Optional[dict] = None
+    preferences_data: Optional[dict] = None,
+    user_id: Optional[int] = None
 ):
     """
     Backward-compatible function name. Now uses Google Shopping API via SerpApi.
@@ -310,7 +499,8 @@ def scrape_house_of_fraser(
         search_query, 
         user_folder_path,
         db=db,
-        product_type=product_type
+        product_type=product_type,
+        user_id=user_id
     )
 
 
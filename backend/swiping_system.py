@@ -3,73 +3,249 @@ Tinder-style swiping system for clothing items.
 Handles like/dislike actions and stores user preferences using PostgreSQL.
 """
 
+import json
+import os
 import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func, literal_column, true
+from sqlalchemy.exc import IntegrityError
 
 try:
-    from backend.models import User, Product, Swipe, LikedProduct
+    from backend.models import Product, Swipe, LikedProduct, SwipeBatch
 except ImportError:
-    from models import User, Product, Swipe, LikedProduct
+    from models import Product, Swipe, LikedProduct, SwipeBatch
 
 try:
-    from backend.database import get_db
+    from backend.database import get_db, get_insert, lock_sqlite_for_write
+    from backend.user_resolver import user_resolver
+    from backend.image_serving import image_stat_cache
+    from backend.metric_counters import (
+        LIKED_PRODUCTS_BY_TYPE, SWIPES, add_delta, increment_counters, label_for, swipe_label
+    )
 except ImportError:
-    from database import get_db
+    from database import get_db, get_insert, lock_sqlite_for_write
+    from user_resolver import user_resolver
+    from image_serving import image_stat_cache
+    from metric_counters import (
+        LIKED_PRODUCTS_BY_TYPE, SWIPES, add_delta, increment_counters, label_for, swipe_label
+    )
 
 # Base directory
 BASE_DIR = Path(__file__).parent.parent
 USER_IMAGES_DIR = BASE_DIR / "data" / "user_images"
 
+# Liked photos are hardlinked in the background so swipes never wait on file I/O
+LIKED_PHOTO_WORKERS = int(os.getenv("LIKED_PHOTO_WORKERS", "2"))
+
+# Per-user product index cache
+PRODUCT_INDEX_CACHE_TTL = int(os.getenv("PRODUCT_INDEX_CACHE_TTL", "300"))  # Seconds
+PRODUCT_INDEX_CACHE_SIZE = int(os.getenv("PRODUCT_INDEX_CACHE_SIZE", "256"))  # Users
+
+_liked_photo_executor: Optional[ThreadPoolExecutor] = None
+_liked_photo_lock = threading.Lock()
+
+
+class ProductIndexCache:
+    """
+    LRU of user_folder -> the user's file-derived product index, with entries
+    expiring after a TTL.
+
+    Only what comes from products.json and the combined_images listing is
+    cached, keyed by their stat signature. Catalog fields (shared rows other
+    users' searches update) and image versions are looked up on every read.
+    """
+
+    def __init__(self, ttl: int = PRODUCT_INDEX_CACHE_TTL, max_size: int = PRODUCT_INDEX_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[float, tuple, List[Dict], Dict[int, Dict]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_folder: str, signature: tuple) -> Optional[Tuple[List[Dict], Dict[int, Dict]]]:
+        with self.lock:
+            entry = self.entries.get(user_folder)
+            if entry is None:
+                return None
+            expires_at, cached_signature, entries, by_id = entry
+            if expires_at < time.monotonic() or cached_signature != signature:
+                del self.entries[user_folder]
+                return None
+            self.entries.move_to_end(user_folder)
+            return entries, by_id
+
+    def put(self, user_folder: str, signature: tuple, entries: List[Dict], by_id: Dict[int, Dict]):
+        with self.lock:
+            self.entries[user_folder] = (time.monotonic() + self.ttl, signature, entries, by_id)
+            self.entries.move_to_end(user_folder)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_folder: str):
+        with self.lock:
+            self.entries.pop(user_folder, None)
+
+
+# Shared product index cache
+product_index_cache = ProductIndexCache()
+
+
+def invalidate_product_index(user_folder: str):
+    """Drop a user's cached product index (e.g. after generation completes)."""
+    product_index_cache.invalidate(user_folder)
+
+
+def _get_liked_photo_executor() -> ThreadPoolExecutor:
+    global _liked_photo_executor
+    with _liked_photo_lock:
+        if _liked_photo_executor is None:
+            _liked_photo_executor = ThreadPoolExecutor(
+                max_workers=LIKED_PHOTO_WORKERS, thread_name_prefix="liked-photos"
+            )
+        return _liked_photo_executor
+
+
+def shutdown_liked_photo_executor():
+    """Finish pending liked-photo writes (called on app shutdown)."""
+    global _liked_photo_executor
+    with _liked_photo_lock:
+        if _liked_photo_executor is not None:
+            _liked_photo_executor.shutdown(wait=True)
+            _liked_photo_executor = None
+
+
+def materialize_liked_photos(product_dir: Path, images: Dict[str, Optional[str]], label: str = ""):
+    """
+    Link a liked product's combined images into its liked_photos folder.
+    
+    Hardlinks share the generated file's data, so a like costs no extra disk
+    space. Falls back to copying when linking isn't possible (e.g. across
+    filesystems). Generated images are replaced rather than rewritten in place,
+    so a link keeps the image the user actually liked.
+    
+    Args:
+        product_dir: liked_photos/product_{id} folder to populate
+        images: Mapping of angle -> source image path (or None)
+        label: Product description for log messages
+    """
+    product_dir.mkdir(parents=True, exist_ok=True)
+    for angle in ["front", "side", "back"]:
+        src_path_str = images.get(angle)
+        if not src_path_str:
+            print(f"   ℹ️ No {angle} image available for {label}")
+            continue
+        src_path = Path(src_path_str)
+        dest = product_dir / f"{angle}.jpg"
+        try:
+            if dest.exists():
+                dest.unlink()
+            try:
+                os.link(src_path, dest)
+            except OSError:
+                if not src_path.exists():
+                    raise FileNotFoundError(f"source image not found: {src_path}")
+                shutil.copy2(src_path, dest)
+            print(f"   ✓ Saved {angle} image for {label}")
+        except Exception as e:
+            print(f"   ⚠️ Failed to save {angle} image for {label}: {e}")
+
+
+def _stat_signature(path: Path) -> Optional[tuple]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _image_version(image_path: Optional[str]) -> Optional[str]:
+    """Version token /api/image accepts as ?v= (also warms its stat cache)."""
+    if not image_path:
+        return None
+    info = image_stat_cache.get(Path(image_path))
+    return info.version if info else None
+
 
 class SwipingSystem:
     """Manages the swiping interface and liked photos storage."""
     
-    def __init__(self, user_folder: str, db: Session):
+    def __init__(self, user_folder: str, db: Session, user_id: Optional[int] = None):
         """
         Initialize the swiping system for a user.
         
         Args:
             user_folder: User folder name (e.g., "user_1764460714")
             db: Database session
+            user_id: Already-resolved user id (looked up or created if omitted)
         """
         self.user_folder = user_folder
         self.db = db
         self.user_path = USER_IMAGES_DIR / user_folder
         self.combined_images_dir = self.user_path / "combined_images"
-        self.liked_photos_dir = self.user_path / "liked_photos"
-        
-        # Ensure liked_photos directory exists
-        self.liked_photos_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Get or create user in database
-        self.user = db.query(User).filter(User.user_folder == user_folder).first()
-        if not self.user:
-            self.user = User(user_folder=user_folder)
-            db.add(self.user)
-            db.commit()
-            db.refresh(self.user)
+        self.liked_photos_dir = self.user_path / "liked_photos"  # Created when the first like is saved
+        
+        # Get or create user in database (cached by folder name)
+        self.user_id = user_id if user_id is not None else user_resolver.resolve(db, user_folder, create=True)
     
     def get_products(self) -> List[Dict]:
         """
         Get all products with their combined images for swiping.
         Uses products.json to correctly map product numbers to database IDs.
         
+        The file-derived index is cached per user (see ProductIndexCache) and
+        rebuilt when products.json or the combined_images folder changes; catalog
+        fields and image versions are always current.
+        
         Returns:
             List of product dictionaries with image paths and metadata
         """
-        products = []
+        return self._present(self._get_product_index()[0])
+    
+    def get_product(self, db_product_id: int) -> Optional[Dict]:
+        """Look up one product from the index by its database ID."""
+        entry = self._get_product_index()[1].get(db_product_id)
+        return self._present([entry])[0] if entry else None
+    
+    def _get_product_index(self) -> Tuple[List[Dict], Dict[int, Dict]]:
+        """Return (index entries, entries by db id), rebuilding the cache if files changed."""
+        products_json_path = self.user_path / "products" / "products.json"
+        signature = (
+            _stat_signature(products_json_path),
+            _stat_signature(self.combined_images_dir),
+        )
+        
+        cached = product_index_cache.get(self.user_folder, signature)
+        if cached:
+            return cached
+        
+        entries = self._build_product_index(products_json_path)
+        by_id = {entry["db_product_id"]: entry for entry in entries if entry["db_product_id"]}
+        if signature[0] is not None and signature[1] is not None:
+            product_index_cache.put(self.user_folder, signature, entries, by_id)
+        return entries, by_id
+    
+    def _build_product_index(self, products_json_path: Path) -> List[Dict]:
+        """
+        Build the file-derived index: each products.json entry with its combined images.
+        
+        Returns:
+            Dicts with db_product_id, position (1-based product number), saved (the
+            products.json entry) and images (angle -> path or None)
+        """
+        entries = []
         
         # Read products.json which has the correct mapping
-        products_json_path = self.user_path / "products" / "products.json"
         if not products_json_path.exists():
             print(f"   ⚠️ products.json not found at {products_json_path}")
             return []
         
         try:
-            import json
             with open(products_json_path, 'r') as f:
                 saved_products = json.load(f)
         except Exception as e:
@@ -99,19 +275,37 @@ class SwipingSystem:
         
         # Match products from products.json with their images
         for idx, saved_product in enumerate(saved_products, 1):
-            # Get database product ID from saved product
-            db_product_id = saved_product.get("db_product_id")
-            
             # Get images for this product number (1-indexed)
             images = product_images.get(idx, {})
-            
-            # Try to get fresh data from database, fallback to saved data
-            db_product = None
-            if db_product_id:
-                db_product = self.db.query(Product).filter(Product.id == db_product_id).first()
+            entries.append({
+                "db_product_id": saved_product.get("db_product_id"),
+                "position": idx,
+                "saved": saved_product,
+                "images": {angle: images.get(angle) for angle in ("front", "side", "back")},
+            })
+        
+        return entries
+    
+    def _present(self, entries: List[Dict]) -> List[Dict]:
+        """Turn index entries into API product dicts with current catalog data and image versions."""
+        # Fetch fresh data for all products in one query, fallback to saved data
+        db_product_ids = [entry["db_product_id"] for entry in entries if entry["db_product_id"]]
+        db_products = {}
+        if db_product_ids:
+            db_products = {
+                product.id: product
+                for product in self.db.query(Product).filter(Product.id.in_(db_product_ids)).all()
+            }
+        
+        products = []
+        for entry in entries:
+            db_product_id = entry["db_product_id"]
+            saved_product = entry["saved"]
+            images = entry["images"]
+            db_product = db_products.get(db_product_id)
             
             products.append({
-                "product_id": db_product_id or idx,
+                "product_id": db_product_id or entry["position"],
                 "db_product_id": db_product_id,
                 "title": db_product.title if db_product else saved_product.get("title", "Unknown"),
                 "price": db_product.price if db_product else saved_product.get("price", "N/A"),
@@ -121,15 +315,34 @@ class SwipingSystem:
                 "product_link": db_product.product_link if db_product else saved_product.get("product_link", ""),
                 "thumbnail": db_product.thumbnail if db_product else saved_product.get("thumbnail", ""),
                 "product_type": db_product.product_type if db_product else saved_product.get("product_type"),
-                "images": {
-                    "front": images.get("front"),
-                    "side": images.get("side"),
-                    "back": images.get("back")
+                "images": dict(images),
+                # Append as ?v= to /api/image URLs so browsers can cache them as immutable
+                "image_versions": {
+                    angle: _image_version(images.get(angle)) for angle in ("front", "side", "back")
                 }
             })
         
         return products
     
+    def get_product_count(self) -> int:
+        """Number of swipeable products (served from the cached product index)."""
+        return len(self._get_product_index()[0])
+    
+    def get_swipe_counts(self) -> Tuple[int, int]:
+        """
+        Count this user's likes and dislikes with a single GROUP BY query.
+        
+        Returns:
+            (liked_count, disliked_count)
+        """
+        counts = dict(
+            self.db.query(Swipe.liked, func.count(Swipe.id))
+            .filter(Swipe.user_id == self.user_id)
+            .group_by(Swipe.liked)
+            .all()
+        )
+        return counts.get(True, 0), counts.get(False, 0)
+    
     def swipe(self, product_id: int, liked: bool) -> Dict:
         """
         Record a swipe action.
@@ -142,49 +355,25 @@ class SwipingSystem:
             Updated swipe status
         """
         # Check if product exists
-        product = self.db.query(Product).filter(Product.id == product_id).first()
+        product = self.db.get(Product, product_id)
         if not product:
             return {"error": "Product not found"}
         
-        # Check if already swiped
-        existing_swipe = self.db.query(Swipe).filter(
-            and_(Swipe.user_id == self.user.id, Swipe.product_id == product_id)
-        ).first()
-        
-        if existing_swipe:
-            # Update existing swipe
-            existing_swipe.liked = liked
-        else:
-            # Create new swipe
-            swipe = Swipe(user_id=self.user.id, product_id=product_id, liked=liked)
-            self.db.add(swipe)
+        # Upsert the swipe; a repeat swipe just updates the direction
+        self._upsert_swipe(product_id, liked)
         
         # If liked, also add to liked_products
-        if liked:
-            existing_liked = self.db.query(LikedProduct).filter(
-                and_(LikedProduct.user_id == self.user.id, LikedProduct.product_id == product_id)
-            ).first()
-            
-            if not existing_liked:
-                liked_product = LikedProduct(user_id=self.user.id, product_id=product_id)
-                self.db.add(liked_product)
-                
-                # Copy images to liked_photos folder
-                self._save_liked_product(product)
+        new_like = liked and self._insert_like(product)
         
         self.db.commit()
         
-        # Get updated stats
-        total_swipes = self.db.query(Swipe).filter(Swipe.user_id == self.user.id).count()
-        total_liked = self.db.query(Swipe).filter(
-            and_(Swipe.user_id == self.user.id, Swipe.liked == True)
-        ).count()
-        total_disliked = self.db.query(Swipe).filter(
-            and_(Swipe.user_id == self.user.id, Swipe.liked == False)
-        ).count()
+        if new_like:
+            # Link images into liked_photos folder in the background
+            self._save_liked_product(product)
         
-        products = self.get_products()
-        remaining = len(products) - total_swipes
+        # Get updated stats
+        total_liked, total_disliked = self.get_swipe_counts()
+        remaining = self.get_product_count() - (total_liked + total_disliked)
         
         return {
             "success": True,
@@ -196,39 +385,214 @@ class SwipingSystem:
             "remaining": max(0, remaining)
         }
     
+    def _upsert_swipe(self, product_id: int, liked: bool):
+        """Insert or update one swipe, keeping the metric counters in step."""
+        self._upsert_swipes([{"product_id": product_id, "liked": liked}])
+    
+    def _upsert_swipes(self, rows: List[Dict]):
+        """
+        Insert or update swipes; a repeat swipe just updates the direction.
+        
+        One INSERT ... ON CONFLICT DO UPDATE writes the batch, updating only
+        rows whose direction actually changes. It returns exactly the rows it
+        inserted or flipped, so the liked/disliked counters move by what this
+        statement changed even when swipes for the same product race.
+        
+        Args:
+            rows: Dicts with product_id, liked and optionally created_at (same keys in every row)
+        """
+        deltas = {}
+        dialect_insert = get_insert(self.db)
+        if dialect_insert is None:
+            for row in rows:
+                existing_swipe = self.db.query(Swipe).filter(
+                    and_(Swipe.user_id == self.user_id, Swipe.product_id == row["product_id"])
+                ).first()
+                if existing_swipe:
+                    if existing_swipe.liked != row["liked"]:
+                        add_delta(deltas, SWIPES, swipe_label(existing_swipe.liked), -1)
+                        add_delta(deltas, SWIPES, swipe_label(row["liked"]))
+                    existing_swipe.liked = row["liked"]
+                else:
+                    self.db.add(Swipe(user_id=self.user_id, **row))
+                    add_delta(deltas, SWIPES, swipe_label(row["liked"]))
+            increment_counters(self.db, deltas)
+            return
+        
+        table = Swipe.__table__
+        if self.db.get_bind().dialect.name == "postgresql":
+            # xmax is 0 only on a freshly inserted row version
+            inserted_flag = literal_column("xmax = 0")
+        else:
+            # SQLite (tests/benchmarks) has no xmax; holding its single write
+            # lock from before the read, the rows present tell inserts apart
+            lock_sqlite_for_write(self.db)
+            existing_ids = {
+                row.product_id for row in self.db.query(Swipe.product_id).filter(
+                    Swipe.user_id == self.user_id,
+                    Swipe.product_id.in_([row["product_id"] for row in rows])
+                )
+            }
+            inserted_flag = table.c.product_id.not_in(existing_ids) if existing_ids else true()
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "product_id"],
+            set_={"liked": stmt.excluded.liked},
+            where=table.c.liked.is_distinct_from(stmt.excluded.liked)
+        ).returning(table.c.liked, inserted_flag.label("inserted"))
+        for changed in self.db.execute(stmt, [{"user_id": self.user_id, **row} for row in rows]):
+            add_delta(deltas, SWIPES, swipe_label(changed.liked))
+            if not changed.inserted:
+                # Flipped from the other direction
+                add_delta(deltas, SWIPES, swipe_label(not changed.liked), -1)
+        
+        increment_counters(self.db, deltas)
+    
+    def _insert_like(self, product: Product) -> bool:
+        """
+        Add the product to liked_products unless it is already there.
+        
+        Returns:
+            True if a new like row was created
+        """
+        return product.id in self._insert_likes([product])
+    
+    def _insert_likes(self, products: List[Product]) -> set:
+        """
+        Add products to liked_products with ON CONFLICT DO NOTHING.
+        
+        Returns:
+            Set of product IDs that were newly liked
+        """
+        product_ids = [product.id for product in products]
+        dialect_insert = get_insert(self.db)
+        if dialect_insert is None:
+            existing = {
+                row.product_id for row in self.db.query(LikedProduct.product_id).filter(
+                    and_(LikedProduct.user_id == self.user_id, LikedProduct.product_id.in_(product_ids))
+                )
+            }
+            new_ids = set(product_ids) - existing
+            self.db.add_all([LikedProduct(user_id=self.user_id, product_id=pid) for pid in new_ids])
+        else:
+            table = LikedProduct.__table__
+            stmt = (
+                dialect_insert(table)
+                .on_conflict_do_nothing(index_elements=["user_id", "product_id"])
+                .returning(table.c.product_id)
+            )
+            result = self.db.execute(stmt, [{"user_id": self.user_id, "product_id": pid} for pid in product_ids])
+            new_ids = {row.product_id for row in result}
+        
+        deltas = {}
+        for product in products:
+            if product.id in new_ids:
+                add_delta(deltas, LIKED_PRODUCTS_BY_TYPE, label_for(product.product_type))
+        increment_counters(self.db, deltas)
+        return new_ids
+    
+    def swipe_batch(self, batch_id: str, swipes: List[Dict]) -> Dict:
+        """
+        Apply an ordered batch of swipes in one transaction.
+        
+        Retrying a batch with the same batch_id returns the stored result
+        without applying it again.
+        
+        Args:
+            batch_id: Client-generated idempotency key
+            swipes: Ordered dicts with product_id, liked and optional client_timestamp (epoch seconds)
+            
+        Returns:
+            Updated swipe status plus applied/rejected counts
+        """
+        existing_batch = self.db.query(SwipeBatch).filter(
+            and_(SwipeBatch.user_id == self.user_id, SwipeBatch.batch_id == batch_id)
+        ).first()
+        if existing_batch:
+            return {**existing_batch.result, "duplicate": True}
+        
+        requested_ids = {item["product_id"] for item in swipes}
+        products = {
+            product.id: product
+            for product in self.db.query(Product).filter(Product.id.in_(requested_ids)).all()
+        } if requested_ids else {}
+        
+        # Later swipes on the same product override earlier ones
+        now = datetime.now(timezone.utc)
+        final_swipes: Dict[int, Dict] = {}
+        liked_ids = []
+        rejected = []
+        for item in swipes:
+            product_id = item["product_id"]
+            if product_id not in products:
+                rejected.append(product_id)
+                continue
+            created_at = now
+            if item.get("client_timestamp"):
+                # Trust the client clock for ordering, but never record future swipes
+                try:
+                    created_at = min(datetime.fromtimestamp(item["client_timestamp"], timezone.utc), now)
+                except (OverflowError, OSError, ValueError):
+                    pass  # Unrepresentable timestamp: use the server time
+            final_swipes[product_id] = {"product_id": product_id, "liked": item["liked"], "created_at": created_at}
+            if item["liked"] and product_id not in liked_ids:
+                liked_ids.append(product_id)
+        
+        new_like_ids = set()
+        if final_swipes:
+            self._upsert_swipes(list(final_swipes.values()))
+        if liked_ids:
+            new_like_ids = self._insert_likes([products[product_id] for product_id in liked_ids])
+        
+        total_liked, total_disliked = self.get_swipe_counts()
+        remaining = self.get_product_count() - (total_liked + total_disliked)
+        result = {
+            "success": True,
+            "batch_id": batch_id,
+            "applied": len(swipes) - len(rejected),
+            "rejected": rejected,
+            "total_liked": total_liked,
+            "total_disliked": total_disliked,
+            "completed": remaining <= 0,
+            "remaining": max(0, remaining)
+        }
+        self.db.add(SwipeBatch(user_id=self.user_id, batch_id=batch_id, swipe_count=len(swipes), result=result))
+        
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # The same batch was applied concurrently; return its result
+            self.db.rollback()
+            existing_batch = self.db.query(SwipeBatch).filter(
+                and_(SwipeBatch.user_id == self.user_id, SwipeBatch.batch_id == batch_id)
+            ).first()
+            if not existing_batch:
+                raise
+            return {**existing_batch.result, "duplicate": True}
+        
+        for product_id in liked_ids:
+            if product_id in new_like_ids:
+                # Link images into liked_photos folder in the background
+                self._save_liked_product(products[product_id])
+        
+        return {**result, "duplicate": False}
+    
     def _save_liked_product(self, product: Product):
-        """Save liked product images and metadata to liked_photos folder."""
+        """Queue linking of the liked product's images into the liked_photos folder."""
         product_id = product.id
-        product_dir = self.liked_photos_dir / f"product_{product_id}"
-        product_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Get the product data with image paths (uses products.json for correct mapping)
-        products = self.get_products()
         
-        found = False
-        for p in products:
-            if p["db_product_id"] == product_id:
-                found = True
-                # Copy each available angle image
-                for angle in ["front", "side", "back"]:
-                    src_path_str = p.get("images", {}).get(angle)
-                    if src_path_str:
-                        src_path = Path(src_path_str)
-                        if src_path.exists():
-                            dest = product_dir / f"{angle}.jpg"
-                            try:
-                                shutil.copy2(src_path, dest)
-                                print(f"   ✓ Copied {angle} image for product {product_id} ({p.get('title', '')[:30]})")
-                            except Exception as e:
-                                print(f"   ⚠️ Failed to copy {angle} image: {e}")
-                        else:
-                            print(f"   ⚠️ Source image not found for {angle}: {src_path}")
-                    else:
-                        print(f"   ℹ️ No {angle} image available for product {product_id}")
-                break
-        
-        if not found:
-            print(f"   ⚠️ Product {product_id} not found in products.json - cannot copy images")
+        # Get the product's image paths (uses products.json for correct mapping)
+        indexed = self.get_product(product_id)
+        if not indexed:
+            print(f"   ⚠️ Product {product_id} not found in products.json - cannot save images")
+            return
+        
+        _get_liked_photo_executor().submit(
+            materialize_liked_photos,
+            self.liked_photos_dir / f"product_{product_id}",
+            dict(indexed.get("images", {})),
+            f"product {product_id} ({indexed.get('title', '')[:30]})"
+        )
     
     def get_liked_products(self) -> List[Dict]:
         """
@@ -242,7 +606,7 @@ class SwipingSystem:
         
         # Get liked products from database
         liked_records = self.db.query(LikedProduct).filter(
-            LikedProduct.user_id == self.user.id
+            LikedProduct.user_id == self.user_id
         ).all()
         
         for liked_record in liked_records:
@@ -272,18 +636,16 @@ class SwipingSystem:
             
             # Also check combined_images as fallback
             if not any(images.values()):
-                all_products = self.get_products()
-                for p in all_products:
-                    if p["db_product_id"] == product.id:
-                        # Use combined images as fallback
-                        for angle in ["front", "side", "back"]:
-                            if p.get("images", {}).get(angle):
-                                # Extract relative path from full path
-                                full_path = p["images"][angle]
-                                if self.user_folder in full_path:
-                                    images[angle] = full_path.split(f"{self.user_folder}/")[-1]
-                                    images[angle] = f"{self.user_folder}/{images[angle]}"
-                        break
+                p = self.get_product(product.id)
+                if p:
+                    # Use combined images as fallback
+                    for angle in ["front", "side", "back"]:
+                        if p.get("images", {}).get(angle):
+                            # Extract relative path from full path
+                            full_path = p["images"][angle]
+                            if self.user_folder in full_path:
+                                images[angle] = full_path.split(f"{self.user_folder}/")[-1]
+                                images[angle] = f"{self.user_folder}/{images[angle]}"
             
             liked_products.append({
                 "product_id": product.id,
@@ -304,40 +666,46 @@ class SwipingSystem:
     
     def get_swipe_status(self) -> Dict:
         """Get current swiping status."""
-        products = self.get_products()
-        
-        total_swipes = self.db.query(Swipe).filter(Swipe.user_id == self.user.id).count()
-        liked_count = self.db.query(Swipe).filter(
-            and_(Swipe.user_id == self.user.id, Swipe.liked == True)
-        ).count()
-        disliked_count = self.db.query(Swipe).filter(
-            and_(Swipe.user_id == self.user.id, Swipe.liked == False)
-        ).count()
+        total_products = self.get_product_count()
+        liked_count, disliked_count = self.get_swipe_counts()
+        total_swipes = liked_count + disliked_count
         
         return {
-            "total_products": len(products),
+            "total_products": total_products,
             "swiped": total_swipes,
             "liked_count": liked_count,
             "disliked_count": disliked_count,
-            "remaining": len(products) - total_swipes,
-            "completed": total_swipes >= len(products),
+            "remaining": total_products - total_swipes,
+            "completed": total_swipes >= total_products,
             "current_index": total_swipes
         }
     
     def reset_swipes(self):
         """Reset all swipe data for this user."""
+        # Take the user's swipes and likes back out of the metric counters
+        deltas = {}
+        liked_count, disliked_count = self.get_swipe_counts()
+        add_delta(deltas, SWIPES, swipe_label(True), -liked_count)
+        add_delta(deltas, SWIPES, swipe_label(False), -disliked_count)
+        likes_by_type = self.db.query(
+            Product.product_type, func.count(LikedProduct.id)
+        ).join(LikedProduct, Product.id == LikedProduct.product_id
+        ).filter(LikedProduct.user_id == self.user_id).group_by(Product.product_type).all()
+        for product_type, count in likes_by_type:
+            add_delta(deltas, LIKED_PRODUCTS_BY_TYPE, label_for(product_type), -count)
+        
         # Delete swipes
-        self.db.query(Swipe).filter(Swipe.user_id == self.user.id).delete()
+        self.db.query(Swipe).filter(Swipe.user_id == self.user_id).delete()
         
         # Delete liked products
-        self.db.query(LikedProduct).filter(LikedProduct.user_id == self.user.id).delete()
+        self.db.query(LikedProduct).filter(LikedProduct.user_id == self.user_id).delete()
         
+        increment_counters(self.db, deltas)
         self.db.commit()
         
         # Clear liked photos folder
         if self.liked_photos_dir.exists():
             shutil.rmtree(self.liked_photos_dir)
-            self.liked_photos_dir.mkdir(parents=True, exist_ok=True)
         
         return {"success": True, "message": "Swipe data reset"}
     
@@ -348,7 +716,7 @@ class SwipingSystem:
         # Get already swiped product IDs
         swiped_product_ids = {
             swipe.product_id 
-            for swipe in self.db.query(Swipe).filter(Swipe.user_id == self.user.id).all()
+            for swipe in self.db.query(Swipe).filter(Swipe.user_id == self.user_id).all()
         }
         
         # Find first unswiped product
@@ -0,0 +1,98 @@
+"""
+Shared fixtures: a fresh database and images directory for every test.
+
+Tests run against a temporary SQLite file. Set TEST_DATABASE_URL to a scratch
+PostgreSQL database to run them there instead; its tables are dropped.
+
+Usage (from project root):
+    python -m pytest
+"""
+
+import json
+import os
+import tempfile
+
+import pytest
+
+_tmp_dir = tempfile.mkdtemp(prefix="styleswipe-tests-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}")
+os.environ["JOB_RUNNER"] = "inline"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend import main, swiping_system  # noqa: E402
+from backend.database import Base, SessionLocal, engine  # noqa: E402
+from backend.image_serving import image_stat_cache  # noqa: E402
+from backend.metric_counters import rebuild_metric_counters  # noqa: E402
+from backend.models import Product, User  # noqa: E402
+from backend.user_resolver import user_resolver  # noqa: E402
+
+USER_FOLDER = "user_test"
+PRODUCT_TYPES = ["tops", "bottoms"]
+
+
+@pytest.fixture
+def images_dir(tmp_path, monkeypatch):
+    """Point the API and SwipingSystem at a temporary data/user_images."""
+    images = tmp_path / "data" / "user_images"
+    images.mkdir(parents=True)
+    monkeypatch.setattr(main, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(main, "IMAGES_DIR", images)
+    monkeypatch.setattr(swiping_system, "USER_IMAGES_DIR", images)
+    return images
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, with the in-process caches cleared."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    for cache in (user_resolver, swiping_system.product_index_cache, image_stat_cache):
+        cache.entries.clear()
+    session = SessionLocal()
+    yield session
+    session.close()
+    # Let background liked-photo links finish before the directory goes away
+    swiping_system.shutdown_liked_photo_executor()
+
+
+@pytest.fixture
+def client(db, images_dir):
+    """TestClient without the startup hooks (the db fixture already created the tables)."""
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def user_products(db, images_dir):
+    """
+    Create USER_FOLDER with products.json and combined images for four products.
+
+    Returns:
+        The products' database ids, in products.json order
+    """
+    products = [
+        Product(
+            product_id=f"test{i}",
+            title=f"Product {i}",
+            product_link=f"https://example.com/{i}",
+            product_type=PRODUCT_TYPES[i % len(PRODUCT_TYPES)],
+        )
+        for i in range(4)
+    ]
+    db.add_all(products)
+    db.add(User(user_folder=USER_FOLDER))
+    db.commit()
+    # Rows added directly skip the counters; start them from a full count
+    rebuild_metric_counters(db)
+
+    user_path = images_dir / USER_FOLDER
+    (user_path / "products").mkdir(parents=True)
+    (user_path / "combined_images").mkdir()
+    with open(user_path / "products" / "products.json", "w") as f:
+        json.dump([{"db_product_id": p.id, "title": p.title} for p in products], f)
+    for index in range(1, len(products) + 1):
+        for angle in ("front", "side", "back"):
+            (user_path / "combined_images" / f"product_{index}_{angle}.jpg").write_bytes(
+                f"{index}-{angle}".encode()
+            )
+    return [p.id for p in products]
@@ -0,0 +1,146 @@
+"""Tests for GET /api/image: content ETags, conditional requests and byte ranges."""
+
+import os
+
+import pytest
+
+from backend.image_serving import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, parse_range
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def image(images_dir):
+    """A file under the images directory, and its /api/image URL."""
+    path = images_dir / "user_test" / "combined_images" / "product_1_front.jpg"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(CONTENT)
+    return path, "/api/image/user_test/combined_images/product_1_front.jpg"
+
+
+def test_full_response_has_validators(client, image):
+    _, url = image
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    assert "last-modified" in response.headers
+    # The data/user_images/ prefix is optional
+    assert client.get(url.replace("/api/image/", "/api/image/data/user_images/")).headers["etag"] == response.headers["etag"]
+
+
+def test_matching_etag_gets_304(client, image):
+    _, url = image
+    etag = client.get(url).headers["etag"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get(url, headers={"If-None-Match": header})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since_gets_304(client, image):
+    _, url = image
+    last_modified = client.get(url).headers["last-modified"]
+
+    assert client.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"}).status_code == 200
+    # If-None-Match takes precedence
+    response = client.get(url, headers={"If-Modified-Since": last_modified, "If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_etag_follows_content_not_timestamps(client, image):
+    path, url = image
+    etag = client.get(url).headers["etag"]
+
+    # Same content touched: same ETag
+    os.utime(path, (1, 1))
+    assert client.get(url).headers["etag"] == etag
+
+    # Hardlinked copies (as the try-on cache makes) share it too
+    link = path.with_name("product_2_front.jpg")
+    os.link(path, link)
+    assert client.get(url.replace("product_1", "product_2")).headers["etag"] == etag
+
+    # New content with the same size and mtime: new ETag
+    stat = path.stat()
+    path.write_bytes(CONTENT[::-1])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    response = client.get(url)
+    assert response.content == CONTENT[::-1]
+    assert response.headers["etag"] != etag
+
+
+def test_versioned_url_is_immutable(client, image):
+    _, url = image
+    version = client.get(url).headers["etag"].strip('"')
+
+    assert client.get(f"{url}?v={version}").headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert client.get(f"{url}?v=stale").headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=10000-", 10000, 10239),
+    ("bytes=-40", 10200, 10239),
+    ("bytes=10200-99999", 10200, 10239),
+])
+def test_range_gets_206(client, image, range_header, start, end):
+    _, url = image
+    response = client.get(url, headers={"Range": range_header})
+
+    assert response.status_code == 206
+    assert response.content == CONTENT[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+@pytest.mark.parametrize("range_header", ["bytes=10240-", "bytes=-0"])
+def test_unsatisfiable_range_gets_416(client, image, range_header):
+    _, url = image
+    response = client.get(url, headers={"Range": range_header})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+@pytest.mark.parametrize("range_header", ["items=0-9", "bytes=0-9,20-29", "bytes=9-0", "bytes=abc"])
+def test_unsupported_range_gets_full_file(client, image, range_header):
+    _, url = image
+    response = client.get(url, headers={"Range": range_header})
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_range_only_applies_to_the_current_version(client, image):
+    _, url = image
+    etag = client.get(url).headers["etag"]
+
+    assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_missing_and_escaping_paths_get_404(client, image):
+    _, url = image
+
+    assert client.get(url.replace("product_1", "product_9")).status_code == 404
+    assert client.get("/api/image/user_test/combined_images").status_code == 404
+    assert client.get("/api/image/..%2F..%2Fetc%2Fpasswd").status_code == 404
+
+
+def test_parse_range():
+    assert parse_range("bytes=5-", 10) == (5, 9)
+    assert parse_range("bytes=-20", 10) == (0, 9)
+    assert parse_range("bytes=", 10) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=10-", 10)
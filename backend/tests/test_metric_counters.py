@@ -0,0 +1,76 @@
+"""Tests that the incrementally maintained metric_counters match a full recount."""
+
+from backend.metric_counters import compute_metric_counters, read_counters
+from backend.search_products import bulk_upsert_catalog_products
+from conftest import USER_FOLDER
+
+SWIPE_URL = f"/api/swipe/{USER_FOLDER}"
+
+
+def assert_counters_match(db):
+    """metric_counters equals compute_metric_counters, ignoring counters that are zero."""
+    db.expire_all()
+    stored = {
+        (metric, label): value
+        for metric, labels in read_counters(db).items()
+        for label, value in labels.items()
+        if value
+    }
+    computed = {key: value for key, value in compute_metric_counters(db).items() if value}
+    assert stored == computed
+
+
+def test_counters_after_swipe_and_flip(client, db, user_products):
+    product = user_products[0]
+    client.post(f"{SWIPE_URL}/action", json={"product_id": product, "liked": True})
+    assert_counters_match(db)
+
+    client.post(f"{SWIPE_URL}/action", json={"product_id": product, "liked": False})
+    assert_counters_match(db)
+
+    client.post(f"{SWIPE_URL}/action", json={"product_id": product, "liked": False})  # Repeat: no change
+    assert_counters_match(db)
+    assert read_counters(db)["swipes"] == {"liked": 0, "disliked": 1}
+
+
+def test_counters_after_batch_and_retry(client, db, user_products):
+    client.post(f"{SWIPE_URL}/action", json={"product_id": user_products[0], "liked": False})
+    batch = {"batch_id": "b1", "swipes": [
+        {"product_id": user_products[0], "liked": True},  # Flips the earlier swipe
+        {"product_id": user_products[1], "liked": True},
+        {"product_id": user_products[2], "liked": False},
+        {"product_id": user_products[1], "liked": False},
+    ]}
+    client.post(f"{SWIPE_URL}/batch", json=batch)
+    assert_counters_match(db)
+
+    client.post(f"{SWIPE_URL}/batch", json=batch)
+    assert_counters_match(db)
+
+
+def test_counters_after_reset(client, db, user_products):
+    client.post(f"{SWIPE_URL}/batch", json={"batch_id": "b1", "swipes": [
+        {"product_id": product, "liked": index % 2 == 0} for index, product in enumerate(user_products)
+    ]})
+    client.post("/api/swipe/other_user/action", json={"product_id": user_products[0], "liked": True})
+
+    client.post(f"{SWIPE_URL}/reset")
+    assert_counters_match(db)
+    assert read_counters(db)["swipes"] == {"liked": 1, "disliked": 0}
+
+
+def test_counters_after_catalog_upsert(db, user_products):
+    bulk_upsert_catalog_products(db, [
+        {"product_id": "test0", "title": "Product 0", "product_link": "https://example.com/0", "product_type": "outerwear"},
+        {"product_id": "new0", "title": "New 0", "product_link": "https://example.com/n0", "product_type": "tops"},
+        {"product_id": "new1", "title": "New 1", "product_link": "https://example.com/n1"},
+    ])
+    db.commit()
+    assert_counters_match(db)
+
+    bulk_upsert_catalog_products(db, [
+        {"product_id": "new0", "title": "New 0", "product_link": "https://example.com/n0", "product_type": "tops"},
+        {"product_id": "new1", "title": "New 1", "product_link": "https://example.com/n1", "product_type": "bottoms"},
+    ])
+    db.commit()
+    assert_counters_match(db)
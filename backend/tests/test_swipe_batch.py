@@ -0,0 +1,109 @@
+"""Tests for POST /api/swipe/{user_folder}/batch: idempotency and client timestamps."""
+
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.models import LikedProduct, Swipe, SwipeBatch
+from backend.swiping_system import SwipingSystem
+from conftest import USER_FOLDER
+
+BATCH_URL = f"/api/swipe/{USER_FOLDER}/batch"
+
+
+def _utc(value: datetime) -> datetime:
+    """Compare stored datetimes the same way on SQLite (naive) and PostgreSQL (aware)."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _swipes(db):
+    return {swipe.product_id: swipe for swipe in db.query(Swipe).all()}
+
+
+def test_batch_applies_swipes_in_order(client, db, user_products):
+    first, second = user_products[:2]
+    response = client.post(BATCH_URL, json={"batch_id": "b1", "swipes": [
+        {"product_id": first, "liked": True},
+        {"product_id": second, "liked": True},
+        {"product_id": first, "liked": False},  # Overrides the earlier like
+        {"product_id": 999999, "liked": True},
+    ]})
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["applied"] == 3
+    assert result["rejected"] == [999999]
+    assert (result["total_liked"], result["total_disliked"], result["remaining"]) == (1, 1, 2)
+    assert result["duplicate"] is False
+    swipes = _swipes(db)
+    assert (swipes[first].liked, swipes[second].liked) == (False, True)
+    # The earlier like of `first` still records a liked product, like two single swipes would
+    assert db.query(LikedProduct).count() == 2
+
+
+def test_retried_batch_is_not_applied_again(client, db, user_products):
+    product = user_products[0]
+    batch = {"batch_id": "b1", "swipes": [{"product_id": product, "liked": True}]}
+    first = client.post(BATCH_URL, json=batch).json()
+
+    # A later swipe changes direction; replaying the old batch must not undo it
+    client.post(f"/api/swipe/{USER_FOLDER}/action", json={"product_id": product, "liked": False})
+    retry = client.post(BATCH_URL, json=batch)
+
+    assert retry.status_code == 200
+    assert retry.json() == {**first, "duplicate": True}
+    db.expire_all()
+    assert _swipes(db)[product].liked is False
+    assert db.query(SwipeBatch).count() == 1
+
+
+def test_batch_ids_are_scoped_per_user(client, db, user_products):
+    batch = {"batch_id": "shared", "swipes": [{"product_id": user_products[0], "liked": True}]}
+    client.post(BATCH_URL, json=batch)
+    response = client.post("/api/swipe/other_user/batch", json=batch)
+
+    assert response.json()["duplicate"] is False
+    assert db.query(Swipe).count() == 2
+
+
+def test_client_timestamps_are_kept_but_never_in_the_future(client, db, user_products):
+    past, future = user_products[:2]
+    past_timestamp = time.time() - 3600
+    before = datetime.now(timezone.utc)
+    client.post(BATCH_URL, json={"batch_id": "b1", "swipes": [
+        {"product_id": past, "liked": True, "client_timestamp": past_timestamp},
+        {"product_id": future, "liked": True, "client_timestamp": time.time() + 86400},
+    ]})
+
+    swipes = _swipes(db)
+    assert abs(_utc(swipes[past].created_at).timestamp() - past_timestamp) < 1
+    assert before <= _utc(swipes[future].created_at) <= datetime.now(timezone.utc)
+
+
+@pytest.mark.parametrize("client_timestamp", [-1, 1e12, 1e20])
+def test_out_of_range_timestamps_are_rejected(client, db, user_products, client_timestamp):
+    response = client.post(BATCH_URL, json={"batch_id": "b1", "swipes": [
+        {"product_id": user_products[0], "liked": True, "client_timestamp": client_timestamp},
+    ]})
+
+    assert response.status_code == 422
+    assert db.query(Swipe).count() == 0
+
+
+@pytest.mark.parametrize("literal", ["NaN", "Infinity"])
+def test_non_finite_timestamps_are_rejected(client, db, user_products, literal):
+    body = f'{{"batch_id": "b1", "swipes": [{{"product_id": {user_products[0]}, "liked": true, "client_timestamp": {literal}}}]}}'
+    response = client.post(BATCH_URL, content=body, headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 422
+    assert db.query(Swipe).count() == 0
+
+
+def test_unrepresentable_timestamp_falls_back_to_server_time(db, images_dir, user_products):
+    before = datetime.now(timezone.utc)
+    SwipingSystem(USER_FOLDER, db).swipe_batch("b1", [
+        {"product_id": user_products[0], "liked": True, "client_timestamp": 1e20},
+    ])
+
+    assert before <= _utc(_swipes(db)[user_products[0]].created_at) <= datetime.now(timezone.utc)
@@ -0,0 +1,123 @@
+"""Tests for POST /upload-images: validation before anything is stored."""
+
+import io
+
+import pytest
+from PIL import Image
+
+from backend import upload_processing
+from backend.models import UserImage
+from backend.upload_processing import UploadSizeLimitMiddleware
+from conftest import USER_FOLDER
+
+ANGLES = ("front", "side", "back")
+
+
+def encode(img: Image.Image, quality=90) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def jpeg(color, size=(60, 90)) -> bytes:
+    """A solid-color JPEG (every solid image has the same perceptual hash)."""
+    return encode(Image.new("RGB", size, color))
+
+
+def upload(client, images, **kwargs):
+    """Post one photo per angle (a dict of angle -> bytes) for USER_FOLDER."""
+    files = {angle: (f"{angle}.jpg", data, "image/jpeg") for angle, data in images.items()}
+    return client.post("/upload-images", files=files, data={"user_id": USER_FOLDER}, **kwargs)
+
+
+def photos():
+    return {"front": jpeg("red"), "side": jpeg("green"), "back": jpeg("blue")}
+
+
+def test_upload_stores_three_photos(client, db, images_dir):
+    response = upload(client, photos())
+
+    assert response.status_code == 200
+    assert sorted(response.json()["saved_files"]) == sorted(ANGLES)
+    assert db.query(UserImage).count() == 3
+    for angle in ANGLES:
+        with Image.open(images_dir / USER_FOLDER / f"{angle}.jpg") as img:
+            assert img.format == "JPEG"
+
+
+@pytest.mark.parametrize("data, status_code", [
+    (b"", 400),
+    (b"not an image at all", 415),
+    (b"\x89PNG\r\n\x1a\n" + b"\x00" * 32, 415),  # PNG signature, unreadable body
+])
+def test_invalid_files_are_rejected(client, db, images_dir, data, status_code):
+    response = upload(client, {**photos(), "side": data})
+
+    assert response.status_code == status_code
+    assert "side" in response.json()["error"]
+    assert db.query(UserImage).count() == 0
+    assert not (images_dir / USER_FOLDER).exists()
+
+
+def test_oversized_file_is_rejected(client, db, images_dir, monkeypatch):
+    monkeypatch.setattr(upload_processing, "UPLOAD_MAX_IMAGE_BYTES", 512)
+    response = upload(client, {**photos(), "back": jpeg("blue", size=(400, 600))})
+
+    assert response.status_code == 413
+    assert db.query(UserImage).count() == 0
+
+
+def test_too_many_pixels_is_rejected(client, db, images_dir, monkeypatch):
+    monkeypatch.setattr(upload_processing, "UPLOAD_MAX_PIXELS", 100 * 100)
+    response = upload(client, {**photos(), "front": jpeg("red", size=(200, 300))})
+
+    assert response.status_code == 413
+    assert db.query(UserImage).count() == 0
+
+
+def test_oversized_request_is_rejected_with_cors_headers(client, db, images_dir, monkeypatch):
+    # Shrink the request limit in the app's real middleware stack
+    for middleware in client.app.user_middleware:
+        if middleware.cls is UploadSizeLimitMiddleware:
+            monkeypatch.setitem(middleware.options, "max_bytes", 1024)
+    monkeypatch.setattr(client.app, "middleware_stack", None)
+
+    response = upload(client, photos(), headers={"Origin": "http://localhost:3000"})
+
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] in ("*", "http://localhost:3000")
+    assert db.query(UserImage).count() == 0
+
+
+def test_reuploading_the_same_photos_keeps_the_stored_ones(client, db, images_dir):
+    images = photos()
+    upload(client, images)
+    stored = {angle: (images_dir / USER_FOLDER / f"{angle}.jpg").stat() for angle in ANGLES}
+
+    response = upload(client, images)
+
+    assert response.status_code == 200
+    assert sorted(response.json()["unchanged"]) == sorted(ANGLES)
+    assert db.query(UserImage).count() == 3
+    for angle in ANGLES:
+        current = (images_dir / USER_FOLDER / f"{angle}.jpg").stat()
+        assert (current.st_ino, current.st_mtime_ns) == (stored[angle].st_ino, stored[angle].st_mtime_ns)
+
+
+def test_new_photo_is_stored_and_similar_one_is_reported(client, db, images_dir):
+    gradient = Image.linear_gradient("L").rotate(90).resize((60, 90)).convert("RGB")
+    upload(client, {**photos(), "front": encode(gradient, quality=95)})
+
+    # front: re-encoded at another quality (different bytes, same perceptual hash);
+    # back: the mirror image (a different hash from the solid blue photo)
+    response = upload(client, {
+        **photos(),
+        "front": encode(gradient, quality=50),
+        "back": encode(gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)),
+    })
+
+    result = response.json()
+    assert response.status_code == 200
+    assert result["unchanged"] == ["side"]
+    assert result["similar"] == ["front"]
+    assert sorted(image.angle for image in db.query(UserImage)) == ["back", "back", "front", "front", "side"]
@@ -0,0 +1,156 @@
+"""
+Stage timing for the search, download and generation pipeline.
+
+`with span("download.fetch", url=url):` times a block and records it in the
+styleswipe_stage_duration_seconds histogram. When TRACE_FILE is set, every
+span is also appended to that file as one OTLP/JSON line (the format read by
+the OpenTelemetry Collector's otlpjsonfile receiver), with parent/child links
+between nested spans.
+
+Jobs run in worker processes whose registry is never scraped, so workers
+buffer their observations and the job runner replays them in the API process
+(see start_buffering / drain_buffered / record_observations).
+"""
+
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from backend.metrics import styleswipe_stage_duration_seconds
+except ImportError:
+    from metrics import styleswipe_stage_duration_seconds
+
+# Tracing configuration
+TRACE_FILE = os.getenv("TRACE_FILE")  # Unset disables the trace file
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "styleswipe")
+
+# OTLP enum values
+_SPAN_KIND_INTERNAL = 1
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+# (trace_id, span_id) of the innermost open span
+_current_span: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("current_span", default=None)
+
+_trace_file_lock = threading.Lock()
+
+# (stage, status, seconds) observations waiting to be sent to the API process
+_buffer: Optional[List[Tuple[str, str, float]]] = None
+_buffer_lock = threading.Lock()
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _write_span(record: Dict):
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({
+                "service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid()
+            })},
+            "scopeSpans": [{"scope": {"name": "styleswipe.tracing"}, "spans": [record]}]
+        }]
+    })
+    try:
+        with _trace_file_lock, open(TRACE_FILE, "a") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"   ⚠️ Could not write trace file {TRACE_FILE}: {e}")
+
+
+def observe_stage(stage: str, status: str, seconds: float):
+    """Record one stage duration (buffered instead in job worker processes)."""
+    styleswipe_stage_duration_seconds.labels(stage=stage, status=status).observe(seconds)
+    if _buffer is not None:
+        with _buffer_lock:
+            _buffer.append((stage, status, seconds))
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Time a pipeline stage.
+
+    Args:
+        stage: Stage name, e.g. "search.serpapi" (the histogram's stage label)
+        **attributes: Extra details for the trace file (URL, product index, ...)
+
+    Yields:
+        The attributes dict, so the block can add details it learns later
+    """
+    parent = _current_span.get()
+    trace_id = parent[0] if parent else secrets.token_hex(16)
+    span_id = secrets.token_hex(8)
+    token = _current_span.set((trace_id, span_id))
+    start_ns = time.time_ns()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        observe_stage(stage, "error" if error else "ok", duration)
+        if TRACE_FILE:
+            status = {"code": _STATUS_OK}
+            if error is not None:
+                status = {"code": _STATUS_ERROR, "message": f"{type(error).__name__}: {error}"}
+            _write_span({
+                "traceId": trace_id,
+                "spanId": span_id,
+                "parentSpanId": parent[1] if parent else "",
+                "name": stage,
+                "kind": _SPAN_KIND_INTERNAL,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(start_ns + int(duration * 1e9)),
+                "attributes": _otlp_attributes(attributes),
+                "status": status,
+            })
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn to run in a copy of the current context, so spans it opens on a pool thread nest under ours."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def start_buffering():
+    """Buffer observations for drain_buffered() (call in job worker processes)."""
+    global _buffer
+    _buffer = []
+
+
+def drain_buffered() -> List[Tuple[str, str, float]]:
+    """Return and clear the buffered observations (empty when not buffering)."""
+    if _buffer is None:
+        return []
+    with _buffer_lock:
+        observations = list(_buffer)
+        _buffer.clear()
+    return observations
+
+
+def record_observations(observations: List[Tuple[str, str, float]]):
+    """Replay observations drained in a worker process into this process's histogram."""
+    for stage, status, seconds in observations:
+        styleswipe_stage_duration_seconds.labels(stage=stage, status=status).observe(seconds)
@@ -0,0 +1,315 @@
+"""
+Compression of uploaded user photos, off the event loop.
+
+The three angle photos of an upload are compressed in parallel on a thread
+pool (Pillow releases the GIL while resizing and encoding). At most
+UPLOAD_MAX_PENDING uploads are admitted at once; further uploads wait up to
+UPLOAD_QUEUE_TIMEOUT seconds for a slot and are then rejected, so a burst of
+uploads queues in bounded memory instead of piling up behind the pool.
+
+Uploads are never read into memory whole: Starlette spools each part to a
+temporary file (on disk above 1MB) and Pillow decodes straight from it.
+Size and format are checked from the spooled file (and the request's
+Content-Length) before any decoding. Decoding, resizing and encoding go
+through the shared image pipeline (image_pipeline.py) with UPLOAD_IMAGE_SETTINGS:
+photos are turned upright from their EXIF orientation and stored without
+metadata. An upload that normalizes to exactly the bytes already stored for
+that angle is a re-upload of the same photo: the stored file is left alone,
+and every try-on image for it keeps coming from the try-on cache. Each
+upload's perceptual hash (dHash) is recorded and compared with the previous
+photo's for reporting only, since different photos with the same pose and
+background often hash alike.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+try:
+    from backend.image_pipeline import ImageSettings, hash_distance, open_image, process_image
+    from backend.metrics import styleswipe_upload_rejections
+    from backend.tracing import span
+except ImportError:
+    from image_pipeline import ImageSettings, hash_distance, open_image, process_image
+    from metrics import styleswipe_upload_rejections
+    from tracing import span
+
+# Image compression settings
+MAX_IMAGE_SIZE = 1024  # Max dimension in pixels for user images
+IMAGE_QUALITY = 90  # JPEG quality (higher for user images since they're important)
+UPLOAD_IMAGE_SETTINGS = ImageSettings(max_size=MAX_IMAGE_SIZE, quality=IMAGE_QUALITY, exif_transpose=True)
+
+# Max perceptual hash distance (bits out of 64) at which an upload is reported as similar
+# to the stored photo; only byte-identical uploads are treated as duplicates
+UPLOAD_DUPLICATE_MAX_DISTANCE = int(os.getenv("UPLOAD_DUPLICATE_MAX_DISTANCE", "0"))
+
+# Upload pool configuration
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+UPLOAD_MAX_PENDING = int(os.getenv("UPLOAD_MAX_PENDING", str(UPLOAD_WORKERS * 2)))  # Uploads admitted at once
+UPLOAD_QUEUE_TIMEOUT = float(os.getenv("UPLOAD_QUEUE_TIMEOUT", "5"))  # Seconds to wait for a slot
+
+# Upload limits
+UPLOAD_MAX_IMAGE_BYTES = int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "64000000"))
+UPLOAD_MAX_REQUEST_BYTES = 3 * UPLOAD_MAX_IMAGE_BYTES + 64 * 1024  # Three photos plus form overhead
+
+# Leading bytes of the accepted image formats (WebP is checked separately)
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+]
+
+
+class UploadRejectedError(Exception):
+    """An uploaded file that fails validation; status_code is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """Identify an image format from its first bytes (16 is enough), or None if unsupported."""
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+def _source_size(source: BinaryIO) -> int:
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def _open_checked(source: Union[bytes, BinaryIO]) -> Image.Image:
+    """Open an image (header only), rejecting unreadable images and ones over UPLOAD_MAX_PIXELS."""
+    try:
+        img = open_image(source)
+    except Image.DecompressionBombError as e:
+        raise UploadRejectedError(str(e), 413)
+    except Image.UnidentifiedImageError:
+        raise UploadRejectedError("Could not read the image", 415)
+    if img.width * img.height > UPLOAD_MAX_PIXELS:
+        raise UploadRejectedError(
+            f"Image is {img.width}x{img.height}; the limit is {UPLOAD_MAX_PIXELS / 1e6:.0f} megapixels", 413
+        )
+    return img
+
+
+def validate_upload(source: BinaryIO, image_type: str) -> str:
+    """
+    Check an uploaded file's size, format and dimensions without decoding its pixels.
+
+    Args:
+        source: Spooled upload file
+        image_type: Angle name for error messages (e.g. "front")
+
+    Returns:
+        Sniffed image format, e.g. "JPEG"
+
+    Raises:
+        UploadRejectedError: Empty (400), too large (413) or not a supported image (415)
+    """
+    size = _source_size(source)
+    if size == 0:
+        raise UploadRejectedError(f"The {image_type} image is empty", 400)
+    if size > UPLOAD_MAX_IMAGE_BYTES:
+        raise UploadRejectedError(
+            f"The {image_type} image is {size / 1024 / 1024:.1f}MB; the limit is "
+            f"{UPLOAD_MAX_IMAGE_BYTES / 1024 / 1024:.0f}MB", 413
+        )
+    image_format = sniff_image_format(source.read(16))
+    source.seek(0)
+    if image_format is None:
+        raise UploadRejectedError(
+            f"The {image_type} image is not a supported format (JPEG, PNG, WebP, GIF, BMP or TIFF)", 415
+        )
+    try:
+        _open_checked(source)
+    except UploadRejectedError as e:
+        raise UploadRejectedError(f"The {image_type} image: {e}", e.status_code)
+    source.seek(0)
+    return image_format
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects upload requests whose Content-Length is over the limit, before the body is parsed."""
+
+    def __init__(self, app, path: str = "/upload-images", max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == self.path:
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > self.max_bytes:
+                response = JSONResponse(
+                    status_code=413,
+                    content={"error": f"Upload too large; the limit is {self.max_bytes / 1024 / 1024:.0f}MB"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def compress_image(
+    source: Union[bytes, BinaryIO],
+    save_path: Path,
+    max_size: int = MAX_IMAGE_SIZE,
+    quality: int = IMAGE_QUALITY,
+    previous_hash: Optional[str] = None
+) -> dict:
+    """
+    Compress an uploaded image using Pillow.
+
+    Args:
+        source: Raw image bytes, or a binary file (e.g. the spooled upload) to decode from
+        save_path: Path where to save the compressed image
+        max_size: Maximum dimension (width or height) in pixels
+        quality: JPEG quality 1-100
+        previous_hash: Perceptual hash of the photo already stored at save_path, if any
+
+    Returns:
+        Dict with compression stats, the perceptual hash and its distance to
+        previous_hash, whether it is similar to the stored photo, and whether it
+        is byte-identical to it (a duplicate, left untouched)
+
+    Raises:
+        UploadRejectedError: If the image has more than UPLOAD_MAX_PIXELS pixels (413) or can't be read (415)
+    """
+    original_size = len(source) if isinstance(source, (bytes, bytearray)) else _source_size(source)
+    settings = UPLOAD_IMAGE_SETTINGS
+    if (max_size, quality) != (settings.max_size, settings.quality):
+        settings = settings.replace(max_size=max_size, quality=quality)
+
+    # Open image with Pillow (reads the header only), then decode, resize and encode
+    processed = process_image(_open_checked(source), settings)
+
+    # Always save as .jpg for consistency
+    save_path = save_path.with_suffix('.jpg')
+    distance = hash_distance(processed.perceptual_hash, previous_hash) if previous_hash else None
+    duplicate = _same_bytes(save_path, processed.data)
+    if not duplicate:
+        processed.save(save_path)
+    compressed_size = len(processed.data)
+    reduction = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
+
+    return {
+        "path": save_path,
+        "original_size": original_size,
+        "compressed_size": compressed_size,
+        "reduction_percent": reduction,
+        "original_dimensions": processed.original_size,
+        "new_dimensions": processed.size,
+        "perceptual_hash": processed.perceptual_hash,
+        "hash_distance": distance,
+        "similar": distance is not None and distance <= UPLOAD_DUPLICATE_MAX_DISTANCE,
+        "duplicate": duplicate
+    }
+
+
+def _same_bytes(path: Path, data: bytes) -> bool:
+    """Whether the file at path holds exactly data."""
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        return path.read_bytes() == data
+    except FileNotFoundError:
+        return False
+
+
+def _compress_traced(
+    image_type: str,
+    source: Union[bytes, BinaryIO],
+    save_path: Path,
+    previous_hash: Optional[str]
+) -> dict:
+    with span("upload.compress", angle=image_type):
+        return compress_image(source, save_path, previous_hash=previous_hash)
+
+
+class UploadBusyError(Exception):
+    """Raised when no upload slot frees up within the queue timeout."""
+
+
+class UploadCompressor:
+    """Admits a bounded number of uploads and compresses their images on a thread pool."""
+
+    def __init__(
+        self,
+        workers: int = UPLOAD_WORKERS,
+        max_pending: int = UPLOAD_MAX_PENDING,
+        queue_timeout: float = UPLOAD_QUEUE_TIMEOUT
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.queue_timeout = queue_timeout
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    async def acquire_slot(self):
+        """
+        Wait for an upload slot; release it with release_slot().
+
+        Raises:
+            UploadBusyError: If no slot frees up within queue_timeout seconds
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            styleswipe_upload_rejections.inc()
+            raise UploadBusyError("Too many uploads in progress, please retry shortly")
+
+    def release_slot(self):
+        self.slots.release()
+
+    async def compress_all(
+        self,
+        images: Dict[str, Tuple[Union[bytes, BinaryIO], Path]],
+        previous_hashes: Optional[Dict[str, str]] = None
+    ) -> Dict[str, dict]:
+        """
+        Compress several images in parallel without blocking the event loop.
+
+        Args:
+            images: image type (e.g. "front") -> (bytes or spooled upload file, save path)
+            previous_hashes: image type -> perceptual hash of the photo already stored for it
+
+        Returns:
+            image type -> compress_image stats, in the same order
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(
+                self.executor, _compress_traced, image_type, data, path, (previous_hashes or {}).get(image_type)
+            )
+            for image_type, (data, path) in images.items()
+        ))
+        return dict(zip(images, results))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+# Shared compressor instance
+upload_compressor = UploadCompressor()
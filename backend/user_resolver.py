@@ -0,0 +1,112 @@
+"""
+Cached resolution of user folder names to user IDs.
+
+Every swipe, click and preferences request identifies the user by folder
+name. Users are never renamed, so the folder -> id mapping is kept in a
+small LRU with a TTL and hot paths skip the User lookup entirely.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from fastapi import Depends
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+try:
+    from backend.database import get_db
+    from backend.metric_counters import USERS, increment_counters
+    from backend.models import User
+except ImportError:
+    from database import get_db
+    from metric_counters import USERS, increment_counters
+    from models import User
+
+# Cache configuration
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # Seconds
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+
+def folder_name(user_folder: str) -> str:
+    """Strip any leading path (e.g. "data/user_images/user_1") down to the folder name."""
+    return user_folder.split("/")[-1]
+
+
+class UserResolver:
+    """LRU of user_folder -> user id, with entries expiring after a TTL."""
+
+    def __init__(self, ttl: int = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_folder: str) -> Optional[int]:
+        with self.lock:
+            entry = self.entries.get(user_folder)
+            if entry is None:
+                return None
+            expires_at, user_id = entry
+            if expires_at < time.monotonic():
+                del self.entries[user_folder]
+                return None
+            self.entries.move_to_end(user_folder)
+            return user_id
+
+    def put(self, user_folder: str, user_id: int):
+        with self.lock:
+            self.entries[user_folder] = (time.monotonic() + self.ttl, user_id)
+            self.entries.move_to_end(user_folder)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_folder: str):
+        with self.lock:
+            self.entries.pop(user_folder, None)
+
+    def resolve(self, db: Session, user_folder: str, create: bool = False) -> Optional[int]:
+        """
+        Get the user id for a folder, from the cache or the database.
+
+        Args:
+            db: Database session
+            user_folder: User folder name (e.g., "user_1764460714")
+            create: Create the user if it doesn't exist yet
+
+        Returns:
+            User id, or None if the user doesn't exist and create is False
+        """
+        user_id = self.get(user_folder)
+        if user_id is not None:
+            return user_id
+
+        row = db.query(User.id).filter(User.user_folder == user_folder).first()
+        if row:
+            user_id = row.id
+        elif create:
+            user = User(user_folder=user_folder)
+            db.add(user)
+            try:
+                increment_counters(db, {(USERS, ""): 1})
+                db.commit()
+                user_id = user.id
+            except IntegrityError:
+                # Created concurrently by another request
+                db.rollback()
+                user_id = db.query(User.id).filter(User.user_folder == user_folder).scalar()
+        else:
+            return None
+
+        self.put(user_folder, user_id)
+        return user_id
+
+
+# Shared resolver instance
+user_resolver = UserResolver()
+
+
+def resolve_user_id(user_folder: str, db: Session = Depends(get_db)) -> int:
+    """FastAPI dependency: user id for the {user_folder} path parameter, creating the user if needed."""
+    return user_resolver.resolve(db, folder_name(user_folder), create=True)
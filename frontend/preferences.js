@@ -100,9 +100,10 @@ form.addEventListener('submit', async (e) => {
             // Store user folder in localStorage for the swipe page
             localStorage.setItem('userFolder', userFolder);
             
-            // Redirect to swipe page with loading screen
+            // Redirect to swipe page with loading screen (tracks the background job)
+            const jobParam = data.job_id ? `&job=${encodeURIComponent(data.job_id)}` : '';
             setTimeout(() => {
-                window.location.href = `swipe.html?user=${encodeURIComponent(userFolder)}&loading=true`;
+                window.location.href = `swipe.html?user=${encodeURIComponent(userFolder)}&loading=true${jobParam}`;
             }, 1000);
         } else {
             showMessage(data.error || 'Failed to save preferences', 'error');
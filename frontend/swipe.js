@@ -31,6 +31,15 @@ const btnLike = document.getElementById('btn-like');
 const btnDislike = document.getElementById('btn-dislike');
 const btnRestart = document.getElementById('btn-restart');
 
+// Swipe queue: swipes are sent in idempotent batches instead of one request per card
+const SWIPE_BATCH_SIZE = 10;
+const SWIPE_FLUSH_INTERVAL_MS = 5000;
+const SWIPE_BATCH_MAX_SERVER_ERRORS = 3;  // 5xx responses before a batch is given up on
+let swipeQueue = [];
+let pendingBatches = [];
+let failedBatches = [];  // Dead letters: batches the server rejected, kept for debugging
+let flushPromise = null;
+
 // Touch handling
 let startX = 0;
 let startY = 0;
@@ -51,12 +60,19 @@ async function init() {
         return;
     }
     
+    setupSwipeQueue();
+    
     // Check if we're coming from preferences (loading mode)
     const fromPreferences = urlParams.get('loading') === 'true';
     
     if (fromPreferences) {
         showLoadingScreen();
-        await simulateLoading();
+        const jobId = urlParams.get('job');
+        if (jobId) {
+            await waitForJob(jobId);
+        } else {
+            await simulateLoading();
+        }
     }
     
     // Load products
@@ -121,6 +137,73 @@ async function simulateLoading() {
     }
 }
 
+/**
+ * Show a loading step as active, with earlier steps completed
+ */
+function setLoadingStep(stepIndex, progress, statusText) {
+    const stepElements = document.querySelectorAll('.step');
+    
+    progressBar.style.width = `${progress}%`;
+    stepElements.forEach((el, index) => {
+        if (index < stepIndex) {
+            el.classList.remove('active');
+            el.classList.add('completed');
+        } else if (index === stepIndex) {
+            el.classList.add('active');
+            el.classList.remove('completed');
+        } else {
+            el.classList.remove('active', 'completed');
+        }
+    });
+    loadingStatus.textContent = statusText;
+}
+
+/**
+ * Poll the background search + generation job until it finishes
+ */
+async function waitForJob(jobId) {
+    const pollInterval = 2000;
+    
+    while (true) {
+        let job;
+        try {
+            const response = await fetch(`${API_BASE}/api/jobs/${jobId}`);
+            if (!response.ok) {
+                return;
+            }
+            job = await response.json();
+        } catch (error) {
+            console.error('Error polling job status:', error);
+            return;
+        }
+        
+        const stages = {};
+        (job.stages || []).forEach(stage => { stages[stage.name] = stage; });
+        const search = stages.search || {};
+        const generate = stages.generate || {};
+        
+        if (job.status === 'completed' || job.status === 'failed') {
+            setLoadingStep(3, 100, job.status === 'completed' ?
+                'All done! Get ready to swipe!' :
+                'Something went wrong, showing what we have...');
+            await new Promise(r => setTimeout(r, 1000));
+            return;
+        }
+        
+        if (generate.status === 'running') {
+            const fraction = generate.total ? generate.completed / generate.total : 0;
+            setLoadingStep(2, 50 + fraction * 50,
+                `Creating virtual try-on images... (${generate.completed || 0}/${generate.total || 0})`);
+        } else if (search.status === 'running') {
+            setLoadingStep(0, 25, 'Searching for products and downloading images...');
+        } else {
+            setLoadingStep(0, 5, 'Waiting to start...');
+        }
+        
+        await new Promise(r => setTimeout(r, pollInterval));
+    }
+}
+
 /**
  * Load products from API
  */
@@ -182,6 +265,9 @@ function showNoProducts() {
  * Show results screen
  */
 async function showResults() {
+    // Make sure every swipe is saved before loading likes
+    await flushSwipes();
+    
     loadingScreen.classList.add('hidden');
     swipeContainer.classList.add('hidden');
     resultsScreen.classList.remove('hidden');
@@ -302,10 +388,7 @@ function renderCards() {
     updateAngleIndicator();
     
     // Create card
-    const imagePath = currentProduct.images?.[currentAngle];
-    const imageUrl = imagePath ? 
-        `${API_BASE}/api/image/${userFolder.split('/').pop()}/${imagePath.split(userFolder.split('/').pop() + '/')[1]}` :
-        currentProduct.thumbnail || '';
+    const imageUrl = cardImageUrl(currentProduct, currentAngle);
     
     cardsContainer.innerHTML = `
         <div class="swipe-card" id="current-card">
@@ -321,6 +404,30 @@ function renderCards() {
     setupCardDrag();
 }
 
+/**
+ * Build the card image URL for a product angle, falling back to the thumbnail.
+ * The ?v= version lets the browser cache the image as immutable.
+ */
+function cardImageUrl(product, angle) {
+    const imagePath = product.images?.[angle];
+    if (!imagePath) {
+        return product.thumbnail || '';
+    }
+    const folder = userFolder.split('/').pop();
+    const params = new URLSearchParams();
+    const version = product.image_versions?.[angle];
+    if (version) {
+        params.set('v', version);
+    }
+    // Ask for a variant no wider than the card's device pixels
+    const cardWidth = cardsContainer?.clientWidth;
+    if (cardWidth) {
+        params.set('w', Math.round(cardWidth * (window.devicePixelRatio || 1)));
+    }
+    const query = params.toString();
+    return `${API_BASE}/api/image/${folder}/${imagePath.split(folder + '/')[1]}` + (query ? `?${query}` : '');
+}
+
 /**
  * Update angle indicator dots
  */
@@ -338,10 +445,7 @@ function cycleAngle() {
     currentAngle = angles[(currentIndex + 1) % angles.length];
     
     const currentProduct = products[currentProductIndex];
-    const imagePath = currentProduct.images?.[currentAngle];
-    const imageUrl = imagePath ? 
-        `${API_BASE}/api/image/${userFolder.split('/').pop()}/${imagePath.split(userFolder.split('/').pop() + '/')[1]}` :
-        currentProduct.thumbnail || '';
+    const imageUrl = cardImageUrl(currentProduct, currentAngle);
     
     const cardImg = document.querySelector('.swipe-card img');
     if (cardImg) {
@@ -474,19 +578,8 @@ async function swipeCard(direction) {
     // Animate out
     card.classList.add(liked ? 'fly-right' : 'fly-left');
     
-    // Record swipe
-    try {
-        await fetch(`${API_BASE}/api/swipe/${userFolder}/action`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                product_id: currentProduct.product_id,
-                liked: liked
-            })
-        });
-    } catch (error) {
-        console.error('Error recording swipe:', error);
-    }
+    // Record swipe (sent with the next batch)
+    queueSwipe(currentProduct.product_id, liked);
     
     // Move to next
     setTimeout(() => {
@@ -496,6 +589,115 @@ async function swipeCard(direction) {
     }, 400);
 }
 
+/**
+ * Flush queued swipes on an interval and when the page is hidden or closed
+ */
+function setupSwipeQueue() {
+    setInterval(() => flushSwipes(), SWIPE_FLUSH_INTERVAL_MS);
+    window.addEventListener('pagehide', () => flushSwipes(true));
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') {
+            flushSwipes(true);
+        }
+    });
+}
+
+/**
+ * Add a swipe to the queue, flushing once a full batch is ready
+ */
+function queueSwipe(productId, liked) {
+    swipeQueue.push({
+        product_id: productId,
+        liked: liked,
+        client_timestamp: Date.now() / 1000
+    });
+    
+    if (swipeQueue.length >= SWIPE_BATCH_SIZE) {
+        flushSwipes();
+    }
+}
+
+function createBatchId() {
+    if (window.crypto?.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+/**
+ * Send queued swipes. Batches are sent in order; a failed batch keeps its
+ * batch_id and is retried on the next flush, so the server never applies it twice.
+ * Batches the server rejects (4xx) or that keep failing (5xx) are moved to
+ * failedBatches so they never hold up later swipes.
+ * With keepalive (page hide/unload) everything is sent without waiting.
+ */
+function flushSwipes(keepalive = false) {
+    if (swipeQueue.length > 0) {
+        pendingBatches.push({ batch_id: createBatchId(), swipes: swipeQueue });
+        swipeQueue = [];
+    }
+    
+    if (keepalive) {
+        pendingBatches.forEach(batch => {
+            sendSwipeBatch(batch, true)
+                .then(() => { pendingBatches = pendingBatches.filter(b => b !== batch); })
+                .catch(error => console.error('Error recording swipes:', error));
+        });
+        return Promise.resolve();
+    }
+    
+    if (!flushPromise) {
+        flushPromise = sendPendingBatches().finally(() => { flushPromise = null; });
+    }
+    return flushPromise;
+}
+
+async function sendPendingBatches() {
+    while (pendingBatches.length > 0) {
+        const batch = pendingBatches[0];
+        try {
+            await sendSwipeBatch(batch, false);
+        } catch (error) {
+            console.error('Error recording swipes:', error);
+            if (!shouldDropBatch(batch, error.status)) {
+                return;  // Network error or a 5xx with retries left: retry on the next flush
+            }
+            failedBatches.push(batch);
+        }
+        pendingBatches = pendingBatches.filter(b => b !== batch);
+    }
+}
+
+/**
+ * Whether a failed batch should be given up on: the server rejected it (4xx other
+ * than timeouts and rate limits), or it has failed with a 5xx too many times.
+ */
+function shouldDropBatch(batch, status) {
+    if (status === undefined || status === 408 || status === 429) {
+        return false;
+    }
+    if (status < 500) {
+        return true;
+    }
+    batch.serverErrors = (batch.serverErrors || 0) + 1;
+    return batch.serverErrors >= SWIPE_BATCH_MAX_SERVER_ERRORS;
+}
+
+async function sendSwipeBatch(batch, keepalive) {
+    const response = await fetch(`${API_BASE}/api/swipe/${userFolder}/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ batch_id: batch.batch_id, swipes: batch.swipes }),
+        keepalive: keepalive
+    });
+    if (!response.ok) {
+        const error = new Error(`Batch ${batch.batch_id} failed with status ${response.status}`);
+        error.status = response.status;
+        throw error;
+    }
+    return response.json();
+}
+
 /**
  * Setup event listeners
  */
@@ -510,6 +712,9 @@ function setupEventListeners() {
  */
 async function resetAndRestart() {
     try {
+        // Save queued swipes first so they can't land after the reset
+        await flushSwipes();
+        
         await fetch(`${API_BASE}/api/swipe/${userFolder}/reset`, {
             method: 'POST'
         });